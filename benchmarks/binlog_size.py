@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compare the size and speed of a text log and a binary log.
+
+Usage::
+
+  PYTHONPATH=. python benchmarks/binlog_size.py [--records N]
+
+This logs N records of typical command output through a file handler and
+through a scriptharness.binlog.BinaryLogHandler, then prints the bytes per
+record and records/sec for each, and how long an ERROR query of the
+binary log takes.
+"""
+from __future__ import absolute_import, division, print_function, \
+                       unicode_literals
+import argparse
+import logging
+import os
+from scriptharness.binlog import INDEX_SUFFIX, get_binary_handler, \
+    iter_records
+from scriptharness.log import get_file_handler
+import shutil
+import sys
+import tempfile
+from timeit import default_timer
+
+
+def time_records(handler, num_records):
+    """Time logging num_records records through a handler.
+
+    Args:
+      handler (logging.Handler): the handler to log through.
+      num_records (int): how many records to log.
+
+    Returns:
+      float: the elapsed time, in seconds.
+    """
+    logger = logging.getLogger("benchmark")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    try:
+        start = default_timer()
+        for num in range(num_records):
+            logger.info(" %s:%d: warning: unused variable '%s'",
+                        "src/foo.c", num, "bar")
+            if num % 10000 == 0:
+                logger.error("%s: error %d", "src/foo.c", num)
+        handler.flush()
+        return default_timer() - start
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+
+
+def main(cmdln_args=None):
+    """Run the benchmark.
+
+    Args:
+      cmdln_args (Optional[List[str]]): override sys.argv[1:]
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument("--records", type=int, default=200000,
+                        help="How many records to log.")
+    args = parser.parse_args(cmdln_args)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        text_path = os.path.join(tmpdir, "log.txt")
+        binary_path = os.path.join(tmpdir, "log.bin")
+        print("%-26s %14s %14s" % ("log", "bytes/record", "records/sec"))
+        elapsed = time_records(get_file_handler(text_path), args.records)
+        print("%-26s %14.1f %14d" % (
+            "text", os.path.getsize(text_path) / args.records,
+            args.records / elapsed
+        ))
+        elapsed = time_records(get_binary_handler(binary_path), args.records)
+        size = os.path.getsize(binary_path) + \
+            os.path.getsize(binary_path + INDEX_SUFFIX)
+        print("%-26s %14.1f %14d" % ("binary + index", size / args.records,
+                                     args.records / elapsed))
+        start = default_timer()
+        count = len(list(iter_records(binary_path, level=logging.ERROR)))
+        print("ERROR query: %d records in %.3f sec" %
+              (count, default_timer() - start))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark ErrorList matching with each installed regex engine.
+
+Usage::
+
+  PYTHONPATH=. python benchmarks/errorlists.py [--repeat N] [--length N]
+
+For each regex engine, this times OutputParser.match_line() over a sample
+of ordinary build output, and over a single long line that makes the
+VIRTUALENV_ERROR_LIST "Downloading" regex backtrack.
+"""
+from __future__ import absolute_import, division, print_function, \
+                       unicode_literals
+import argparse
+import scriptharness.errorlists as errorlists
+from scriptharness.errorlists import ErrorList
+from scriptharness.log import OutputParser
+import sys
+from timeit import default_timer
+
+SAMPLE_LINES = [
+    'gcc -c -o foo.o foo.c',
+    'foo.c:12: warning: unused variable',
+    'make[2]: *** [all] Error 2',
+    'Downloading foo.tar.gz (1.2 MB): 50% 600kb',
+    'Collecting requests',
+    'tar: Child returned status 2',
+]
+
+
+def time_lines(error_list, lines, repeat):
+    """Time OutputParser.match_line() over lines.
+
+    Args:
+      error_list (ErrorList): the error_list to match with.
+      lines (List[str]): the lines to match.
+      repeat (int): how many times to match each line.
+
+    Returns:
+      float: the elapsed time, in seconds.
+    """
+    output_parser = OutputParser(error_list)
+    start = default_timer()
+    for _ in range(repeat):
+        for line in lines:
+            output_parser.match_line(line)
+    return default_timer() - start
+
+
+def main(cmdln_args=None):
+    """Run the benchmark.
+
+    Args:
+      cmdln_args (Optional[List[str]]): override sys.argv[1:]
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument("--repeat", type=int, default=10000,
+                        help="How many times to match the sample lines.")
+    parser.add_argument("--length", type=int, default=2000,
+                        help="The length of the backtracking line, in "
+                             "repetitions of 'a (b): '.")
+    args = parser.parse_args(cmdln_args)
+    error_checks = []
+    for name in sorted(vars(errorlists)):
+        value = getattr(errorlists, name)
+        if isinstance(value, ErrorList):
+            error_checks.extend(value)
+    long_line = 'Downloading ' + 'a (b): ' * args.length
+    print("%-6s %12s %12s" % ("engine", "sample (s)", "long line (s)"))
+    for engine in errorlists.REGEX_ENGINES:
+        if engine != 're' and getattr(errorlists, engine) is None:
+            print("%-6s not installed" % engine)
+            continue
+        error_list = ErrorList(error_checks, engine=engine)
+        print("%-6s %12.4f %12.4f" % (
+            engine, time_lines(error_list, SAMPLE_LINES, args.repeat),
+            time_lines(error_list, [long_line], 1)
+        ))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark records/sec through scriptharness.log.get_file_handler().
+
+Usage::
+
+  PYTHONPATH=. python benchmarks/log_handlers.py [--records N]
+
+This logs N records of typical command output through a file handler with
+each formatter, then through a buffered file handler, and prints the
+records/sec for each.
+"""
+from __future__ import absolute_import, division, print_function, \
+                       unicode_literals
+import argparse
+import logging
+import os
+from scriptharness.log import CachedFormatter, UnicodeFormatter, \
+    DEFAULT_DATEFMT, DEFAULT_FMT, get_file_handler
+import shutil
+import sys
+import tempfile
+from timeit import default_timer
+
+FORMATTERS = (
+    ('logging.Formatter', logging.Formatter),
+    ('UnicodeFormatter', UnicodeFormatter),
+    ('CachedFormatter', CachedFormatter),
+)
+
+
+def time_records(formatter, path, num_records, buffered=False):
+    """Time logging num_records records through a file handler.
+
+    Args:
+      formatter (logging.Formatter): the formatter to use.
+      path (str): the path to the log file.
+      num_records (int): how many records to log.
+      buffered (Optional[bool]): use a BufferedFileHandler.
+
+    Returns:
+      float: the elapsed time, in seconds.
+    """
+    logger = logging.getLogger("benchmark")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = get_file_handler(path, formatter=formatter, logger=logger,
+                               buffered=buffered)
+    try:
+        start = default_timer()
+        for num in range(num_records):
+            logger.info(" %s", "foo.c:%d: warning: unused variable" % num)
+        handler.flush()
+        return default_timer() - start
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+
+
+def main(cmdln_args=None):
+    """Run the benchmark.
+
+    Args:
+      cmdln_args (Optional[List[str]]): override sys.argv[1:]
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument("--records", type=int, default=200000,
+                        help="How many records to log.")
+    args = parser.parse_args(cmdln_args)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, "log.txt")
+        print("%-26s %14s" % ("formatter", "records/sec"))
+        for name, formatter_class in FORMATTERS:
+            formatter = formatter_class(fmt=DEFAULT_FMT,
+                                        datefmt=DEFAULT_DATEFMT)
+            elapsed = time_records(formatter, path, args.records)
+            print("%-26s %14d" % (name, args.records / elapsed))
+        elapsed = time_records(CachedFormatter(fmt=DEFAULT_FMT,
+                                               datefmt=DEFAULT_DATEFMT),
+                               path, args.records, buffered=True)
+        print("%-26s %14d" % ("CachedFormatter, buffered",
+                              args.records / elapsed))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark the per-call overhead of scriptharness.log.LogMethod.
+
+Usage::
+
+  PYTHONPATH=. python benchmarks/log_method.py [--calls N]
+
+This calls an undecorated function N times, then the same function
+decorated with LogMethod with its logger enabled (logging to a
+NullHandler) and disabled, and prints the microseconds per call for each.
+"""
+from __future__ import absolute_import, division, print_function, \
+                       unicode_literals
+import argparse
+import logging
+from scriptharness.log import LogMethod
+import sys
+from timeit import default_timer
+
+LOGGER_NAME = "scriptharness.benchmark"
+
+
+def func(*args, **kwargs):
+    """The function to call.
+
+    Args:
+      *args: returned.
+      **kwargs: returned.
+
+    Returns:
+      Tuple[Tuple[Any, ...], Dict[str, Any]]: args and kwargs.
+    """
+    return args, kwargs
+
+
+def time_calls(function, num_calls):
+    """Time calling function num_calls times.
+
+    Args:
+      function (Callable): the function to call.
+      num_calls (int): how many times to call it.
+
+    Returns:
+      float: the elapsed time, in seconds.
+    """
+    start = default_timer()
+    for num in range(num_calls):
+        function(num, name="benchmark")
+    return default_timer() - start
+
+
+def main(cmdln_args=None):
+    """Run the benchmark.
+
+    Args:
+      cmdln_args (Optional[List[str]]): override sys.argv[1:]
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument("--calls", type=int, default=100000,
+                        help="How many calls to time.")
+    args = parser.parse_args(cmdln_args)
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.propagate = False
+    logger.addHandler(logging.NullHandler())
+    decorated = LogMethod(logger_name=LOGGER_NAME)(func)
+    print("%-26s %14s" % ("function", "usec/call"))
+    elapsed = time_calls(func, args.calls)
+    print("%-26s %14.3f" % ("undecorated", elapsed * 1e6 / args.calls))
+    for name, level in (("LogMethod, enabled", logging.INFO),
+                        ("LogMethod, disabled", logging.WARNING)):
+        logger.setLevel(level)
+        elapsed = time_calls(decorated, args.calls)
+        print("%-26s %14.3f" % (name, elapsed * 1e6 / args.calls))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -19,13 +19,14 @@ import os
 import scriptharness.actions
 from scriptharness.config import get_config_template
 from scriptharness.exceptions import ScriptHarnessException
-from scriptharness.log import prepare_simple_logging
+from scriptharness.log import prepare_async_logging, prepare_simple_logging
 import scriptharness.script
 from scriptharness.structures import iterate_pairs
 
 __all__ = [
     'get_script', 'get_config', 'get_actions', 'get_actions_from_list',
     'get_logger', 'get_config_template', 'prepare_simple_logging',
+    'prepare_async_logging',
     'set_action_class', 'set_script_class',
 ]
 
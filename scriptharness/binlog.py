@@ -0,0 +1,916 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A compact binary log format, with a sidecar index for time, level and
+logger lookups.
+
+BinaryLogHandler writes each record as its logger name and message
+template, both interned, plus its args, rather than the fully formatted
+line.  Records whose args aren't None, bool, int, float or str, and
+records with exceptions, are stored as their formatted message instead,
+so rendering always matches what a text handler would have written.
+Records without args are stored inline too, since their messages are
+often unique (e.g. command output), and so are records with new
+templates once max_strings strings have been interned, so the string
+table stays small.
+
+The log is the MAGIC header followed by frames.  Each frame is a type
+byte, a varint payload length, and the payload::
+
+  FRAME_STRING       varint id, utf-8 string
+  FRAME_RECORD       varint ms since epoch, varint level, varint logger id,
+                     varint template id, varint args kind (ARGS_TUPLE or
+                     ARGS_DICT), varint arg count, args
+  FRAME_TEXT_RECORD  varint ms since epoch, varint level, varint logger id,
+                     utf-8 message
+
+The index, at the log path + INDEX_SUFFIX, is the INDEX_MAGIC header
+followed by a copy of every FRAME_STRING and a FRAME_BLOCK per
+block_records records::
+
+  FRAME_BLOCK        varint offset, varint length, varint record count,
+                     varint first ms, varint last ms, varint max level,
+                     varint logger id count, logger ids
+
+so a reader can get the string table from the index, then only read the
+blocks that may hold matching records.  Anything past the last indexed
+block, e.g. after a crash, is scanned.
+
+Usage::
+
+  python -m scriptharness.binlog LOG [--start TIME] [--end TIME] \\
+      [--level LEVEL] [--logger PREFIX] [--format FMT]
+  python -m scriptharness.binlog LOG --reindex
+
+Attributes:
+  MAGIC (bytes): the log header
+  INDEX_MAGIC (bytes): the index header
+  INDEX_SUFFIX (str): appended to the log path for the index path
+  DEFAULT_BLOCK_RECORDS (int): the default number of records per indexed
+    block
+  DEFAULT_CHUNK_SIZE (int): the default number of bytes to read at a time
+  DEFAULT_MAX_STRINGS (int): the default max number of interned strings
+    before new templates are stored inline
+  FRAME_STRING (int): the interned string frame type
+  FRAME_RECORD (int): the template + args record frame type
+  FRAME_TEXT_RECORD (int): the formatted message record frame type
+  FRAME_BLOCK (int): the index block frame type
+  ARGS_TUPLE (int): the record args are a tuple
+  ARGS_DICT (int): the record args are a dict
+  TIME_FORMATS (Tuple[str, ...]): the local time formats the commandline
+    accepts, besides seconds since the epoch
+"""
+from __future__ import absolute_import, division, print_function, \
+                       unicode_literals
+import argparse
+import logging
+import os
+from scriptharness.exceptions import ScriptHarnessException
+from scriptharness.log import DEFAULT_BUFFER_SIZE, DEFAULT_DATEFMT, \
+    DEFAULT_FMT, get_formatter
+from scriptharness.os import make_parent_dir
+from scriptharness.unicode import to_unicode
+import six
+import struct
+import sys
+import time
+
+MAGIC = b'SHBLOG\x00\x01'
+INDEX_MAGIC = b'SHBIDX\x00\x01'
+INDEX_SUFFIX = '.idx'
+DEFAULT_BLOCK_RECORDS = 256
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_MAX_STRINGS = 4096
+FRAME_STRING = 1
+FRAME_RECORD = 2
+FRAME_TEXT_RECORD = 3
+FRAME_BLOCK = 4
+ARGS_TUPLE = 0
+ARGS_DICT = 1
+TIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d')
+
+_TAG_NONE, _TAG_FALSE, _TAG_TRUE, _TAG_INT, _TAG_FLOAT, _TAG_TEXT = range(6)
+_DOUBLE = struct.Struct('<d')
+
+
+# Encoding helpers {{{1
+def write_varint(buf, value):
+    """Append an unsigned LEB128 varint to buf.
+
+    Args:
+      buf (bytearray): the buffer to append to.
+      value (int): the non-negative int to write.
+    """
+    while value > 0x7f:
+        buf.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def read_varint(data, pos):
+    """Read an unsigned LEB128 varint from data.
+
+    Args:
+      data (bytearray): the data to read from.
+      pos (int): the offset of the varint.
+
+    Returns:
+      Tuple[int, int]: the value, and the offset after the varint.
+
+    Raises:
+      IndexError: if data ends in the middle of the varint.
+    """
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def write_text(buf, text):
+    """Append a varint length plus utf-8 string to buf.
+
+    Args:
+      buf (bytearray): the buffer to append to.
+      text (str): the string to write.
+    """
+    encoded = text.encode('utf-8')
+    write_varint(buf, len(encoded))
+    buf.extend(encoded)
+
+
+def read_text(data, pos):
+    """Read a varint length plus utf-8 string from data.
+
+    Args:
+      data (bytearray): the data to read from.
+      pos (int): the offset of the string.
+
+    Returns:
+      Tuple[str, int]: the string, and the offset after it.
+    """
+    length, pos = read_varint(data, pos)
+    return bytes(data[pos:pos + length]).decode('utf-8'), pos + length
+
+
+def write_value(buf, value):
+    """Append a tagged log arg to buf.
+
+    Only exact None, bool, int, float and str values are written, since
+    subclasses may format differently once decoded.
+
+    Args:
+      buf (bytearray): the buffer to append to.
+      value (Any): the arg to write.
+
+    Raises:
+      ValueError: if the arg can't be written.
+    """
+    value_type = type(value)
+    if value is None:
+        buf.append(_TAG_NONE)
+    elif value_type is bool:
+        buf.append(_TAG_TRUE if value else _TAG_FALSE)
+    elif value_type in six.integer_types:
+        buf.append(_TAG_INT)
+        write_varint(buf, value << 1 if value >= 0 else (-value << 1) - 1)
+    elif value_type is float:
+        buf.append(_TAG_FLOAT)
+        buf.extend(_DOUBLE.pack(value))
+    elif value_type is six.text_type or value_type is six.binary_type and \
+            six.PY2:
+        buf.append(_TAG_TEXT)
+        write_text(buf, to_unicode(value))
+    else:
+        raise ValueError("Can't write %s arg!" % value_type)
+
+
+def read_value(data, pos):
+    """Read a tagged log arg from data.
+
+    Args:
+      data (bytearray): the data to read from.
+      pos (int): the offset of the arg.
+
+    Returns:
+      Tuple[Any, int]: the arg, and the offset after it.
+    """
+    tag = data[pos]
+    pos += 1
+    if tag == _TAG_INT:
+        value, pos = read_varint(data, pos)
+        return (-((value + 1) >> 1) if value & 1 else value >> 1), pos
+    if tag == _TAG_TEXT:
+        return read_text(data, pos)
+    if tag == _TAG_FLOAT:
+        return _DOUBLE.unpack(bytes(data[pos:pos + 8]))[0], pos + 8
+    return {_TAG_NONE: None, _TAG_FALSE: False, _TAG_TRUE: True}[tag], pos
+
+
+def write_frame(stream, frame_type, payload):
+    """Write a frame to a stream.
+
+    Args:
+      stream (file): the binary stream to write to.
+      frame_type (int): the frame type.
+      payload (bytearray): the frame payload.
+
+    Returns:
+      int: the number of bytes written.
+    """
+    header = bytearray([frame_type])
+    write_varint(header, len(payload))
+    stream.write(bytes(header + payload))
+    return len(header) + len(payload)
+
+
+def iter_frames(filehandle, start, end=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Read the frames between two offsets of a binary log or index.
+
+    A truncated frame at the end of the file, e.g. from a crash, is
+    ignored.
+
+    Args:
+      filehandle (file): the binary file to read.
+      start (int): the offset of the first frame.
+      end (Optional[int]): the offset to stop at.  Defaults to the end of
+        the file.
+      chunk_size (Optional[int]): the max bytes to read at a time.
+
+    Yields:
+      Tuple[int, int, int, bytearray, int, int]: the frame's offset, the
+      offset after the frame, the frame type, the data holding the
+      payload, and the payload's start and end in the data.
+    """
+    filehandle.seek(start)
+    data = bytearray()
+    offset = start
+    pos = 0
+    eof = False
+    while True:
+        try:
+            frame_type = data[pos]
+            length, payload_pos = read_varint(data, pos + 1)
+            if payload_pos + length > len(data):
+                raise IndexError
+        except IndexError:
+            if eof:
+                return
+            size = chunk_size
+            if end is not None:
+                size = min(size, end - offset - len(data))
+            chunk = filehandle.read(size) if size > 0 else b''
+            eof = not chunk
+            offset += pos
+            data = data[pos:] + bytearray(chunk)
+            pos = 0
+            continue
+        payload_end = payload_pos + length
+        yield (offset + pos, offset + payload_end, frame_type, data,
+               payload_pos, payload_end)
+        pos = payload_end
+
+
+# BinaryLogHandler {{{1
+class BinaryLogHandler(logging.Handler):
+    """Write records to a binary log and its index.
+
+    Flushing ends the current block, so each flush() writes a FRAME_BLOCK
+    to the index.  The logging module flushes handlers at exit, and
+    Script.run_action() flushes its logger's handlers after each action.
+
+    Attributes:
+      path (str): the path to the log.
+      index_path (str): the path to the index.
+      block_records (int): the max number of records per indexed block.
+      max_strings (int): once this many strings are interned, new
+        templates are stored inline.  Logger names are always interned.
+      strings (Dict[str, int]): the interned string ids.
+      stream (file): the log.
+      index_stream (file): the index.
+      position (int): the offset the next frame will be written at.
+      block (Dict[str, Any]): the current block, or None.
+    """
+    def __init__(self, path, mode='w', level=logging.NOTSET,
+                 block_records=DEFAULT_BLOCK_RECORDS,
+                 max_strings=DEFAULT_MAX_STRINGS):
+        """Initialization method for the BinaryLogHandler class.
+
+        In append mode, the existing log is reindexed if its index is
+        missing or out of date, so the interned strings carry over, and
+        any truncated frame at its end is dropped.
+
+        Args:
+          path (str): the path to the log.
+          mode (Optional[char]): 'w' to overwrite or 'a' to append.
+          level (Optional[int]): the handler level.
+          block_records (Optional[int]): the max number of records per
+            indexed block.
+          max_strings (Optional[int]): the max number of interned strings
+            before new templates are stored inline.
+        """
+        logging.Handler.__init__(self, level)
+        self.path = os.path.abspath(path)
+        self.index_path = self.path + INDEX_SUFFIX
+        self.block_records = block_records
+        self.max_strings = max_strings
+        self.strings = {}
+        self.block = None
+        make_parent_dir(self.path)
+        if mode == 'a' and os.path.exists(self.path) and \
+                os.path.getsize(self.path) > len(MAGIC):
+            index = read_index(self.path, index_path=self.index_path,
+                               rebuild=True)
+            for string_id, string in index['strings'].items():
+                self.strings[string] = string_id
+            self.position = index['end']
+            with open(self.path, 'rb+') as filehandle:
+                filehandle.truncate(self.position)
+            self.stream = open(self.path, 'ab', DEFAULT_BUFFER_SIZE)
+            self.index_stream = open(self.index_path, 'ab')
+        else:
+            self.stream = open(self.path, 'wb', DEFAULT_BUFFER_SIZE)
+            self.stream.write(MAGIC)
+            self.index_stream = open(self.index_path, 'wb')
+            self.index_stream.write(INDEX_MAGIC)
+            self.position = len(MAGIC)
+
+    def intern(self, string):
+        """Get the id of a string, writing a FRAME_STRING to the log and
+        index if it's new.
+
+        Args:
+          string (str): the string to intern.
+
+        Returns:
+          int: the string id.
+        """
+        string_id = self.strings.get(string)
+        if string_id is None:
+            string_id = self.strings[string] = len(self.strings)
+            payload = bytearray()
+            write_varint(payload, string_id)
+            payload.extend(string.encode('utf-8'))
+            self.position += write_frame(self.stream, FRAME_STRING, payload)
+            write_frame(self.index_stream, FRAME_STRING, payload)
+        return string_id
+
+    def format_text(self, record):
+        """Format the message and any exception of a record that can't be
+        stored as template + args.
+
+        Args:
+          record (logging.LogRecord): the record.
+
+        Returns:
+          str: the formatted message.
+        """
+        message = to_unicode(record.getMessage())
+        formatter = self.formatter or logging.Formatter()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = formatter.formatException(record.exc_info)
+        if record.exc_text:
+            message += "\n" + to_unicode(record.exc_text)
+        if getattr(record, 'stack_info', None):
+            message += "\n" + to_unicode(
+                formatter.formatStack(record.stack_info)
+            )
+        return message
+
+    def encode(self, record, time_ms):
+        """Encode a record as a frame payload.
+
+        Only records with args are stored as template + args; the rest are
+        FRAME_TEXT_RECORDs, so one-off messages don't grow the string table.
+
+        Args:
+          record (logging.LogRecord): the record to encode.
+          time_ms (int): the record time, in ms since the epoch.
+
+        Returns:
+          Tuple[int, bytearray]: the frame type and payload.
+        """
+        header = bytearray()
+        write_varint(header, time_ms)
+        write_varint(header, max(record.levelno, 0))
+        write_varint(header, self.intern(record.name))
+        if record.args and type(record.msg) is six.text_type and \
+                not record.exc_info and not record.exc_text and \
+                not getattr(record, 'stack_info', None) and \
+                (record.msg in self.strings or
+                 len(self.strings) < self.max_strings):
+            args = bytearray()
+            try:
+                if isinstance(record.args, dict):
+                    write_varint(args, ARGS_DICT)
+                    write_varint(args, len(record.args))
+                    for key, value in record.args.items():
+                        if type(key) is not six.text_type:
+                            raise ValueError("Can't write %s key!" % key)
+                        write_text(args, key)
+                        write_value(args, value)
+                else:
+                    write_varint(args, ARGS_TUPLE)
+                    write_varint(args, len(record.args))
+                    for value in record.args:
+                        write_value(args, value)
+            except ValueError:
+                pass
+            else:
+                write_varint(header, self.intern(record.msg))
+                return FRAME_RECORD, header + args
+        header.extend(self.format_text(record).encode('utf-8'))
+        return FRAME_TEXT_RECORD, header
+
+    def emit(self, record):
+        """Write the record to the log.
+
+        Args:
+          record (logging.LogRecord): the record to write.
+        """
+        try:
+            time_ms = int(record.created * 1000)
+            block = self.block
+            if block is None:
+                block = self.block = new_block(self.position)
+            frame_type, payload = self.encode(record, time_ms)
+            self.position += write_frame(self.stream, frame_type, payload)
+            update_block(block, time_ms, record.levelno,
+                         self.strings[record.name])
+            if block['count'] >= self.block_records:
+                self.end_block()
+        except Exception:  # pylint: disable=broad-except
+            self.handleError(record)
+
+    def end_block(self):
+        """Write the current block's FRAME_BLOCK to the index.
+        """
+        block, self.block = self.block, None
+        if block is None:
+            return
+        block['length'] = self.position - block['offset']
+        self.stream.flush()
+        write_frame(self.index_stream, FRAME_BLOCK, encode_block(block))
+        self.index_stream.flush()
+
+    def flush(self):
+        """End the current block and flush the log and index.
+        """
+        self.acquire()
+        try:
+            if not self.stream.closed:
+                self.end_block()
+                self.stream.flush()
+                self.index_stream.flush()
+        finally:
+            self.release()
+
+    def close(self):
+        """Flush and close the log and index.
+        """
+        self.acquire()
+        try:
+            if not self.stream.closed:
+                self.end_block()
+                self.stream.close()
+                self.index_stream.close()
+        finally:
+            self.release()
+        logging.Handler.close(self)
+
+
+def get_binary_handler(path, logger=None, level=logging.INFO, mode='w',
+                       block_records=DEFAULT_BLOCK_RECORDS,
+                       max_strings=DEFAULT_MAX_STRINGS):
+    """Create a BinaryLogHandler.
+
+    Args:
+      path (str): the path to the log.
+      logger (Optional[logging.Logger]): logger to add the handler to.
+      level (Optional[int]): logging level for the handler.
+      mode (Optional[char]): 'w' to overwrite or 'a' to append.
+      block_records (Optional[int]): the max number of records per indexed
+        block.
+      max_strings (Optional[int]): the max number of interned strings
+        before new templates are stored inline.
+
+    Returns:
+      BinaryLogHandler: This can be added to a logger via
+      logger.addHandler(handler)
+    """
+    handler = BinaryLogHandler(path, mode=mode, level=level,
+                               block_records=block_records,
+                               max_strings=max_strings)
+    if logger:
+        logger.addHandler(handler)
+    return handler
+
+
+# Index helpers {{{1
+def new_block(offset):
+    """Start an index block.
+
+    Args:
+      offset (int): the offset of the block's first frame.
+
+    Returns:
+      Dict[str, Any]: the block.
+    """
+    return {'offset': offset, 'length': 0, 'count': 0, 'first': None,
+            'last': 0, 'max_level': 0, 'logger_ids': set()}
+
+
+def update_block(block, time_ms, levelno, logger_id):
+    """Add a record to an index block.
+
+    Args:
+      block (Dict[str, Any]): the block.
+      time_ms (int): the record time, in ms since the epoch.
+      levelno (int): the record level.
+      logger_id (int): the record's logger name id.
+    """
+    block['count'] += 1
+    if block['first'] is None or time_ms < block['first']:
+        block['first'] = time_ms
+    if time_ms > block['last']:
+        block['last'] = time_ms
+    if levelno > block['max_level']:
+        block['max_level'] = levelno
+    block['logger_ids'].add(logger_id)
+
+
+def encode_block(block):
+    """Encode an index block as a FRAME_BLOCK payload.
+
+    Args:
+      block (Dict[str, Any]): the block.
+
+    Returns:
+      bytearray: the payload.
+    """
+    payload = bytearray()
+    for key in ('offset', 'length', 'count', 'first', 'last', 'max_level'):
+        write_varint(payload, block[key] or 0)
+    write_varint(payload, len(block['logger_ids']))
+    for logger_id in sorted(block['logger_ids']):
+        write_varint(payload, logger_id)
+    return payload
+
+
+def decode_block(data, pos):
+    """Decode a FRAME_BLOCK payload.
+
+    Args:
+      data (bytearray): the data holding the payload.
+      pos (int): the payload offset.
+
+    Returns:
+      Dict[str, Any]: the block.
+    """
+    block = {}
+    for key in ('offset', 'length', 'count', 'first', 'last', 'max_level'):
+        block[key], pos = read_varint(data, pos)
+    num, pos = read_varint(data, pos)
+    block['logger_ids'] = set()
+    for _ in range(num):
+        logger_id, pos = read_varint(data, pos)
+        block['logger_ids'].add(logger_id)
+    return block
+
+
+def decode_string(data, pos, end):
+    """Decode a FRAME_STRING payload.
+
+    Args:
+      data (bytearray): the data holding the payload.
+      pos (int): the payload start offset.
+      end (int): the payload end offset.
+
+    Returns:
+      Tuple[int, str]: the string id and string.
+    """
+    string_id, pos = read_varint(data, pos)
+    return string_id, bytes(data[pos:end]).decode('utf-8')
+
+
+def _check_magic(filehandle, magic, path):
+    """Raise if filehandle doesn't start with magic.
+
+    Args:
+      filehandle (file): the binary file to check.
+      magic (bytes): the expected header.
+      path (str): the path, for the error message.
+
+    Raises:
+      scriptharness.exceptions.ScriptHarnessException: on a bad header.
+    """
+    if filehandle.read(len(magic)) != magic:
+        raise ScriptHarnessException("Bad binary log header!", path)
+
+
+def write_index(path, index_path=None, block_records=DEFAULT_BLOCK_RECORDS):
+    """Rebuild the index of a binary log by scanning it.
+
+    Args:
+      path (str): the path to the log.
+      index_path (Optional[str]): the path to the index.  Defaults to
+        path + INDEX_SUFFIX.
+      block_records (Optional[int]): the max number of records per
+        indexed block.
+
+    Returns:
+      int: the number of records indexed.
+
+    Raises:
+      scriptharness.exceptions.ScriptHarnessException: if path isn't a
+        binary log.
+    """
+    path = os.path.abspath(path)
+    index_path = index_path or path + INDEX_SUFFIX
+    count = 0
+    block = None
+    with open(path, 'rb') as filehandle, \
+            open(index_path, 'wb') as index_stream:
+        _check_magic(filehandle, MAGIC, path)
+        index_stream.write(INDEX_MAGIC)
+        for offset, next_offset, frame_type, data, pos, end in \
+                iter_frames(filehandle, len(MAGIC)):
+            if block is None:
+                block = new_block(offset)
+            block['length'] = next_offset - block['offset']
+            if frame_type == FRAME_STRING:
+                write_frame(index_stream, FRAME_STRING, data[pos:end])
+            elif frame_type in (FRAME_RECORD, FRAME_TEXT_RECORD):
+                time_ms, pos = read_varint(data, pos)
+                levelno, pos = read_varint(data, pos)
+                logger_id, pos = read_varint(data, pos)
+                update_block(block, time_ms, levelno, logger_id)
+                count += 1
+                if block['count'] >= block_records:
+                    write_frame(index_stream, FRAME_BLOCK,
+                                encode_block(block))
+                    block = None
+        if block is not None:
+            write_frame(index_stream, FRAME_BLOCK, encode_block(block))
+    return count
+
+
+def read_index(path, index_path=None, rebuild=False):
+    """Read the index of a binary log.
+
+    Args:
+      path (str): the path to the log.
+      index_path (Optional[str]): the path to the index.  Defaults to
+        path + INDEX_SUFFIX.
+      rebuild (Optional[bool]): if the index is missing or doesn't cover
+        the whole log, rebuild it with write_index() first.
+
+    Returns:
+      Dict[str, Any]: the 'strings' id to string dict, the 'blocks' list,
+      and the 'end' offset of the last indexed block.
+
+    Raises:
+      scriptharness.exceptions.ScriptHarnessException: if the index is
+        missing and rebuild isn't set.
+    """
+    path = os.path.abspath(path)
+    index_path = index_path or path + INDEX_SUFFIX
+    if not os.path.exists(index_path):
+        if not rebuild:
+            raise ScriptHarnessException("No binary log index!", index_path)
+        write_index(path, index_path=index_path)
+    index = {'strings': {}, 'blocks': [], 'end': len(MAGIC)}
+    with open(index_path, 'rb') as filehandle:
+        _check_magic(filehandle, INDEX_MAGIC, index_path)
+        for _, _, frame_type, data, pos, end in \
+                iter_frames(filehandle, len(INDEX_MAGIC)):
+            if frame_type == FRAME_STRING:
+                string_id, string = decode_string(data, pos, end)
+                index['strings'][string_id] = string
+            elif frame_type == FRAME_BLOCK:
+                block = decode_block(data, pos)
+                index['blocks'].append(block)
+                index['end'] = block['offset'] + block['length']
+    if rebuild and index['end'] != os.path.getsize(path):
+        write_index(path, index_path=index_path)
+        return read_index(path, index_path=index_path)
+    return index
+
+
+# Reading {{{1
+def decode_record(frame_type, data, pos, end, strings):
+    """Decode a record frame into a LogRecord.
+
+    Args:
+      frame_type (int): FRAME_RECORD or FRAME_TEXT_RECORD.
+      data (bytearray): the data holding the payload.
+      pos (int): the payload start offset.
+      end (int): the payload end offset.
+      strings (Dict[int, str]): the interned strings.
+
+    Returns:
+      logging.LogRecord: the record.
+    """
+    time_ms, pos = read_varint(data, pos)
+    levelno, pos = read_varint(data, pos)
+    logger_id, pos = read_varint(data, pos)
+    args = ()
+    if frame_type == FRAME_RECORD:
+        template_id, pos = read_varint(data, pos)
+        kind, pos = read_varint(data, pos)
+        num, pos = read_varint(data, pos)
+        if kind == ARGS_DICT:
+            args = {}
+            for _ in range(num):
+                key, pos = read_text(data, pos)
+                args[key], pos = read_value(data, pos)
+        else:
+            values = []
+            for _ in range(num):
+                value, pos = read_value(data, pos)
+                values.append(value)
+            args = tuple(values)
+        msg = strings[template_id]
+    else:
+        msg = bytes(data[pos:end]).decode('utf-8')
+    return logging.makeLogRecord({
+        'name': strings[logger_id],
+        'levelno': levelno,
+        'levelname': logging.getLevelName(levelno),
+        'msg': msg,
+        'args': args,
+        'created': time_ms / 1000,
+        'msecs': time_ms % 1000,
+    })
+
+
+def iter_records(path, index_path=None, start=None, end=None, level=None,
+                 logger=None):
+    """Read the matching records from a binary log.
+
+    The index is used to skip blocks that can't match, so narrow time,
+    level and logger queries only read a fraction of the log.
+
+    Args:
+      path (str): the path to the log.
+      index_path (Optional[str]): the path to the index.  Defaults to
+        path + INDEX_SUFFIX.
+      start (Optional[float]): skip records before this time, in seconds
+        since the epoch.
+      end (Optional[float]): skip records at or after this time.
+      level (Optional[int]): skip records below this level.
+      logger (Optional[str]): skip records not from this logger or its
+        children.
+
+    Yields:
+      logging.LogRecord: the matching records, in log order.
+
+    Raises:
+      scriptharness.exceptions.ScriptHarnessException: if path isn't a
+        binary log, or the index is missing.
+    """
+    index = read_index(path, index_path=index_path)
+    strings = index['strings']
+    start_ms = None if start is None else int(start * 1000)
+    end_ms = None if end is None else int(end * 1000)
+    logger_ids = None
+    if logger is not None:
+        logger_ids = set(
+            string_id for string_id, string in strings.items()
+            if string == logger or string.startswith(logger + '.')
+        )
+
+    def matches(block):
+        """Can the block hold matching records?"""
+        return not (
+            (start_ms is not None and block['last'] < start_ms) or
+            (end_ms is not None and block['first'] >= end_ms) or
+            (level is not None and block['max_level'] < level) or
+            (logger_ids is not None and
+             not block['logger_ids'] & logger_ids)
+        )
+
+    ranges = [(x['offset'], x['offset'] + x['length'])
+              for x in index['blocks'] if matches(x)]
+    ranges.append((index['end'], None))
+    with open(path, 'rb') as filehandle:
+        _check_magic(filehandle, MAGIC, path)
+        for range_start, range_end in ranges:
+            for _, _, frame_type, data, pos, frame_end in \
+                    iter_frames(filehandle, range_start, range_end):
+                if frame_type == FRAME_STRING:
+                    string_id, string = decode_string(data, pos, frame_end)
+                    strings[string_id] = string
+                    continue
+                if frame_type not in (FRAME_RECORD, FRAME_TEXT_RECORD):
+                    continue
+                time_ms, rpos = read_varint(data, pos)
+                levelno, rpos = read_varint(data, rpos)
+                logger_id, _ = read_varint(data, rpos)
+                name = strings[logger_id]
+                if (start_ms is not None and time_ms < start_ms) or \
+                        (end_ms is not None and time_ms >= end_ms) or \
+                        (level is not None and levelno < level) or \
+                        (logger is not None and name != logger and
+                         not name.startswith(logger + '.')):
+                    continue
+                yield decode_record(frame_type, data, pos, frame_end, strings)
+
+
+# main {{{1
+def parse_time(value):
+    """Parse a commandline time.
+
+    Args:
+      value (str): seconds since the epoch, or a local time in one of
+        TIME_FORMATS.
+
+    Returns:
+      float: seconds since the epoch.
+
+    Raises:
+      argparse.ArgumentTypeError: if value isn't a time.
+    """
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for time_format in TIME_FORMATS:
+        try:
+            return time.mktime(time.strptime(value, time_format))
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError("Unknown time %s!" % value)
+
+
+def parse_level(value):
+    """Parse a commandline level.
+
+    Args:
+      value (str): a level name like 'WARNING', or number.
+
+    Returns:
+      int: the level.
+
+    Raises:
+      argparse.ArgumentTypeError: if value isn't a level.
+    """
+    if value.isdigit():
+        return int(value)
+    level = logging.getLevelName(value.upper())
+    if not isinstance(level, int):
+        raise argparse.ArgumentTypeError("Unknown level %s!" % value)
+    return level
+
+
+def main(cmdln_args=None):
+    """Commandline entry point.
+
+    Args:
+      cmdln_args (Optional[List[str]]): override sys.argv[1:]
+    """
+    parser = argparse.ArgumentParser(
+        description="Render or query a scriptharness binary log."
+    )
+    parser.add_argument("path", help="The binary log.")
+    parser.add_argument("--index", help="The index, if it isn't at "
+                                        "PATH%s." % INDEX_SUFFIX)
+    parser.add_argument("--reindex", action="store_true",
+                        help="Rebuild the index and exit.")
+    parser.add_argument("--start", type=parse_time,
+                        help="Skip records before this time.")
+    parser.add_argument("--end", type=parse_time,
+                        help="Skip records at or after this time.")
+    parser.add_argument("--level", type=parse_level,
+                        help="Skip records below this level.")
+    parser.add_argument("--logger",
+                        help="Only show this logger and its children.")
+    parser.add_argument("--format", default=DEFAULT_FMT,
+                        help="The logging format to render with.")
+    parser.add_argument("--datefmt", default=DEFAULT_DATEFMT,
+                        help="The logging date format to render with.")
+    args = parser.parse_args(cmdln_args)
+    if args.reindex:
+        count = write_index(args.path, index_path=args.index)
+        print("Indexed %d records." % count)
+        return
+    formatter = get_formatter(fmt=args.format, datefmt=args.datefmt)
+    # py2 sys.stdout and py3 sys.stdout.buffer take bytes
+    out = getattr(sys.stdout, 'buffer', None)
+    if out is None and six.PY2:
+        out = sys.stdout
+    for record in iter_records(args.path, index_path=args.index,
+                               start=args.start, end=args.end,
+                               level=args.level, logger=args.logger):
+        line = to_unicode(formatter.format(record)) + "\n"
+        if out is None:
+            sys.stdout.write(line)
+        else:
+            out.write(line.encode('utf-8'))
+    (out or sys.stdout).flush()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -4,12 +4,14 @@
 
 Attributes:
   LOGGER_NAME (str): default logging.Logger name.
+  COMMAND_IDS (itertools.count): the source of Command.command_id values.
   STRINGS (Dict[str, Dict[str, str]]): Strings for logging.
 """
 from __future__ import absolute_import, division, print_function, \
                        unicode_literals
 from contextlib import contextmanager
 from copy import deepcopy
+import itertools
 import logging
 import multiprocessing
 import os
@@ -18,8 +20,9 @@ import pprint
 from scriptharness.errorlists import ErrorList
 from scriptharness.exceptions import ScriptHarnessError, \
     ScriptHarnessException, ScriptHarnessFatal, ScriptHarnessTimeout
-from scriptharness.log import OutputParser
+from scriptharness.log import OutputParser, log_context
 import scriptharness.process
+from scriptharness.redact import get_default_redactor
 import scriptharness.status
 from scriptharness.unicode import to_unicode
 import subprocess
@@ -28,6 +31,7 @@ import tempfile
 
 # Constants {{{1
 LOGGER_NAME = "scriptharness.commands"
+COMMAND_IDS = itertools.count(1)
 STRINGS = {
     "check_output": {
         "pre_msg":
@@ -145,9 +149,16 @@ class Command(object):
       detect_error_cb (Callable[[Any], scriptharness.status]): this function
         determines whether the command was successful.
 
+      redactor (scriptharness.redact.Redactor): if set, secrets are masked
+        in the logged command, cwd, env, and each line of output.  Defaults
+        to scriptharness.redact.get_default_redactor().
+
       history (Dict[str, Any]): This dictionary holds the timestamps and status of
         the command.
 
+      command_id (int): a process-unique id for this command, logged as the
+        command_id of structured log records while it runs.
+
       kwargs (Dict[Any, Any]): These kwargs will be passed to subprocess.Popen, except
         for the optional 'output_timeout' and 'timeout', which are processed by
         Command.  `output_timeout` is how long a command can run without
@@ -156,11 +167,16 @@ class Command(object):
 
       strings (Dict[str, str]): Strings to log.
     """
-    def __init__(self, command, logger=None, detect_error_cb=None, **kwargs):
+    def __init__(self, command, logger=None, detect_error_cb=None,
+                 redactor=None, **kwargs):
         self.command = command
         self.logger = logger or logging.getLogger(LOGGER_NAME)
         self.detect_error_cb = detect_error_cb or detect_errors
+        if redactor is None:
+            redactor = get_default_redactor()
+        self.redactor = redactor
         self.history = {}
+        self.command_id = next(COMMAND_IDS)
         self.kwargs = kwargs or {}
         self.strings = deepcopy(STRINGS['command'])
 
@@ -171,7 +187,23 @@ class Command(object):
           env (Dict[str, str]): the environment we'll be passing to subprocess.Popen.
         """
         env = self.fix_env(env)
-        self.logger.info(self.strings['env'], {'env': pprint.pformat(env)})
+        if self.redactor is not None:
+            env = self.redactor.redact_data(env)
+        self.logger.info(self.strings['env'],
+                         {'env': self.redact(pprint.pformat(env))})
+
+    def redact(self, text):
+        """Mask secrets in text, if there's a redactor.
+
+        Args:
+          text (str): the text to redact.
+
+        Returns:
+          str: the redacted text.
+        """
+        if self.redactor is not None:
+            text = self.redactor.redact(text)
+        return text
 
     @staticmethod
     def fix_env(env):
@@ -205,24 +237,28 @@ class Command(object):
           scriptharness.exceptions.ScriptHarnessException: if cwd is defined
             and doesn't exist.
         """
+        command = self.command
+        if self.redactor is not None:
+            command = self.redactor.redact_data(command)
         if 'cwd' in self.kwargs:
+            cwd = self.redact(self.kwargs['cwd'])
             if not os.path.isdir(self.kwargs['cwd']):
                 raise ScriptHarnessException(
                     self.strings["cwd_doesn't_exist"] % \
-                    {'cwd': self.kwargs['cwd'], 'command': self.command}
+                    {'cwd': cwd, 'command': command}
                 )
             self.logger.info(
                 self.strings["start_with_cwd"],
-                {'cwd': self.kwargs['cwd'], 'command': self.command}
+                {'cwd': cwd, 'command': command}
             )
         else:
             self.logger.info(
-                self.strings["start_without_cwd"], {'command': self.command}
+                self.strings["start_without_cwd"], {'command': command}
             )
-        if isinstance(self.command, (list, tuple)):
+        if isinstance(command, (list, tuple)):
             self.logger.info(
                 self.strings["copy_paste"],
-                {'command': subprocess.list2cmdline(self.command)}
+                {'command': self.redact(subprocess.list2cmdline(command))}
             )
         if 'env' in self.kwargs:
             # https://mail.python.org/pipermail/python-dev/2011-December/114740.html
@@ -234,7 +270,13 @@ class Command(object):
         Args:
           line (str): a line of output
         """
-        self.logger.info(" %s", to_unicode(line.rstrip()))
+        self.logger.info(" %s", self.redact(to_unicode(line.rstrip())))
+
+    def finish_output(self):
+        """Called once the process has exited, before detect_error_cb.
+        Here for subclassing.
+        """
+        pass
 
     def finish_process(self):
         """Here for subclassing.
@@ -250,33 +292,35 @@ class Command(object):
         Raises:
           scriptharness.exceptions.ScriptHarnessError on error
         """
-        if 'env' in self.kwargs:
-            self.kwargs['env'] = self.fix_env(self.kwargs['env'])
-        self.log_start()
-        output_timeout = self.kwargs.get('output_timeout', None)
-        if 'output_timeout' in self.kwargs:
-            del self.kwargs['output_timeout']
-        max_timeout = self.kwargs.get('timeout', None)
-        if 'timeout' in self.kwargs:
-            del self.kwargs['timeout']
-        if isinstance(self.command, (list, tuple)):
-            self.kwargs.setdefault('shell', False)
-        else:
-            self.kwargs.setdefault('shell', True)
-        queue = multiprocessing.Queue()  # pylint: disable=no-member
-        runner = multiprocessing.Process(  # pylint: disable=not-callable
-            target=scriptharness.process.command_subprocess,
-            args=(queue, self.command),
-            kwargs=self.kwargs,
-        )
-        runner.start()
-        self.history['return_value'] = scriptharness.process.watch_command(
-            self.logger, queue, runner, self.add_line,
-            output_timeout=output_timeout, max_timeout=max_timeout
-        )
-        self.history['status'] = self.detect_error_cb(self)
-        self.finish_process()
-        return self.history['status']
+        with log_context(command_id=self.command_id):
+            if 'env' in self.kwargs:
+                self.kwargs['env'] = self.fix_env(self.kwargs['env'])
+            self.log_start()
+            output_timeout = self.kwargs.get('output_timeout', None)
+            if 'output_timeout' in self.kwargs:
+                del self.kwargs['output_timeout']
+            max_timeout = self.kwargs.get('timeout', None)
+            if 'timeout' in self.kwargs:
+                del self.kwargs['timeout']
+            if isinstance(self.command, (list, tuple)):
+                self.kwargs.setdefault('shell', False)
+            else:
+                self.kwargs.setdefault('shell', True)
+            queue = multiprocessing.Queue()  # pylint: disable=no-member
+            runner = multiprocessing.Process(  # pylint: disable=not-callable
+                target=scriptharness.process.command_subprocess,
+                args=(queue, self.command),
+                kwargs=self.kwargs,
+            )
+            runner.start()
+            self.history['return_value'] = scriptharness.process.watch_command(
+                self.logger, queue, runner, self.add_line,
+                output_timeout=output_timeout, max_timeout=max_timeout
+            )
+            self.finish_output()
+            self.history['status'] = self.detect_error_cb(self)
+            self.finish_process()
+            return self.history['status']
 
 
 # ParsedCommand {{{1
@@ -287,16 +331,41 @@ class ParsedCommand(Command):
     that may have been slightly cleaner.  However, people have subclassed
     OutputParser in mozharness for various purposes; keeping the two objects
     separate may encourage that behavior.
+
+    Attributes:
+      parser (OutputParser): the parser to send output to.
+
+      profile_path (str): if set, profile the error_list, log the profile
+        when the command finishes, and write it to this path as json.
+
+      error_index_path (str): if set, index every line of output classified
+        logging.WARNING or above, and write the index to this path as json
+        lines when the command finishes.
+
+      aggregate_warnings (int): if set, log only the first of each repeated
+        warning, and log the top `aggregate_warnings` repeated warnings when
+        the command finishes.
+
+      + all of the attributes in scriptharness.commands.Command
     """
-    def __init__(self, command, error_list=None, parser=None, **kwargs):
+    def __init__(self, command, error_list=None, parser=None,
+                 profile_path=None, error_index_path=None,
+                 aggregate_warnings=None, **kwargs):
         if not parser:
             if not isinstance(error_list, ErrorList):
                 raise ScriptHarnessException(
                     "error_list must be an ErrorList!",
                     error_list
                 )
-            parser = OutputParser(error_list)
+            parser = OutputParser(error_list, profile=bool(profile_path),
+                                  index=bool(error_index_path),
+                                  aggregate=aggregate_warnings,
+                                  redactor=kwargs.get('redactor') or
+                                  get_default_redactor())
         self.parser = parser
+        self.profile_path = profile_path
+        self.error_index_path = error_index_path
+        self.aggregate_warnings = aggregate_warnings
         kwargs.setdefault("detect_error_cb", detect_parsed_errors)
         Command.__init__(self, command, **kwargs)
 
@@ -308,6 +377,23 @@ class ParsedCommand(Command):
         """
         self.parser.add_line(line)
 
+    def finish_output(self):
+        """Log any output still buffered in the parser, e.g. the last
+        pre_context_lines lines or an unclosed block, and the repeated
+        warning summary if aggregating.
+
+        If the parser is profiling, log the profile, and write it to
+        self.profile_path if set.  Write the error index to
+        self.error_index_path if set.
+        """
+        self.parser.finish()
+        if self.parser.profile is not None:
+            self.parser.log_profile()
+            if self.profile_path:
+                self.parser.write_profile(self.profile_path)
+        if self.error_index_path:
+            self.parser.write_error_index(self.error_index_path)
+
 
 # Output {{{1
 class Output(Command):
@@ -349,34 +435,35 @@ class Output(Command):
     def run(self):
         """Output.run()
         """
-        if 'env' in self.kwargs:
-            self.kwargs['env'] = self.fix_env(self.kwargs['env'])
-        self.log_start()
-        output_timeout = self.kwargs.get('output_timeout', None)
-        if 'output_timeout' in self.kwargs:
-            del self.kwargs['output_timeout']
-        max_timeout = self.kwargs.get('timeout', None)
-        if 'timeout' in self.kwargs:
-            del self.kwargs['timeout']
-        if isinstance(self.command, (list, tuple)):
-            self.kwargs.setdefault('shell', False)
-        else:
-            self.kwargs.setdefault('shell', True)
-        self.kwargs['stdout'] = self.stdout.file
-        self.kwargs['stderr'] = self.stderr.file
-        try:
-            process = subprocess.Popen(self.command, **self.kwargs)
-        except OSError as exc_info:
-            raise ScriptHarnessError(
-                "Can't run command!", self.command, exc_info
+        with log_context(command_id=self.command_id):
+            if 'env' in self.kwargs:
+                self.kwargs['env'] = self.fix_env(self.kwargs['env'])
+            self.log_start()
+            output_timeout = self.kwargs.get('output_timeout', None)
+            if 'output_timeout' in self.kwargs:
+                del self.kwargs['output_timeout']
+            max_timeout = self.kwargs.get('timeout', None)
+            if 'timeout' in self.kwargs:
+                del self.kwargs['timeout']
+            if isinstance(self.command, (list, tuple)):
+                self.kwargs.setdefault('shell', False)
+            else:
+                self.kwargs.setdefault('shell', True)
+            self.kwargs['stdout'] = self.stdout.file
+            self.kwargs['stderr'] = self.stderr.file
+            try:
+                process = subprocess.Popen(self.command, **self.kwargs)
+            except OSError as exc_info:
+                raise ScriptHarnessError(
+                    "Can't run command!", self.command, exc_info
+                )
+            self.history['return_value'] = scriptharness.process.watch_output(
+                self.logger, process, self.stdout, self.stderr,
+                output_timeout=output_timeout, max_timeout=max_timeout
             )
-        self.history['return_value'] = scriptharness.process.watch_output(
-            self.logger, process, self.stdout, self.stderr,
-            output_timeout=output_timeout, max_timeout=max_timeout
-        )
-        self.history['status'] = self.detect_error_cb(self)
-        self.finish_process()
-        return self.history['status']
+            self.history['status'] = self.detect_error_cb(self)
+            self.finish_process()
+            return self.history['status']
 
     def get_output(self, handle_name="stdout", text=True):
         """Get output from file.  This reads the output into memory, so
@@ -24,6 +24,7 @@ from requests.exceptions import RequestException, Timeout
 from scriptharness.actions import Action
 from scriptharness.exceptions import ScriptHarnessException, \
     ScriptHarnessTimeout
+from scriptharness.log import validate_log_filters
 from scriptharness.structures import iterate_pairs
 from scriptharness.unicode import to_unicode
 import six
@@ -77,6 +78,18 @@ DEFAULT_CONFIG_DEFINITION = {
         "parent_parser": "config",
         "help": "Log the built configuration and exit.",
     },
+    "scriptharness_log_filters": {
+        "help": "Rate limit and sample low-level log records, as a dict of "
+                "logger name prefix to scriptharness.log.RateLimitFilter "
+                "options, e.g. {'scriptharness.commands': {'rate': 50, "
+                "'sample': 10, 'level': 'INFO'}}.",
+        "validate_cb": validate_log_filters,
+    },
+    "scriptharness_redact_tokens": {
+        "help": "If true, also mask common token shapes, like GitHub and "
+                "AWS keys, in the log; see "
+                "scriptharness.redact.TOKEN_PATTERNS.",
+    },
 }
 
 # parse_config_file() {{{1
@@ -519,6 +532,8 @@ class ConfigVariable(object):
         'optional_vars': [],  # names of other vars that are optionally
                               # used in relation to this var.  This is purely
                               # informational.
+        'secret': False,  # if True, this var's value is masked in the log;
+                          # see scriptharness.redact.
       }
 
 
@@ -564,7 +579,7 @@ class ConfigVariable(object):
         for key in self.definition.keys():
             if key not in ('dest', 'action', 'options', 'validate_cb',
                            'incompatible_vars', 'required_vars',
-                           'optional_vars', 'parent_parser'):
+                           'optional_vars', 'parent_parser', 'secret'):
                 kwargs[key] = self.definition[key]
         try:
             return parser.add_argument(*args, **kwargs)
@@ -654,6 +669,22 @@ class ConfigTemplate(object):
                 defaults[name] = variable.definition['default']
         return defaults
 
+    def get_secrets(self, config):
+        """Get the config values of all the variables marked 'secret'.
+
+        Args:
+          config (dict): the config built from build_config()
+
+        Returns:
+          list: the secret values that are set in config.
+        """
+        secrets = []
+        for name, variable in self.config_variables.items():
+            if variable.definition.get("secret") and \
+                    config.get(name) is not None:
+                secrets.append(config[name])
+        return secrets
+
     @property
     def all_options(self):
         """Build and return set of all commandline options
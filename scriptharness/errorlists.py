@@ -6,14 +6,130 @@ Each line of output is matched against each substring or regular expression
 in the error list.  On a match, we determine the 'level' of that line.
 Levels are ints, and match the levels in the python logging module.  Negative
 levels are ignored.
+
+ErrorLists can be saved to, and loaded from, json or yaml descriptions; see
+load_error_list() and save_error_list().
+
+Attributes:
+  LOGGER_NAME (str): the logging.getLogger name for load_error_list()
+    cache warnings.
+  MULTILINE_KEYS (Tuple[str, ...]): the regex keys of a multi-line
+    error_check.
+  REGEX_KEYS (Tuple[str, ...]): every error_check key whose value is a
+    re.compile()d regex.
+  REGEX_ENGINES (Tuple[str, ...]): the regex engines an ErrorList can use.
+    're' is always available; 'regex' and 're2' (google-re2, which matches
+    in linear time) are used if installed.
+  REGEX_CLASSES (Tuple[class, ...]): the compiled regex classes of the
+    installed regex engines.
+  COMPILED_ERROR_LISTS (Dict[str, ErrorList]): the compiled ErrorLists that
+    load_error_list() has cached in this process, by cache path.
 """
 from __future__ import absolute_import, division, print_function, \
                        unicode_literals
+import codecs
+import hashlib
+import importlib
+import json
 import logging
+import os
 import re
 from scriptharness.exceptions import ScriptHarnessException, \
     ScriptHarnessFatal
+from scriptharness.version import __version_string__
 import six
+import sys
+import tempfile
+try:
+    import regex
+except ImportError:  # pragma: no cover
+    regex = None
+try:
+    import re2
+except ImportError:  # pragma: no cover
+    re2 = None
+try:
+    import yaml
+except ImportError:  # pragma: no cover
+    yaml = None
+
+LOGGER_NAME = 'scriptharness.errorlists'
+MULTILINE_KEYS = ('first', 'next', 'last')
+REGEX_KEYS = ('regex', 'start', 'end') + MULTILINE_KEYS
+REGEX_ENGINES = ('re', 'regex', 're2')
+COMPILED_ERROR_LISTS = {}
+
+
+# Regex engines {{{1
+def compile_re2(pattern, flags=0):
+    """Compile pattern with google-re2, translating python re flags into
+    inline flags.
+
+    Args:
+      pattern (str): the regex pattern.
+      flags (Optional[int]): python re flags.  Only re.IGNORECASE,
+        re.MULTILINE, and re.DOTALL are supported.
+
+    Returns:
+      re2 regex: the compiled regex.
+
+    Raises:
+      scriptharness.exceptions.ScriptHarnessException: if flags aren't
+        supported by re2.
+    """
+    if flags & ~(re.IGNORECASE | re.MULTILINE | re.DOTALL | re.UNICODE):
+        raise ScriptHarnessException(
+            "re2 doesn't support the flags for %s!" % pattern, flags
+        )
+    inline_flags = ''.join([
+        char for flag, char in ((re.IGNORECASE, 'i'), (re.MULTILINE, 'm'),
+                                (re.DOTALL, 's')) if flags & flag
+    ])
+    if inline_flags:
+        pattern = "(?%s)%s" % (inline_flags, pattern)
+    options = re2.Options()
+    options.log_errors = False
+    return re2.compile(pattern, options)
+
+
+def get_regex_compiler(engine):
+    """Get the compile function for a regex engine.
+
+    Args:
+      engine (str): one of REGEX_ENGINES.
+
+    Returns:
+      function: takes a pattern and optional re flags, and returns a
+        compiled regex.
+
+    Raises:
+      scriptharness.exceptions.ScriptHarnessException: if engine is unknown
+        or not installed.
+    """
+    if engine == 're':
+        return re.compile
+    if engine == 'regex' and regex is not None:
+        return regex.compile
+    if engine == 're2' and re2 is not None:
+        return compile_re2
+    raise ScriptHarnessException(
+        "Regex engine %s is unknown or not installed!" % engine
+    )
+
+
+def get_regex_classes():
+    """Get the compiled regex classes of the installed regex engines.
+
+    Returns:
+      Tuple[class, ...]: the compiled regex classes.
+    """
+    return tuple([
+        type(get_regex_compiler(engine)('')) for engine in REGEX_ENGINES
+        if engine == 're' or globals()[engine] is not None
+    ])
+
+
+REGEX_CLASSES = get_regex_classes()
 
 
 # ErrorList helper methods {{{1
@@ -110,9 +226,247 @@ def check_context_lines(context_lines, orig_context_lines, name, messages):
     return max(context_lines, orig_context_lines)
 
 
+def check_block(error_check, re_compile_class, messages):
+    """Validate a block error_check, which has 'start' and 'end' regexes
+    instead of 'substr' or 'regex'.
+
+    Block error_checks don't support context lines, since the whole block is
+    buffered and re-leveled when it closes.  They also don't support
+    exceptions, since those would fire before the block is closed.
+
+    Args:
+      error_check (Dict[str, str or regex]): a single item of error_list.
+
+      re_compile_class (class): the class of re.compile()d regexes.
+
+      messages (List[str]): The error messages so far.
+    """
+    error_check_str = six.text_type(error_check)
+    for key in ('start', 'end'):
+        if not isinstance(error_check.get(key), re_compile_class):
+            messages.append(
+                "%s %s needs to be re.compile'd!" % (error_check_str, key)
+            )
+    for key in ('substr', 'regex', 'exception', 'pre_context_lines',
+                'post_context_lines'):
+        if key in error_check:
+            messages.append(
+                "%s block error_checks don't support '%s'!" %
+                (error_check_str, key)
+            )
+    verify_unicode('explanation', error_check, messages)
+
+def describe_error_check(error_check):
+    """Build a short human-readable description of an error_check, for
+    logging and profiling.
+
+    Args:
+      error_check (Dict[str, str or regex]): a single item of error_list.
+
+    Returns:
+      str: the substr, the regex pattern, or the start and end patterns.
+    """
+    if 'substr' in error_check:
+        return "substr %s" % error_check['substr']
+    elif 'regex' in error_check:
+        return "regex %s" % error_check['regex'].pattern
+    elif 'first' in error_check:
+        description = "multiline %s ... %s" % (error_check['first'].pattern,
+                                               error_check['next'].pattern)
+        if 'last' in error_check:
+            description += " ... %s" % error_check['last'].pattern
+        return description
+    return "block %s ... %s" % (error_check['start'].pattern,
+                                error_check['end'].pattern)
+
+
+def check_multiline(error_check, re_compile_class, messages):
+    """Validate a multi-line error_check, which has 'first', 'next', and
+    optionally 'last' regexes instead of 'substr' or 'regex'.
+
+    Multi-line error_checks don't support exceptions, since the event
+    isn't complete until we see a line that doesn't match 'next'.
+
+    Args:
+      error_check (Dict[str, str or regex]): a single item of error_list.
+
+      re_compile_class (class): the class of re.compile()d regexes.
+
+      messages (List[str]): The error messages so far.
+    """
+    error_check_str = six.text_type(error_check)
+    for key in MULTILINE_KEYS:
+        if key == 'last' and key not in error_check:
+            continue
+        if not isinstance(error_check.get(key), re_compile_class):
+            messages.append(
+                "%s %s needs to be re.compile'd!" % (error_check_str, key)
+            )
+    for key in ('substr', 'regex', 'exception'):
+        if key in error_check:
+            messages.append(
+                "%s multi-line error_checks don't support '%s'!" %
+                (error_check_str, key)
+            )
+
+
+# ErrorList serialization helpers {{{1
+def get_exception_name(exception):
+    """Get the dotted name of an exception class, for serialization.
+
+    Args:
+      exception (class): the exception class.
+
+    Returns:
+      str: e.g. "scriptharness.exceptions.ScriptHarnessFatal"
+    """
+    return "%s.%s" % (exception.__module__, exception.__name__)
+
+
+def get_exception_class(name):
+    """Import an exception class by its dotted name.
+
+    Args:
+      name (str): the dotted name, e.g.
+        "scriptharness.exceptions.ScriptHarnessFatal"
+
+    Returns:
+      class: the exception class.
+
+    Raises:
+      scriptharness.exceptions.ScriptHarnessException: if the name can't
+        be imported.
+    """
+    module_name, _, attr = name.rpartition('.')
+    try:
+        return getattr(importlib.import_module(module_name), attr)
+    except (ImportError, AttributeError, ValueError) as exc_info:
+        raise ScriptHarnessException(
+            "Can't import exception %s!" % name, exc_info
+        )
+
+
+def error_check_to_description(error_check):
+    """Translate an error_check into a json-serializable dict.
+
+    Regexes are stored as pattern strings.  Regexes with flags are stored as
+    {"pattern": pattern, "flags": flags}.  Exceptions are stored as
+    dotted names.
+
+    Args:
+      error_check (Dict[str, str or regex]): a single item of error_list.
+
+    Returns:
+      Dict[str, Any]: the description.
+    """
+    # re2 regexes have no flags; compile_re2() makes them inline flags.
+    supported_flags = re.IGNORECASE | re.LOCALE | re.MULTILINE | \
+        re.DOTALL | re.VERBOSE
+    description = {}
+    for key, value in error_check.items():
+        if key in REGEX_KEYS:
+            flags = int(getattr(value, 'flags', 0) & supported_flags)
+            if flags:
+                value = {'pattern': value.pattern, 'flags': flags}
+            else:
+                value = value.pattern
+        elif key == 'exception':
+            value = get_exception_name(value)
+        description[key] = value
+    return description
+
+
+def error_check_from_description(description):
+    """Translate a description from error_check_to_description() back into
+    an error_check.
+
+    Args:
+      description (Dict[str, Any]): the description.
+
+    Returns:
+      Dict[str, str or regex]: the error_check.
+
+    Raises:
+      scriptharness.exceptions.ScriptHarnessException: if a regex doesn't
+        compile or an exception can't be imported.
+    """
+    error_check = {}
+    for key, value in description.items():
+        if key in REGEX_KEYS:
+            if isinstance(value, dict):
+                pattern, flags = value.get('pattern'), value.get('flags', 0)
+            else:
+                pattern, flags = value, 0
+            try:
+                value = re.compile(pattern, flags)
+            except (re.error, TypeError) as exc_info:
+                raise ScriptHarnessException(
+                    "Can't compile %s %s!" % (key, pattern), exc_info
+                )
+        elif key == 'exception':
+            value = get_exception_class(value)
+        error_check[key] = value
+    return error_check
+
+
+def compile_error_check(error_check, compiler, messages):
+    """Recompile the regexes in error_check with another regex engine.
+
+    Args:
+      error_check (Dict[str, str or regex]): a single validated item of
+        error_list.
+
+      compiler (function): the regex engine's compile function, from
+        get_regex_compiler().
+
+      messages (List[str]): The error messages so far.
+
+    Returns:
+      Dict[str, str or regex]: a copy of error_check, or error_check itself
+        if its regexes already use this engine.
+    """
+    compiled_class = type(compiler(''))
+    new_error_check = error_check
+    for key in REGEX_KEYS:
+        value = error_check.get(key)
+        if value is None or isinstance(value, compiled_class):
+            continue
+        if new_error_check is error_check:
+            new_error_check = dict(error_check)
+        try:
+            new_error_check[key] = compiler(value.pattern,
+                                            getattr(value, 'flags', 0))
+        except Exception as exc_info:  # pylint: disable=broad-except
+            messages.append(
+                "%s %s can't be compiled: %s" %
+                (six.text_type(error_check), key, six.text_type(exc_info))
+            )
+    return new_error_check
+
+
+def restore_error_list(error_checks, attributes):
+    """Recreate an ErrorList from already validated and compiled
+    error_checks, without revalidating or recompiling them.
+
+    This is used to unpickle and copy ErrorLists, and to copy the cached
+    ErrorLists in load_error_list().
+
+    Args:
+      error_checks (List[Dict[str, str or regex]]): the error_checks.
+      attributes (Dict[str, Any]): the ErrorList's __dict__.
+
+    Returns:
+      ErrorList: the restored error_list.
+    """
+    error_list = ErrorList.__new__(ErrorList)
+    list.extend(error_list, error_checks)
+    error_list.__dict__.update(attributes)
+    return error_list
+
+
 # ErrorList {{{1
 class ErrorList(list):
-    """Error lists, to describe how to parse output.  In object form for
+    r"""Error lists, to describe how to parse output.  In object form for
     better validation.
 
     An example error_list::
@@ -141,24 +495,204 @@ class ErrorList(list):
     The second regex sets the level to logging.ERROR for this line, and 5
     lines above and 5 lines below this message.
 
-    Currently undecided whether we should support modification of ErrorLists
-    (which would require validating any new items and recalculating pre
-    and post context_lines) or having ErrorList inherit tuple and dealing
-    with all the renaming.  Most likely the former, but until then, the
-    supported way of modifying an ErrorList is to create a new one.
+    A block error_check has 'start' and 'end' regexes instead of 'substr' or
+    'regex'::
+
+        {
+            "start": re.compile(r"^\d+>------ Build started"),
+            "end": re.compile(r"^\d+>.* - \d+ error\(s\)"),
+            "level": logging.INFO,
+        }
+
+    Every line from the 'start' line through the 'end' line is buffered,
+    and parsed as usual by the other error_checks.  When the block closes,
+    each line in the block is logged at the worst level seen in the block
+    (or 'level', if that's higher).  So a single error in a project's build
+    output marks the whole project's output as an error.  Large blocks are
+    spilled to disk; see scriptharness.log.SpanBuffer.
+
+    A multi-line error_check matches a single event that spans several
+    lines, like a python traceback::
+
+        {
+            "first": re.compile(r"^Traceback \(most recent call last\)"),
+            "next": re.compile(r"^\s"),
+            "last": re.compile(r"^\w+(Error|Exception)"),
+            "level": logging.ERROR,
+        }
+
+    The event starts with a line matching 'first'.  Each following line
+    matching 'next' is part of the event.  The event ends after a line
+    matching the optional 'last', or before the first line that matches
+    neither.  The whole event is logged at 'level' and counted once.
+
+    ErrorLists can be translated to and from json-serializable descriptions
+    with to_description() and from_description(); regexes are stored as
+    pattern strings, and exceptions as dotted names.
+
+    ErrorLists can be modified with append(), extend(), insert(), +, and
+    +=.  Only the new error_checks are validated, and pre_context_lines and
+    post_context_lines are updated to match::
+
+        error_list = MAKE_ERROR_LIST + [
+            {"substr": "my project-specific error", "level": logging.ERROR},
+        ]
+
+    Other modifications, like item assignment, bypass validation and aren't
+    supported.  Removing error_checks leaves pre_context_lines and
+    post_context_lines as they were, which is harmless.
+
+    Each ErrorList uses a single regex engine, 're' by default.  Patterns are
+    written with re.compile() and validated as usual, then recompiled with
+    the chosen engine::
+
+        error_list = ErrorList(MAKE_ERROR_LIST, engine='re2')
+
+    re2 matches in linear time, so patterns that backtrack badly on long
+    lines can't stall the parser, but it doesn't support backreferences or
+    lookaround.
 
     Attributes:
       strict (bool): If True, be more strict about well-formed error_lists.
+      engine (str): The regex engine, one of REGEX_ENGINES.
       pre_context_lines (int): The max number of lines the error_list defines
         in pre_context_lines.
       post_context_lines (int): The max number of lines the error_list defines
         in post_context_lines.
     """
-    def __init__(self, error_list, strict=True):
+    def __init__(self, error_list, strict=True, engine='re'):
         self.strict = strict
+        self.engine = engine
         (self.pre_context_lines, self.post_context_lines) = \
             self.validate_error_list(error_list)
-        super(ErrorList, self).__init__(error_list)
+        super(ErrorList, self).__init__(self.compile_error_list(error_list))
+
+    def __reduce__(self):
+        """Pickle and copy without revalidating; see restore_error_list().
+        """
+        return (restore_error_list, (list(self), dict(self.__dict__)))
+
+    def _validate_additions(self, error_checks):
+        """Validate new error_checks, and update pre_context_lines and
+        post_context_lines to include them.
+
+        Args:
+          error_checks (List[Dict[str, str or regex]]): the new
+            error_checks.
+
+        Returns:
+          List[Dict[str, str or regex]]: the validated error_checks.
+
+        Raises:
+          scriptharness.exceptions.ScriptHarnessException: if error_checks
+            are not well-formed.
+        """
+        error_checks = list(error_checks)
+        pre_context_lines, post_context_lines = \
+            self.validate_error_list(error_checks)
+        error_checks = self.compile_error_list(error_checks)
+        self.pre_context_lines = max(self.pre_context_lines,
+                                     pre_context_lines)
+        self.post_context_lines = max(self.post_context_lines,
+                                      post_context_lines)
+        return error_checks
+
+    def append(self, error_check):
+        """Validate error_check and append it.
+
+        Args:
+          error_check (Dict[str, str or regex]): the new error_check.
+        """
+        super(ErrorList, self).append(
+            self._validate_additions([error_check])[0]
+        )
+
+    def extend(self, error_checks):
+        """Validate error_checks and append them.
+
+        Args:
+          error_checks (List[Dict[str, str or regex]]): the new
+            error_checks.
+        """
+        super(ErrorList, self).extend(self._validate_additions(error_checks))
+
+    def insert(self, index, error_check):
+        """Validate error_check and insert it before index.
+
+        Args:
+          index (int): the index to insert before.
+          error_check (Dict[str, str or regex]): the new error_check.
+        """
+        super(ErrorList, self).insert(
+            index, self._validate_additions([error_check])[0]
+        )
+
+    def __add__(self, error_checks):
+        """Return a new ErrorList, without revalidating this one.
+        """
+        error_list = restore_error_list(list(self), dict(self.__dict__))
+        error_list.extend(error_checks)
+        return error_list
+
+    def __iadd__(self, error_checks):
+        self.extend(error_checks)
+        return self
+
+    def compile_error_list(self, error_list):
+        """Recompile the regexes in a validated error_list with self.engine.
+
+        Args:
+          error_list (List[Dict[str, str or regex]]): the validated
+            error_checks.
+
+        Returns:
+          List[Dict[str, str or regex]]: the compiled error_checks.
+
+        Raises:
+          scriptharness.exceptions.ScriptHarnessException: if self.engine
+            isn't available, or can't compile a regex.
+        """
+        compiler = get_regex_compiler(self.engine)
+        messages = []
+        error_list = [compile_error_check(x, compiler, messages)
+                      for x in error_list]
+        if messages:
+            raise ScriptHarnessException(messages)
+        return error_list
+
+    @classmethod
+    def from_description(cls, description, strict=True, engine='re'):
+        """Create an ErrorList from a list of descriptions, as returned by
+        to_description().
+
+        Args:
+          description (List[Dict[str, Any]]): the error_check descriptions.
+          strict (Optional[bool]): passed to ErrorList.
+          engine (Optional[str]): passed to ErrorList.
+
+        Returns:
+          ErrorList: the validated error_list.
+
+        Raises:
+          scriptharness.exceptions.ScriptHarnessException: if description is
+            not well-formed.
+        """
+        if not isinstance(description, list):
+            raise ScriptHarnessException(
+                "ErrorList description must be a list!", description
+            )
+        return cls([
+            error_check_from_description(x) if isinstance(x, dict) else x
+            for x in description
+        ], strict=strict, engine=engine)
+
+    def to_description(self):
+        """Translate the ErrorList into a json-serializable list.
+
+        Returns:
+          List[Dict[str, Any]]: the error_check descriptions.
+        """
+        return [error_check_to_description(x) for x in self]
 
     def validate_error_list(self, error_list):
         """Validate an error_list.
@@ -175,8 +709,7 @@ class ErrorList(list):
             well-formed.
         """
         messages = []
-        context_lines_re = re.compile(r'^(\d+):(\d+)')
-        re_compile_class = context_lines_re.__class__
+        re_compile_class = REGEX_CLASSES
         pre_context_lines = 0
         post_context_lines = 0
         for error_check in error_list:
@@ -204,7 +737,13 @@ class ErrorList(list):
                     "%s exception must be a subclass of Exception!" %
                     error_check_str
                 )
-            exactly_one('substr', 'regex', error_check, messages)
+            if 'start' in error_check or 'end' in error_check:
+                check_block(error_check, re_compile_class, messages)
+                continue
+            if set(MULTILINE_KEYS).intersection(error_check):
+                check_multiline(error_check, re_compile_class, messages)
+            else:
+                exactly_one('substr', 'regex', error_check, messages)
             verify_unicode('substr', error_check, messages)
             if 'regex' in error_check and not \
                     isinstance(error_check['regex'], re_compile_class):
@@ -237,6 +776,251 @@ class ErrorList(list):
         return (pre_context_lines, post_context_lines)
 
 
+# load_error_list and save_error_list {{{1
+def is_yaml_path(path):
+    """Determine whether path is a yaml file, by extension.
+
+    Args:
+      path (str): the path to check.
+
+    Returns:
+      bool: True if path ends in .yaml or .yml
+    """
+    return os.path.splitext(path)[1].lower() in ('.yaml', '.yml')
+
+
+def save_error_list(error_list, path):
+    """Save error_list to path as json, or as yaml if path ends in .yaml or
+    .yml
+
+    Args:
+      error_list (ErrorList): the error_list to save.
+      path (str): the path to write to.
+
+    Raises:
+      scriptharness.exceptions.ScriptHarnessException: if path is yaml and
+        yaml isn't installed.
+    """
+    description = error_list.to_description()
+    if is_yaml_path(path):
+        if yaml is None:
+            raise ScriptHarnessException("yaml isn't installed!")
+        contents = yaml.safe_dump(description, default_flow_style=False,
+                                  allow_unicode=True)
+    else:
+        contents = json.dumps(description, sort_keys=True, indent=4)
+    with codecs.open(path, 'w', encoding='utf-8') as filehandle:
+        filehandle.write(contents)
+
+
+def get_cache_key(contents, strict, engine='re'):
+    """Get the cache key for a validated error list.
+
+    The key covers the contents, strictness, regex engine, and the python and
+    scriptharness versions, since validation may differ between them.
+
+    Args:
+      contents (bytes): the contents of the error list file.
+      strict (bool): the ErrorList strict setting.
+      engine (Optional[str]): the ErrorList regex engine.
+
+    Returns:
+      str: the sha256 hexdigest.
+    """
+    sha = hashlib.sha256(contents)
+    sha.update(six.text_type(
+        (strict, engine, sys.version_info[:2], __version_string__)
+    ).encode('utf-8'))
+    return sha.hexdigest()
+
+
+def get_cache_path(contents, cache_dir, strict, engine='re'):
+    """Get the cache path for a validated error list.
+
+    Args:
+      contents (bytes): the contents of the error list file.
+      cache_dir (str): the cache directory.
+      strict (bool): the ErrorList strict setting.
+      engine (Optional[str]): the ErrorList regex engine.
+
+    Returns:
+      str: the path to the cache file, named after get_cache_key().
+    """
+    return os.path.join(cache_dir, "%s.json" % get_cache_key(
+        contents, strict, engine=engine
+    ))
+
+
+def get_cache_checksum(cache):
+    """Get the checksum of a cache file's ErrorList.
+
+    Args:
+      cache (Dict[str, Any]): the cache file contents.
+
+    Returns:
+      str: the sha256 hexdigest of the description and context lines.
+    """
+    return hashlib.sha256(json.dumps({
+        'description': cache['description'],
+        'pre_context_lines': cache['pre_context_lines'],
+        'post_context_lines': cache['post_context_lines'],
+    }, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def replace_file(src, dst):
+    """Rename src to dst, replacing dst if it exists.
+
+    os.rename() can't replace an existing file on Windows, and python 2
+    doesn't have os.replace().
+
+    Args:
+      src (str): the path to rename.
+      dst (str): the new path.
+    """
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)  # pylint: disable=no-member
+        return
+    try:
+        os.rename(src, dst)
+    except OSError:
+        os.remove(dst)
+        os.rename(src, dst)
+
+
+def read_error_list_cache(cache_path, strict, engine):
+    """Read an ErrorList cached by write_error_list_cache(), without
+    revalidating it.
+
+    The cache is json, so a cache file can't run code.  Since it isn't
+    revalidated, it's only used if its key matches its file name, i.e. the
+    error list contents and settings, and its checksum matches its
+    contents.  The regexes are compiled on read, since compiled regexes
+    can't be stored as json.
+
+    Args:
+      cache_path (str): the path to the cache file.
+      strict (bool): the ErrorList strict setting.
+      engine (str): the ErrorList regex engine.
+
+    Returns:
+      ErrorList: the error_list, or None if the cache is missing, or
+        corrupt or incompatible, in which case it's logged and ignored.
+    """
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with codecs.open(cache_path, 'r', encoding='utf-8') as filehandle:
+            cache = json.load(filehandle)
+        key = os.path.splitext(os.path.basename(cache_path))[0]
+        if cache['key'] != key:
+            raise ValueError("key %s doesn't match!" % cache['key'])
+        if cache['checksum'] != get_cache_checksum(cache):
+            raise ValueError("checksum doesn't match!")
+        error_list = restore_error_list([], {
+            'strict': strict, 'engine': engine,
+            'pre_context_lines': int(cache['pre_context_lines']),
+            'post_context_lines': int(cache['post_context_lines']),
+        })
+        list.extend(error_list, error_list.compile_error_list(
+            [error_check_from_description(x) for x in cache['description']]
+        ))
+        return error_list
+    except (IOError, OSError, ValueError, KeyError, TypeError,
+            AttributeError, ScriptHarnessException) as exc_info:
+        logging.getLogger(LOGGER_NAME).warning(
+            "Ignoring the ErrorList cache %s: %s", cache_path,
+            six.text_type(exc_info)
+        )
+        return None
+
+
+def write_error_list_cache(error_list, cache_path):
+    """Cache a validated ErrorList as json, for read_error_list_cache().
+
+    Args:
+      error_list (ErrorList): the validated error_list.
+      cache_path (str): the path to the cache file.
+    """
+    cache_dir = os.path.dirname(cache_path)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    # Write to a temp file and rename, so concurrent loads never see a
+    # partial cache file.
+    cache = {
+        'key': os.path.splitext(os.path.basename(cache_path))[0],
+        'description': error_list.to_description(),
+        'pre_context_lines': error_list.pre_context_lines,
+        'post_context_lines': error_list.post_context_lines,
+    }
+    cache['checksum'] = get_cache_checksum(cache)
+    filehandle, tmp_path = tempfile.mkstemp(dir=cache_dir)
+    with codecs.getwriter('utf-8')(os.fdopen(filehandle, 'wb')) as filehandle:
+        filehandle.write(json.dumps(cache))
+    replace_file(tmp_path, cache_path)
+
+
+def load_error_list(path, strict=True, cache_dir=None, engine='re'):
+    """Load an ErrorList from a json or yaml file written by
+    save_error_list().
+
+    If cache_dir is set, the validated ErrorList is cached there as json,
+    keyed by a hash of the file contents, so later loads skip validation.
+    The compiled ErrorList is also kept in COMPILED_ERROR_LISTS, so later
+    loads in the same process skip compiling too; each load returns a
+    copy, so modifying it doesn't change the cached ErrorList.
+
+    Args:
+      path (str): the path to the json or yaml file.
+      strict (Optional[bool]): passed to ErrorList.
+      cache_dir (Optional[str]): the directory to cache validated
+        ErrorLists in.
+      engine (Optional[str]): passed to ErrorList.
+
+    Returns:
+      ErrorList: the error_list.
+
+    Raises:
+      scriptharness.exceptions.ScriptHarnessException: if path can't be read
+        or parsed, or isn't a valid ErrorList.
+    """
+    try:
+        with open(path, 'rb') as filehandle:
+            contents = filehandle.read()
+    except (IOError, OSError) as exc_info:
+        raise ScriptHarnessException("Can't open path %s!" % path, exc_info)
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = get_cache_path(contents, cache_dir, strict,
+                                    engine=engine)
+        error_list = COMPILED_ERROR_LISTS.get(cache_path)
+        if error_list is None:
+            error_list = read_error_list_cache(cache_path, strict, engine)
+        if error_list is not None:
+            COMPILED_ERROR_LISTS[cache_path] = error_list
+            return restore_error_list(list(error_list),
+                                      dict(error_list.__dict__))
+    text = contents.decode('utf-8')
+    if is_yaml_path(path):
+        if yaml is None:
+            raise ScriptHarnessException("yaml isn't installed!")
+        try:
+            description = yaml.safe_load(text)
+        except yaml.YAMLError as exc_info:
+            raise ScriptHarnessException("Can't parse %s!" % path, exc_info)
+    else:
+        try:
+            description = json.loads(text)
+        except ValueError as exc_info:
+            raise ScriptHarnessException("Can't parse %s!" % path, exc_info)
+    error_list = ErrorList.from_description(description, strict=strict,
+                                            engine=engine)
+    if cache_path is not None:
+        write_error_list_cache(error_list, cache_path)
+        COMPILED_ERROR_LISTS[cache_path] = error_list
+        return restore_error_list(list(error_list), dict(error_list.__dict__))
+    return error_list
+
+
 # ErrorLists {{{1
 # These are largely taken from mozharness, and are posix system oriented.
 SSH_ERROR_LIST = ErrorList([
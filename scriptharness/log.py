@@ -8,23 +8,121 @@ Attributes:
   DEFAULT_DATEFMT (str): default logging date format
   DEFAULT_FMT (str): default logging format
   DEFAULT_LEVEL (int): default logging level
+  DEFAULT_SPAN_BYTES (int): default SpanBuffer memory budget before spilling
+    to disk
+  PROFILE_FMT (str): the format of each line of the OutputParser profile
+    table
+  AGGREGATE_PATH_RE (regex): the paths masked by normalize_line()
+  AGGREGATE_NUMBER_RE (regex): the numbers masked by normalize_line()
+  AGGREGATE_FMT (str): the format of each line of the OutputParser repeated
+    warning summary
+  DEFAULT_QUEUE_SIZE (int): the default max number of queued records for
+    prepare_async_logging()
+  OVERFLOW_POLICIES (Tuple[str, ...]): what AsyncQueueHandler does when its
+    queue is full: 'block' until there's room, 'drop-info' to drop records
+    at logging.INFO and below, or 'sample' to keep one of every sample_rate
+    records at logging.INFO and below.  Records above logging.INFO always
+    block.
+  LOG_CONTEXT (Dict[str, Any]): the script_name, action_name and command_id
+    that JsonLinesFormatter adds to each record; see log_context().  This is
+    process-wide rather than per-thread, since scripts run their actions
+    and commands serially.
+  JSON_FIELDS (Tuple[Tuple[str, str], ...]): the (json key, LogRecord
+    attribute) pairs JsonLinesFormatter writes, in order.
+  DEFAULT_BUFFER_SIZE (int): the default number of characters a
+    BufferedFileHandler buffers before writing
+  DEFAULT_FLUSH_INTERVAL (float): the default max number of seconds a
+    BufferedFileHandler holds records before writing
+  FATAL_SIGNALS (Tuple[int, ...]): the signals that flush every
+    BufferedFileHandler before the process dies
+  BUFFERED_HANDLERS (weakref.WeakSet): the open BufferedFileHandlers that
+    buffer records
+  PREVIOUS_SIGNAL_HANDLERS (Dict[int, Any]): the signal handlers that
+    install_signal_flush() replaced
+  MANIFEST_SUFFIX (str): appended to a RotatingLogHandler's path for the
+    path of its segment manifest
+  SEGMENT_INDEX_SUFFIX (str): appended to an IndexedFileHandler's path for
+    the path of its action and command index
+  DEFAULT_RING_CAPACITY (int): the default number of records a RingHandler
+    keeps per logger
+  RING_HANDLERS (weakref.WeakSet): the open RingHandlers
+  DEFAULT_SUMMARY_INTERVAL (float): the default min number of seconds
+    between a RateLimitFilter's "suppressed N records" summaries
+  RATE_LIMIT_OPTIONS (Tuple[str, ...]): the RateLimitFilter options that
+    the scriptharness_log_filters config can set
+  RATE_LIMIT_FILTERS (weakref.WeakSet): the RateLimitFilters created via
+    get_rate_limit_filter()
 """
 
 from __future__ import absolute_import, division, print_function, \
                        unicode_literals
-from copy import deepcopy
+import codecs
+from collections import deque
+from contextlib import contextmanager
+from copy import copy, deepcopy
+from itertools import islice
+from operator import attrgetter
+import gzip
+import json
 import logging
 import os
+import re
+from scriptharness.errorlists import describe_error_check
 from scriptharness.exceptions import ScriptHarnessException
 from scriptharness.os import make_parent_dir
 from scriptharness.unicode import to_unicode
+import shutil
+import signal
 import six
+from six.moves import queue
+import tempfile
+import threading
 import time
+from timeit import default_timer
+import weakref
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
 
 LOGGER_NAME = "scriptharness.log"
 DEFAULT_DATEFMT = '%H:%M:%S'
 DEFAULT_FMT = '%(asctime)s %(levelname)8s - %(message)s'
 DEFAULT_LEVEL = logging.INFO
+DEFAULT_SPAN_BYTES = 1024 * 1024
+PROFILE_FMT = '%(index)5s %(evaluations)12s %(hits)10s %(time)12s  %(check)s'
+AGGREGATE_PATH_RE = re.compile(r'(?:[A-Za-z]:)?[\\/]?(?:[\w.~-]+[\\/])+[\w.~-]*')
+AGGREGATE_NUMBER_RE = re.compile(r'\d+')
+AGGREGATE_FMT = '%(count)8s  %(line)s'
+DEFAULT_QUEUE_SIZE = 10000
+OVERFLOW_POLICIES = ('block', 'drop-info', 'sample')
+LOG_CONTEXT = {}
+JSON_FIELDS = (
+    ('timestamp', 'created'),
+    ('level', 'levelname'),
+    ('logger', 'name'),
+    ('script', 'script_name'),
+    ('action', 'action_name'),
+    ('command_id', 'command_id'),
+    ('message', 'message'),
+    ('error_check', 'error_check'),
+    ('exception', 'exc_text'),
+)
+DEFAULT_BUFFER_SIZE = 64 * 1024
+DEFAULT_FLUSH_INTERVAL = 5.0
+FATAL_SIGNALS = tuple(
+    getattr(signal, x) for x in ('SIGTERM', 'SIGHUP', 'SIGQUIT')
+    if hasattr(signal, x)
+)
+BUFFERED_HANDLERS = weakref.WeakSet()
+PREVIOUS_SIGNAL_HANDLERS = {}
+MANIFEST_SUFFIX = '.manifest.json'
+SEGMENT_INDEX_SUFFIX = '.segments.jsonl'
+DEFAULT_RING_CAPACITY = 1000
+RING_HANDLERS = weakref.WeakSet()
+DEFAULT_SUMMARY_INTERVAL = 60.0
+RATE_LIMIT_OPTIONS = ('rate', 'burst', 'sample', 'level', 'summary_interval')
+RATE_LIMIT_FILTERS = weakref.WeakSet()
 
 
 # UnicodeFormatter {{{1
@@ -43,6 +141,219 @@ class UnicodeFormatter(logging.Formatter):
         return string
 
 
+class CachedFormatter(UnicodeFormatter):
+    """A faster UnicodeFormatter for %-style formats.
+
+    Date formats are second-resolution, so the formatted timestamp is
+    cached and only rebuilt when a record's second changes.  The format is
+    precompiled into a positional format string plus an attrgetter for the
+    record attributes it uses, which skips logging.Formatter's per-record
+    usesTime() search and dict-based formatting.
+
+    The output is identical to UnicodeFormatter's.
+
+    Attributes:
+      fast_fmt (str): self._fmt with each %(name) replaced by %.
+      fields (Tuple[str, ...]): the record attributes fast_fmt uses.
+      uses_time (bool): whether the format uses %(asctime).
+      time_cache (Tuple[int, str]): the last formatted second, and its
+        formatted timestamp.
+    """
+    def __init__(self, fmt=None, datefmt=None):
+        super(CachedFormatter, self).__init__(fmt=fmt, datefmt=datefmt)
+        fmt = fmt or '%(message)s'
+        fields = []
+
+        def replace_field(match):
+            """Record the field name and drop it from the format."""
+            if match.group(1) is None:
+                return match.group(0)
+            fields.append(match.group(1))
+            return '%'
+
+        self.fast_fmt = re.sub(r'%%|%\((\w+)\)', replace_field, fmt)
+        self.fields = tuple(fields)
+        self.uses_time = 'asctime' in self.fields
+        self.time_cache = (None, None)
+        if self.fields:
+            getter = attrgetter(*self.fields)
+            if len(self.fields) == 1:
+                self._get_values = lambda record: (getter(record), )
+            else:
+                self._get_values = getter
+        else:
+            self._get_values = lambda record: ()
+
+    def formatTime(self, record, datefmt=None):
+        """Format the record's timestamp, reusing the cached string if it's
+        from the same second as the previous record.
+
+        Args:
+          record (logging.LogRecord): the record to format.
+          datefmt (Optional[str]): the strftime format.  If None, use the
+            logging module default, with milliseconds.
+
+        Returns:
+          str: the formatted timestamp.
+        """
+        second = int(record.created)
+        cached_second, string = self.time_cache
+        if cached_second != second:
+            string = time.strftime(
+                datefmt or getattr(self, 'default_time_format',
+                                   '%Y-%m-%d %H:%M:%S'),
+                self.converter(record.created)
+            )
+            self.time_cache = (second, string)
+        if datefmt:
+            return string
+        return getattr(self, 'default_msec_format', '%s,%03d') % (
+            string, record.msecs
+        )
+
+    def format(self, record):
+        """Format the record with the precompiled format.
+
+        Args:
+          record (logging.LogRecord): the record to format.
+
+        Returns:
+          str: the formatted record.
+        """
+        record.message = record.getMessage()
+        if self.uses_time:
+            record.asctime = self.formatTime(record, self.datefmt)
+        string = self.fast_fmt % self._get_values(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            if string[-1:] != "\n":
+                string = string + "\n"
+            string = string + record.exc_text
+        if getattr(record, 'stack_info', None):
+            if string[-1:] != "\n":
+                string = string + "\n"
+            string = string + self.formatStack(record.stack_info)
+        if six.PY2 and isinstance(string, six.text_type):
+            string = string.encode(self.encoding, 'replace')
+        return string
+
+
+# Structured logging {{{1
+@contextmanager
+def log_context(**kwargs):
+    """Set LOG_CONTEXT keys for the duration of the with block, then restore
+    the previous values.
+
+    Args:
+      **kwargs: the LOG_CONTEXT keys to set, e.g. action_name.
+    """
+    previous = dict((key, LOG_CONTEXT.get(key)) for key in kwargs)
+    LOG_CONTEXT.update(kwargs)
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                LOG_CONTEXT.pop(key, None)
+            else:
+                LOG_CONTEXT[key] = value
+
+
+def add_log_context(record):
+    """Copy LOG_CONTEXT into record's attributes, unless the record already
+    has them (e.g. from logger.log(..., extra={...})).
+
+    Args:
+      record (logging.LogRecord): the record to update.
+    """
+    for key, value in LOG_CONTEXT.items():
+        if not hasattr(record, key):
+            setattr(record, key, value)
+
+
+def prepare_record(record):
+    """Copy a record, merging its log context, args and exception into it,
+    so it can be formatted later or in another thread.
+
+    The args are formatted into the message now, so later changes to
+    mutable args don't show up, and the exception is formatted into
+    exc_text, so the traceback and its frames can be freed.
+
+    Args:
+      record (logging.LogRecord): the record to prepare.
+
+    Returns:
+      logging.LogRecord: a prepared copy of record.
+    """
+    record = copy(record)
+    add_log_context(record)
+    record.msg = record.getMessage()
+    record.args = None
+    if record.exc_info:
+        record.exc_text = logging.Formatter().formatException(
+            record.exc_info
+        )
+        record.exc_info = None
+    return record
+
+
+def encode_json_value(value):
+    """Serialize a single str, int, float, or None value as json.
+
+    Args:
+      value (str, int, float, or None): the value to serialize.
+
+    Returns:
+      str: the json representation of value.
+    """
+    if value is None:
+        return 'null'
+    if isinstance(value, six.string_types):
+        return json.encoder.encode_basestring_ascii(to_unicode(value))
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, six.integer_types):
+        return six.text_type(value)
+    if isinstance(value, float):
+        return repr(value)
+    return json.encoder.encode_basestring_ascii(six.text_type(value))
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Format each record as a single line of json, with the keys in
+    JSON_FIELDS.
+
+    The record values are all strings, numbers or None, so rather than
+    building a dict for json.dumps() we serialize each value and join them
+    into a precomputed template.  If orjson is installed, it's used instead.
+    """
+    template = '{%s}' % ', '.join(
+        ['"%s": %%s' % key for key, _ in JSON_FIELDS]
+    )
+
+    def format(self, record):
+        """Serialize the record.
+
+        Args:
+          record (logging.LogRecord): the record to format.
+
+        Returns:
+          str: a json object, without a trailing newline.
+        """
+        add_log_context(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        values = [getattr(record, attr, None) for _, attr in JSON_FIELDS]
+        if orjson is not None:
+            return orjson.dumps(
+                dict(zip([key for key, _ in JSON_FIELDS], values)),
+                default=six.text_type
+            ).decode('utf-8')
+        return self.template % tuple([encode_json_value(x) for x in values])
+
+
 # logging helper methods {{{1
 def get_formatter(fmt=DEFAULT_FMT, datefmt=DEFAULT_DATEFMT):
     """Create a unicode-friendly formatter to add to logging handlers.
@@ -52,14 +363,15 @@ def get_formatter(fmt=DEFAULT_FMT, datefmt=DEFAULT_DATEFMT):
       datefmt (Optional[str]): date format for the log message.
 
     Returns:
-      UnicodeFormatter to add to a handler - handler.setFormatter(formatter)
+      CachedFormatter to add to a handler - handler.setFormatter(formatter)
     """
-    formatter = UnicodeFormatter(fmt=fmt, datefmt=datefmt)
+    formatter = CachedFormatter(fmt=fmt, datefmt=datefmt)
     return formatter
 
 
 def prepare_simple_logging(path, mode='w', logger_name='', level=DEFAULT_LEVEL,
-                           formatter=None):
+                           formatter=None, buffered=False, max_bytes=None,
+                           per_action=False, indexed=False):
     """Create a unicode-friendly logger.
 
     By default it'll create the root logger with a console handler; if passed
@@ -78,6 +390,14 @@ def prepare_simple_logging(path, mode='w', logger_name='', level=DEFAULT_LEVEL,
       level (Optional[int]): the level to log.  Default DEFAULT_LEVEL
       formatter (Optional[Formatter]): a logging Formatter to use; to handle
         unicode, subclass UnicodeFormatter.
+      buffered (Optional[bool]): use a BufferedFileHandler for the file log.
+        Default False
+      max_bytes (Optional[int]): rotate the file log when it reaches this
+        many bytes.  Default None
+      per_action (Optional[bool]): rotate the file log when the action
+        changes.  Default False
+      indexed (Optional[bool]): index where each action and command starts
+        and ends in the file log.  Default False
 
     Returns:
         logger (Logger object).  This is also easily retrievable via
@@ -87,12 +407,76 @@ def prepare_simple_logging(path, mode='w', logger_name='', level=DEFAULT_LEVEL,
     logger.setLevel(level)
     get_console_handler(logger=logger, level=level, formatter=formatter)
     get_file_handler(path, logger=logger, mode=mode, level=level,
-                     formatter=formatter)
+                     formatter=formatter, buffered=buffered,
+                     max_bytes=max_bytes, per_action=per_action,
+                     indexed=indexed)
+    return logger
+
+
+def prepare_async_logging(path, mode='w', logger_name='', level=DEFAULT_LEVEL,
+                          formatter=None, queue_size=DEFAULT_QUEUE_SIZE,
+                          overflow='block', sample_rate=10):
+    """Like prepare_simple_logging(), but the console and file handlers
+    run in a background thread, so slow console or disk I/O doesn't slow
+    down the script or watch_command().
+
+    The logger gets an AsyncQueueHandler, which queues each record for an
+    AsyncListener thread to pass to the console and file handlers.  The
+    queue is drained when the AsyncQueueHandler is flushed or closed; the
+    logging module does both at exit, and Script flushes its logger's
+    handlers on ScriptHarnessFatal.
+
+    Args:
+      path (Optional[str]): path to the file log.  If this isn't set,
+        don't create a file handler.  Default ''
+      mode (Optional[char]): the mode to open the file log.  Default 'w'
+      logger_name (Optional[str]): the name of the logger to use. Default ''
+      level (Optional[int]): the level to log.  Default DEFAULT_LEVEL
+      formatter (Optional[Formatter]): a logging Formatter to use; to handle
+        unicode, subclass UnicodeFormatter.
+      queue_size (Optional[int]): the max number of queued records.
+        Default DEFAULT_QUEUE_SIZE
+      overflow (Optional[str]): one of OVERFLOW_POLICIES.  Default 'block'
+      sample_rate (Optional[int]): for the 'sample' overflow policy, keep
+        one of every sample_rate records.  Default 10
+
+    Returns:
+        logger (Logger object).  This is also easily retrievable via
+            logging.getLogger(logger_name).
+    """
+    logger = logging.getLogger(logger_name)
+    logger.setLevel(level)
+    handlers = [get_console_handler(level=level, formatter=formatter)]
+    if path:
+        handlers.append(get_file_handler(path, mode=mode, level=level,
+                                         formatter=formatter))
+    handler = AsyncQueueHandler(
+        AsyncListener(handlers), maxsize=queue_size, overflow=overflow,
+        sample_rate=sample_rate
+    )
+    handler.setLevel(level)
+    logger.addHandler(handler)
     return logger
 
 
+def flush_logger(logger):
+    """Flush all of the handlers for logger and its ancestors, e.g. to drain
+    an AsyncQueueHandler.
+
+    Args:
+      logger (logging.Logger): the logger to flush.
+    """
+    while isinstance(logger, logging.Logger):
+        for handler in logger.handlers:
+            handler.flush()
+        if not logger.propagate:
+            break
+        logger = logger.parent
+
+
 def get_file_handler(path, level=logging.INFO, formatter=None,
-                     logger=None, mode='w'):
+                     logger=None, mode='w', buffered=False, max_bytes=None,
+                     per_action=False, indexed=False):
     """Create a file handler to add to a logger.
 
     Args:
@@ -101,15 +485,43 @@ def get_file_handler(path, level=logging.INFO, formatter=None,
       formatter (Optional[logging.Formatter]): formatter to use for logs.
       logger (Optional[logging.Logger]): logger to add the file handler to.
       mode (Optional[str]): mode to open the file
+      buffered (Optional[bool]): create a BufferedFileHandler, which batches
+        records into large writes.
+      max_bytes (Optional[int]): create a RotatingLogHandler that rotates
+        the file when it reaches this many bytes.
+      per_action (Optional[bool]): create a RotatingLogHandler that rotates
+        the file when the action changes.
+      indexed (Optional[bool]): create an IndexedFileHandler, which indexes
+        where each action and command starts and ends in the file.  This
+        can't be combined with rotation.
 
     Returns:
       handler (logging.FileHandler):  This can be added to a logger
       via logger.addHandler(handler)
+
+    Raises:
+      scriptharness.exceptions.ScriptHarnessException: if indexed is
+        combined with max_bytes or per_action.
     """
+    if indexed and (max_bytes or per_action):
+        raise ScriptHarnessException(
+            "Can't index a rotating log!", path
+        )
     make_parent_dir(path, level=logging.DEBUG)
     if not formatter:
         formatter = get_formatter()
-    handler = logging.FileHandler(path, mode)
+    kwargs = {}
+    if not buffered:
+        kwargs = {'buffer_size': 0, 'flush_interval': None}
+    if max_bytes or per_action:
+        handler = RotatingLogHandler(path, mode, max_bytes=max_bytes,
+                                     per_action=per_action, **kwargs)
+    elif indexed:
+        handler = IndexedFileHandler(path, mode, **kwargs)
+    elif buffered:
+        handler = BufferedFileHandler(path, mode)
+    else:
+        handler = logging.FileHandler(path, mode)
     handler.setLevel(level)
     handler.setFormatter(formatter)
     if logger:
@@ -117,6 +529,53 @@ def get_file_handler(path, level=logging.INFO, formatter=None,
     return handler
 
 
+def get_json_handler(path, level=logging.INFO, logger=None, mode='w'):
+    """Create a file handler that writes each record as a line of json, for
+    log pipelines that would otherwise have to regex-parse the text log.
+
+    Args:
+      path (str): the path to the json lines log.
+      level (Optional[int]): logging level for the file.
+      logger (Optional[logging.Logger]): logger to add the handler to.
+      mode (Optional[str]): mode to open the file
+
+    Returns:
+      handler (logging.FileHandler):  This can be added to a logger
+      via logger.addHandler(handler)
+    """
+    return get_file_handler(path, level=level, logger=logger, mode=mode,
+                            formatter=JsonLinesFormatter())
+
+
+def get_ring_handler(path, logger=None, capacity=DEFAULT_RING_CAPACITY,
+                     level=logging.DEBUG, formatter=None):
+    """Create a RingHandler, which keeps recent records in memory and
+    writes them to path on a fatal error or command timeout.
+
+    If logger is set and its level would filter out level, its level is
+    lowered to level.  Other handlers created here have their own levels,
+    so they still only log at theirs.
+
+    Args:
+      path (str): the path to write post-mortem dumps to.
+      logger (Optional[logging.Logger]): logger to add the handler to.
+      capacity (Optional[int]): the number of records to keep per logger.
+      level (Optional[int]): the minimum level to keep.
+      formatter (Optional[logging.Formatter]): formatter to dump with.
+
+    Returns:
+      RingHandler: This can be added to a logger via
+      logger.addHandler(handler)
+    """
+    handler = RingHandler(path, capacity=capacity, level=level)
+    handler.setFormatter(formatter or get_formatter())
+    if logger:
+        logger.addHandler(handler)
+        if logger.getEffectiveLevel() > level:
+            logger.setLevel(level)
+    return handler
+
+
 def get_console_handler(formatter=None, logger=None, level=logging.INFO):
     """Create a stream handler to add to a logger.
 
@@ -139,16 +598,1084 @@ def get_console_handler(formatter=None, logger=None, level=logging.INFO):
     return handler
 
 
+# Buffered file logging {{{1
+class BufferedFileHandler(logging.FileHandler):
+    """A FileHandler that batches formatted records into large writes.
+
+    The buffer is written when it reaches buffer_size characters, when a
+    record at flush_level or above is logged, every flush_interval seconds,
+    and on flush() or close().  Script flushes its logger's handlers at the
+    end of each action, the logging module flushes and closes handlers at
+    exit, and install_signal_flush() flushes on FATAL_SIGNALS.  With a
+    buffer_size of 0, each record is written as it's logged, so the
+    handler doesn't need the signal flush and doesn't install it.
+
+    Attributes:
+      buffer (List[str]): the formatted records not yet written.
+      buffer_chars (int): the total length of self.buffer.
+      buffer_size (int): write once the buffer reaches this many characters.
+      flush_interval (float): the max seconds to hold records.  If falsy,
+        don't start the flusher thread.
+      flush_level (int): write immediately on records at this level or
+        above.
+      stop_event (threading.Event): set on close() to stop the flusher.
+      flusher (threading.Thread): the thread that flushes every
+        flush_interval seconds, if any.
+    """
+    def __init__(self, filename, mode='a', buffer_size=DEFAULT_BUFFER_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 flush_level=logging.WARNING, encoding=None):
+        logging.FileHandler.__init__(self, filename, mode, encoding)
+        self.buffer = []
+        self.buffer_chars = 0
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.flush_level = flush_level
+        self.stop_event = threading.Event()
+        self.flusher = None
+        if buffer_size:
+            BUFFERED_HANDLERS.add(self)
+            install_signal_flush()
+        if flush_interval:
+            self.flusher = threading.Thread(
+                target=self.flush_periodically,
+                name="scriptharness.log.BufferedFileHandler"
+            )
+            self.flusher.daemon = True
+            self.flusher.start()
+
+    def emit(self, record):
+        """Format the record into the buffer, and write the buffer if it's
+        full or the record is at flush_level or above.
+
+        Args:
+          record (logging.LogRecord): the record to log.
+        """
+        try:
+            msg = self.format(record) + getattr(self, 'terminator', str('\n'))
+        except Exception:  # pylint: disable=broad-except
+            self.handleError(record)
+            return
+        self.buffer.append(msg)
+        self.buffer_chars += len(msg)
+        if self.buffer_chars >= self.buffer_size or \
+                record.levelno >= self.flush_level:
+            self.flush()
+
+    def flush(self):
+        """Write the buffer to the file in a single write, then flush the
+        file.
+        """
+        self.acquire()
+        try:
+            if self.buffer:
+                if self.stream is None:
+                    self.stream = self._open()
+                buf, self.buffer, self.buffer_chars = self.buffer, [], 0
+                self.write(buf[0][:0].join(buf))
+            if self.stream is not None:
+                self.stream.flush()
+        finally:
+            self.release()
+
+    def write(self, data):
+        """Write data to the file.  Here for subclassing.
+
+        Args:
+          data (str): the joined buffer.
+        """
+        self.stream.write(data)
+
+    def flush_periodically(self):
+        """Flush every flush_interval seconds until close().
+        """
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        """Stop the flusher, write the buffer, and close the file.
+        """
+        self.stop_event.set()
+        self.flush()
+        BUFFERED_HANDLERS.discard(self)
+        logging.FileHandler.close(self)
+
+
+def flush_buffered_handlers():
+    """Write the buffer of every open BufferedFileHandler.
+    """
+    for handler in list(BUFFERED_HANDLERS):
+        handler.flush()
+
+
+def handle_fatal_signal(signum, frame):
+    """Signal handler: flush the BufferedFileHandlers, then hand the signal
+    to the handler install_signal_flush() replaced.  If that was the
+    default handler, restore it and resend the signal, so the process
+    still dies with the right exit status.
+
+    Args:
+      signum (int): the signal number.
+      frame (frame): the current stack frame.
+    """
+    flush_buffered_handlers()
+    previous = PREVIOUS_SIGNAL_HANDLERS.get(signum, signal.SIG_DFL)
+    if callable(previous):
+        previous(signum, frame)
+    elif previous != signal.SIG_IGN:
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+
+
+def install_signal_flush(signums=FATAL_SIGNALS):
+    """Flush the BufferedFileHandlers when the process gets one of signums.
+    Each signal is only hooked once.  Signal handlers can only be set from
+    the main thread; elsewhere this is a no-op.
+
+    Args:
+      signums (Optional[Tuple[int, ...]]): the signals to hook.  Defaults
+        to FATAL_SIGNALS.
+    """
+    for signum in signums:
+        if signum in PREVIOUS_SIGNAL_HANDLERS:
+            continue
+        try:
+            previous = signal.signal(signum, handle_fatal_signal)
+        except ValueError:
+            return
+        PREVIOUS_SIGNAL_HANDLERS[signum] = previous
+
+
+# Log rotation {{{1
+def gzip_file(path):
+    """Compress path to path.gz, then remove path.
+
+    Args:
+      path (str): the file to compress.
+    """
+    tmp_path = path + '.gz.tmp'
+    with open(path, 'rb') as source:
+        with gzip.open(tmp_path, 'wb') as target:
+            shutil.copyfileobj(source, target)
+    os.rename(tmp_path, path + '.gz')
+    os.remove(path)
+
+
+def rotate_file(path, max_backups):
+    """Move path to path.1, path.1 to path.2, etc., keeping at most
+    max_backups old copies.
+
+    Args:
+      path (str): the file to rotate.
+      max_backups (int): the number of old copies to keep.
+    """
+    if not os.path.exists(path):
+        return
+    oldest = "%s.%d" % (path, max_backups)
+    if os.path.exists(oldest):
+        os.remove(oldest)
+    for num in range(max_backups - 1, 0, -1):
+        backup = "%s.%d" % (path, num)
+        if os.path.exists(backup):
+            os.rename(backup, "%s.%d" % (path, num + 1))
+    if max_backups > 0:
+        os.rename(path, path + '.1')
+    else:
+        os.remove(path)
+
+
+class SegmentCompressor(object):
+    """Gzip files in a background thread, so rotation doesn't stall
+    logging.
+
+    Attributes:
+      queue (queue.Queue): the paths waiting to be compressed.
+      thread (threading.Thread): the background thread, once started.
+    """
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = None
+
+    def compress(self, path):
+        """Queue path to be compressed, starting the thread if needed.
+
+        Args:
+          path (str): the file to compress.
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(
+                target=self.monitor, name="scriptharness.log.SegmentCompressor"
+            )
+            self.thread.daemon = True
+            self.thread.start()
+        self.queue.put(path)
+
+    def monitor(self):
+        """Compress queued paths until we get None.
+        """
+        while True:
+            path = self.queue.get()
+            try:
+                if path is None:
+                    break
+                gzip_file(path)
+            except (IOError, OSError):
+                pass
+            finally:
+                self.queue.task_done()
+
+    def stop(self):
+        """Compress every queued path, then stop the thread.
+        """
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+
+class RotatingLogHandler(BufferedFileHandler):
+    """A BufferedFileHandler that rotates the log into numbered segments,
+    either by size or whenever the action changes, so long-running scripts
+    don't grow a single huge file.
+
+    The live log is always at self.baseFilename.  On rotation it's renamed
+    to baseFilename.N, which is then gzipped to baseFilename.N.gz in the
+    background.  A json manifest at baseFilename + MANIFEST_SUFFIX lists
+    the segments in order, with their line ranges and actions.
+
+    Size rotation happens after a buffer write, so segments can exceed
+    max_bytes by up to one buffer.  Sizes are counted in encoded bytes, so
+    non-ascii output counts for what it takes on disk.
+
+    Attributes:
+      max_bytes (int): rotate when the live segment reaches this many
+        bytes.  If falsy, don't rotate by size.
+      per_action (bool): rotate when the record's action_name (see
+        LOG_CONTEXT) changes.
+      compressor (SegmentCompressor): compresses rotated segments, if
+        compression is enabled.
+      manifest_path (str): the path to the manifest.
+      manifest (List[Dict[str, Any]]): the rotated segments.
+      segment_bytes (int): the size of the live segment, in bytes.
+      segment_lines (int): the number of lines in the live segment.
+      segment_action (str): the action_name of the live segment.
+    """
+    def __init__(self, filename, mode='w', max_bytes=None, per_action=False,
+                 compress=True, **kwargs):
+        self.max_bytes = max_bytes
+        self.per_action = per_action
+        self.compressor = SegmentCompressor() if compress else None
+        self.manifest_path = os.path.abspath(filename) + MANIFEST_SUFFIX
+        self.manifest = []
+        self.segment_bytes = 0
+        self.segment_lines = 0
+        self.segment_action = None
+        if mode != 'a':
+            if os.path.exists(self.manifest_path):
+                os.remove(self.manifest_path)
+        else:
+            if os.path.exists(self.manifest_path):
+                with open(self.manifest_path) as filehandle:
+                    self.manifest = json.load(filehandle)['segments']
+            if os.path.exists(filename):
+                with open(filename, 'rb') as filehandle:
+                    for line in filehandle:
+                        self.segment_lines += 1
+                        self.segment_bytes += len(line)
+        BufferedFileHandler.__init__(self, filename, mode, **kwargs)
+
+    def get_first_line(self):
+        """Get the line number of the first line of the live segment.
+
+        Returns:
+          int: the line number, counting from 1 across all segments.
+        """
+        if self.manifest:
+            return self.manifest[-1]['last_line'] + 1
+        return 1
+
+    def emit(self, record):
+        """Rotate if the action changed, then buffer the record.
+
+        Args:
+          record (logging.LogRecord): the record to log.
+        """
+        if self.per_action:
+            action = getattr(record, 'action_name',
+                             LOG_CONTEXT.get('action_name'))
+            if action != self.segment_action:
+                self.rotate()
+                self.segment_action = action
+        BufferedFileHandler.emit(self, record)
+
+    def write(self, data):
+        """Write data, then rotate if the segment is over max_bytes.
+
+        Args:
+          data (str): the joined buffer.
+        """
+        self.stream.write(data)
+        if isinstance(data, six.text_type):
+            self.segment_bytes += len(
+                data.encode(getattr(self.stream, 'encoding', None) or 'utf-8')
+            )
+        else:
+            self.segment_bytes += len(data)
+        self.segment_lines += data.count(data[:0] + '\n')
+        if self.max_bytes and self.segment_bytes >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        """Move the live segment to the next numbered segment, queue it for
+        compression, update the manifest, and start a new live segment.
+        Empty segments aren't rotated.
+        """
+        self.acquire()
+        try:
+            if self.buffer:
+                self.flush()
+            if not self.segment_lines:
+                return
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+            num = len(self.manifest) + 1
+            path = "%s.%d" % (self.baseFilename, num)
+            os.rename(self.baseFilename, path)
+            if self.compressor is not None:
+                self.compressor.compress(path)
+                path = path + '.gz'
+            first_line = self.get_first_line()
+            self.manifest.append({
+                'segment': num,
+                'path': os.path.basename(path),
+                'first_line': first_line,
+                'last_line': first_line + self.segment_lines - 1,
+                'size': self.segment_bytes,
+                'action': self.segment_action,
+            })
+            self.write_manifest()
+            self.segment_bytes = 0
+            self.segment_lines = 0
+            self.stream = self._open()
+        finally:
+            self.release()
+
+    def write_manifest(self):
+        """Atomically write the manifest as json.
+        """
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as filehandle:
+            json.dump({'path': os.path.basename(self.baseFilename),
+                       'segments': self.manifest},
+                      filehandle, indent=2, sort_keys=True)
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+        os.rename(tmp_path, self.manifest_path)
+
+    def close(self):
+        """Write the buffer, wait for compression, and close the file.
+        """
+        BufferedFileHandler.close(self)
+        if self.compressor is not None:
+            self.compressor.stop()
+
+
+# Log segment index {{{1
+class IndexedFileHandler(BufferedFileHandler):
+    """A BufferedFileHandler that records the byte offset and line number
+    where each action and command starts and ends in the log, so readers
+    can seek straight to one action's or command's output; see
+    scriptharness.log_index.
+
+    Actions and commands are detected from each record's action_name and
+    command_id (see LOG_CONTEXT).  When either changes, the buffer is
+    written so the file offset is exact, and each finished segment is
+    appended to the index at baseFilename + SEGMENT_INDEX_SUFFIX as a json
+    line with these keys:
+
+    * type: 'action' or 'command'
+    * name: the action name or command id
+    * action: the action the segment is part of
+    * start_offset, end_offset: the byte range, end exclusive
+    * start_line, end_line: the line range, counting from 1, inclusive
+
+    Attributes:
+      index_path (str): the path to the index.
+      line_number (int): the number of lines written to the log.
+      segments (Dict[str, Dict[str, Any]]): the open 'action' and 'command'
+        segments.
+    """
+    def __init__(self, filename, mode='w', **kwargs):
+        self.index_path = os.path.abspath(filename) + SEGMENT_INDEX_SUFFIX
+        self.line_number = 0
+        self.segments = {}
+        if mode == 'a' and os.path.exists(filename):
+            with open(filename, 'rb') as filehandle:
+                for _ in filehandle:
+                    self.line_number += 1
+        elif os.path.exists(self.index_path):
+            os.remove(self.index_path)
+        BufferedFileHandler.__init__(self, filename, mode, **kwargs)
+
+    def get_segment_name(self, segment_type):
+        """Get the name of the open segment of segment_type.
+
+        Args:
+          segment_type (str): 'action' or 'command'
+
+        Returns:
+          str or int: the action name or command id, or None if there's no
+            open segment.
+        """
+        return self.segments.get(segment_type, {}).get('name')
+
+    def get_offset(self):
+        """Write the buffer, then get the current offset in the log.
+
+        Returns:
+          int: the byte offset.
+        """
+        self.flush()
+        if self.stream is None:
+            return os.path.getsize(self.baseFilename)
+        return self.stream.tell()
+
+    def start_segment(self, segment_type, name, action, offset):
+        """Open a segment.
+
+        Args:
+          segment_type (str): 'action' or 'command'
+          name (str or int): the action name or command id.
+          action (str): the action name.
+          offset (int): the byte offset of the first line.
+        """
+        self.segments[segment_type] = {
+            'type': segment_type, 'name': name, 'action': action,
+            'start_offset': offset, 'start_line': self.line_number + 1,
+        }
+
+    def end_segment(self, segment_type, offset):
+        """Close a segment, if open, and append it to the index.
+
+        Args:
+          segment_type (str): 'action' or 'command'
+          offset (int): the byte offset after the last line.
+        """
+        segment = self.segments.pop(segment_type, None)
+        if segment is None:
+            return
+        segment['end_offset'] = offset
+        segment['end_line'] = self.line_number
+        with open(self.index_path, 'a') as filehandle:
+            filehandle.write(json.dumps(segment, sort_keys=True) + '\n')
+
+    def emit(self, record):
+        """Start and end segments if the record's action or command
+        changed, then buffer the record.
+
+        Args:
+          record (logging.LogRecord): the record to log.
+        """
+        action = getattr(record, 'action_name',
+                         LOG_CONTEXT.get('action_name'))
+        command_id = getattr(record, 'command_id',
+                             LOG_CONTEXT.get('command_id'))
+        new_action = action != self.get_segment_name('action')
+        new_command = new_action or \
+            command_id != self.get_segment_name('command')
+        if new_command:
+            offset = self.get_offset()
+            self.end_segment('command', offset)
+            if new_action:
+                self.end_segment('action', offset)
+                if action is not None:
+                    self.start_segment('action', action, action, offset)
+            if command_id is not None:
+                self.start_segment('command', command_id, action, offset)
+        BufferedFileHandler.emit(self, record)
+
+    def write(self, data):
+        """Write data, counting lines.
+
+        Args:
+          data (str): the joined buffer.
+        """
+        self.stream.write(data)
+        self.line_number += data.count(data[:0] + '\n')
+
+    def close(self):
+        """End the open segments, then close the log.
+        """
+        self.acquire()
+        try:
+            if self.segments:
+                offset = self.get_offset()
+                self.end_segment('command', offset)
+                self.end_segment('action', offset)
+        finally:
+            self.release()
+        BufferedFileHandler.close(self)
+
+
+# Post-mortem ring log {{{1
+class RingHandler(logging.Handler):
+    """Keep the last `capacity` records of each logger in memory, without
+    writing them anywhere, until dump() appends them to a post-mortem log.
+
+    Script.run_action() dumps every RingHandler when an action raises
+    ScriptHarnessFatal, and scriptharness.process dumps them when a
+    command times out.  This way the main logs can run at logging.INFO
+    while the post-mortem log still has logging.DEBUG detail around the
+    failure.
+
+    Records are prepared with prepare_record() when they're kept, so
+    they're dumped as they were at log time, and kept exceptions don't
+    keep their tracebacks alive.
+
+    Attributes:
+      path (str): the path to append post-mortem dumps to.
+      capacity (int): the number of records to keep per logger.
+      rings (Dict[str, collections.deque]): the recent records, per logger
+        name.
+    """
+    def __init__(self, path, capacity=DEFAULT_RING_CAPACITY,
+                 level=logging.DEBUG):
+        logging.Handler.__init__(self, level)
+        self.path = path
+        self.capacity = capacity
+        self.rings = {}
+        RING_HANDLERS.add(self)
+
+    def emit(self, record):
+        """Keep a prepared copy of the record, dropping the oldest record for
+        its logger if the ring is full.
+
+        Args:
+          record (logging.LogRecord): the record to keep.
+        """
+        ring = self.rings.get(record.name)
+        if ring is None:
+            ring = self.rings[record.name] = deque(maxlen=self.capacity)
+        ring.append(prepare_record(record))
+
+    def dump(self, reason=None):
+        """Append the kept records, oldest first, to self.path, and clear
+        the rings.
+
+        Args:
+          reason (Optional[str]): why we're dumping, for the header.
+
+        Returns:
+          int: the number of records dumped.
+        """
+        self.acquire()
+        try:
+            rings, self.rings = self.rings, {}
+        finally:
+            self.release()
+        records = sorted([x for ring in rings.values() for x in ring],
+                         key=attrgetter('created'))
+        if not records:
+            return 0
+        formatter = self.formatter or get_formatter()
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        with codecs.open(self.path, 'a', encoding='utf-8') as filehandle:
+            filehandle.write("==== Post-mortem: %s (last %d records) ====\n" %
+                             (reason or "dump", len(records)))
+            for record in records:
+                filehandle.write(to_unicode(formatter.format(record)) + '\n')
+        return len(records)
+
+    def close(self):
+        """Stop tracking this handler, and drop the kept records.
+        """
+        RING_HANDLERS.discard(self)
+        self.rings = {}
+        logging.Handler.close(self)
+
+
+def dump_ring_handlers(reason=None):
+    """Dump every open RingHandler.
+
+    Args:
+      reason (Optional[str]): why we're dumping, for the header.
+    """
+    for handler in list(RING_HANDLERS):
+        handler.dump(reason)
+
+
+# Rate limiting {{{1
+class RateLimitFilter(logging.Filter):
+    """Bound the volume of records below a threshold level from loggers
+    under a name prefix, like 'scriptharness.commands'.
+
+    Records below `level` from loggers under `name` are sampled, keeping
+    the 1st, (sample+1)th, (2*sample+1)th... record, and then rate
+    limited by a token bucket that holds `burst` tokens and refills at
+    `rate` tokens per second.  Records at or above `level`, and records
+    from other loggers, always pass.
+
+    Suppressed records are counted, and a "suppressed N records" summary
+    is logged at `level` at most every `summary_interval` seconds, when
+    the next limited record comes in, or when summarize() is forced.
+
+    Since logger filters only see records logged to that exact logger,
+    this is meant to be added to handlers; see get_rate_limit_filter().
+    If it's on more than one handler, each record only counts once.
+
+    Attributes:
+      rate (float): the tokens per second, or None to not rate limit.
+      burst (float): the bucket size.
+      sample (int): keep 1 in this many records, or None to not sample.
+      level (int): records at or above this level are never limited.
+      summary_interval (float): the min number of seconds between
+        summaries.
+      tokens (float): the tokens currently in the bucket.
+      count (int): the number of records considered for sampling.
+      suppressed (int): the number of records suppressed since the last
+        summary.
+    """
+    def __init__(self, name='', rate=None, burst=None, sample=None,
+                 level=logging.WARNING,
+                 summary_interval=DEFAULT_SUMMARY_INTERVAL):
+        logging.Filter.__init__(self, name)
+        self.rate = rate
+        self.burst = burst or max(rate or 0, 1)
+        self.sample = sample
+        self.level = level
+        self.summary_interval = summary_interval
+        self.tokens = self.burst
+        self.last_refill = self.last_summary = default_timer()
+        self.count = 0
+        self.suppressed = 0
+        self.last_record = None
+        self.last_result = True
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        """Decide whether to log the record.
+
+        Args:
+          record (logging.LogRecord): the record to check.
+
+        Returns:
+          bool: False if the record is suppressed.
+        """
+        if record.levelno >= self.level or \
+                not logging.Filter.filter(self, record):
+            return True
+        with self.lock:
+            if record is self.last_record:
+                return self.last_result
+            result = self.allow()
+            if not result:
+                self.suppressed += 1
+            self.last_record, self.last_result = record, result
+        self.summarize()
+        return result
+
+    def allow(self):
+        """Sample, then take a token from the bucket.  Call with self.lock
+        held.
+
+        Returns:
+          bool: True if the record passes.
+        """
+        if self.sample:
+            self.count += 1
+            if (self.count - 1) % self.sample:
+                return False
+        if self.rate:
+            now = default_timer()
+            self.tokens = min(self.burst, self.tokens +
+                              (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+        return True
+
+    def summarize(self, force=False):
+        """Log how many records were suppressed, if any, and if
+        summary_interval has passed or force is set.
+
+        Args:
+          force (Optional[bool]): log the summary even if summary_interval
+            hasn't passed.
+
+        Returns:
+          int: the number of suppressed records summarized.
+        """
+        with self.lock:
+            now = default_timer()
+            elapsed = now - self.last_summary
+            if not self.suppressed or \
+                    (not force and elapsed < self.summary_interval):
+                return 0
+            suppressed, self.suppressed = self.suppressed, 0
+            self.last_summary = now
+        logging.getLogger(self.name).log(
+            self.level,
+            "Suppressed %d records from %s in the last %.1f seconds.",
+            suppressed, self.name or "all loggers", elapsed
+        )
+        return suppressed
+
+
+def get_rate_limit_filter(name='', rate=None, burst=None, sample=None,
+                          level=logging.WARNING,
+                          summary_interval=DEFAULT_SUMMARY_INTERVAL):
+    """Create a RateLimitFilter for loggers under name, and add it to
+    every handler those loggers' records reach: the handlers of
+    logging.getLogger(name) and of its ancestors, up to the first logger
+    that doesn't propagate.
+
+    Handlers added after this call aren't filtered.
+
+    Args:
+      name (Optional[str]): the logger name prefix.  Default ''
+      rate (Optional[float]): the records per second to allow.
+      burst (Optional[float]): the max records to allow at once.  Defaults
+        to rate.
+      sample (Optional[int]): keep 1 in this many records.
+      level (Optional[int or str]): records at or above this level are
+        never limited.  Level names like 'INFO' work too.
+      summary_interval (Optional[float]): the min number of seconds
+        between summaries.
+
+    Returns:
+      RateLimitFilter: the filter.
+    """
+    if isinstance(level, six.string_types):
+        level = logging.getLevelName(level.upper())
+    log_filter = RateLimitFilter(
+        name, rate=rate, burst=burst, sample=sample, level=level,
+        summary_interval=summary_interval
+    )
+    logger = logging.getLogger(name)
+    while logger is not None:
+        for handler in logger.handlers:
+            handler.addFilter(log_filter)
+        if not logger.propagate:
+            break
+        logger = logger.parent
+    RATE_LIMIT_FILTERS.add(log_filter)
+    return log_filter
+
+
+def add_log_filters(filters):
+    """Create a RateLimitFilter for each logger name prefix in filters.
+
+    Args:
+      filters (Dict[str, Dict[str, Any]]): logger name prefix to
+        get_rate_limit_filter() kwargs, e.g. the scriptharness_log_filters
+        config.
+
+    Returns:
+      List[RateLimitFilter]: the filters.
+    """
+    return [get_rate_limit_filter(name, **kwargs)
+            for name, kwargs in sorted(filters.items())]
+
+
+def summarize_rate_limits():
+    """Log the suppressed record summary of every RateLimitFilter created
+    via get_rate_limit_filter(), regardless of summary_interval.
+    """
+    for log_filter in list(RATE_LIMIT_FILTERS):
+        log_filter.summarize(force=True)
+
+
+def validate_log_filters(name, config):
+    """Validate the scriptharness_log_filters config; this is its
+    ConfigVariable validate_cb.
+
+    Args:
+      name (str): the config variable name.
+      config (Dict[str, Any]): the built config.
+
+    Returns:
+      List[str]: error messages, if any.
+    """
+    filters = config[name]
+    if not isinstance(filters, dict):
+        return ["%s must be a dict of logger name to options!" % name]
+    messages = []
+    for prefix, options in sorted(filters.items()):
+        if not isinstance(options, dict):
+            messages.append("%s %s options must be a dict!" % (name, prefix))
+            continue
+        for key, value in sorted(options.items()):
+            if key not in RATE_LIMIT_OPTIONS:
+                messages.append("%s %s: unknown option %s!" %
+                                (name, prefix, key))
+            elif key == 'level':
+                if isinstance(value, six.string_types):
+                    value = logging.getLevelName(value.upper())
+                if not isinstance(value, int):
+                    messages.append("%s %s: unknown level %s!" %
+                                    (name, prefix, options[key]))
+            elif value is not None and (
+                    isinstance(value, bool) or
+                    not isinstance(value, (int, float)) or value <= 0 or
+                    (key == 'sample' and not isinstance(value, int))):
+                messages.append("%s %s: %s must be a positive %s!" %
+                                (name, prefix, key,
+                                 'int' if key == 'sample' else 'number'))
+    return messages
+
+
+# Asynchronous logging {{{1
+class AsyncListener(object):
+    """Pass queued log records to handlers in a background thread.
+
+    Attributes:
+      handlers (List[logging.Handler]): the handlers to pass records to.
+      queue (queue.Queue): the queue to read records from; set by
+        AsyncQueueHandler.
+      thread (threading.Thread): the background thread, while running.
+    """
+    sentinel = None
+
+    def __init__(self, handlers):
+        self.handlers = handlers
+        self.queue = None
+        self.thread = None
+
+    def start(self, record_queue):
+        """Start the background thread.
+
+        Args:
+          record_queue (queue.Queue): the queue to read records from.
+        """
+        self.queue = record_queue
+        self.thread = threading.Thread(target=self.monitor,
+                                       name="scriptharness.log.AsyncListener")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def monitor(self):
+        """Read and handle records until we get the sentinel.
+        """
+        while True:
+            record = self.queue.get()
+            try:
+                if record is self.sentinel:
+                    break
+                self.handle(record)
+            finally:
+                self.queue.task_done()
+
+    def handle(self, record):
+        """Pass a record to each handler whose level allows it.
+
+        Args:
+          record (logging.LogRecord): the record to handle.
+        """
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def is_alive(self):
+        """Determine whether the background thread is running.
+
+        Returns:
+          bool: True if the thread is running.
+        """
+        return self.thread is not None and self.thread.is_alive()
+
+    def stop(self):
+        """Handle every queued record, then stop the background thread and
+        close the handlers.
+        """
+        if self.is_alive():
+            self.queue.put(self.sentinel)
+            self.thread.join()
+        self.thread = None
+        for handler in self.handlers:
+            handler.close()
+
+
+class AsyncQueueHandler(logging.Handler):
+    """Queue log records for an AsyncListener.
+
+    Records are formatted into their final message before being queued, so
+    later changes to mutable args like LoggingDicts don't change the log.
+
+    Attributes:
+      listener (AsyncListener): the listener that handles queued records.
+      queue (queue.Queue): the bounded record queue.
+      overflow (str): one of OVERFLOW_POLICIES.
+      sample_rate (int): for the 'sample' overflow policy, keep one of every
+        sample_rate records.
+      num_dropped (int): the number of records dropped since the last
+        flush().
+      num_overflowed (int): the number of records at logging.INFO and below
+        that arrived while the queue was full, for sampling.
+    """
+    def __init__(self, listener, maxsize=DEFAULT_QUEUE_SIZE,
+                 overflow='block', sample_rate=10):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ScriptHarnessException(
+                "Unknown overflow policy %s!" % overflow, OVERFLOW_POLICIES
+            )
+        logging.Handler.__init__(self)
+        self.listener = listener
+        self.queue = queue.Queue(maxsize)
+        self.overflow = overflow
+        self.sample_rate = max(sample_rate, 1)
+        self.num_dropped = 0
+        self.num_overflowed = 0
+        listener.start(self.queue)
+
+    def prepare(self, record):
+        """Merge the record's args into its message, and its exception into
+        its exc_text, so it can be formatted later in another thread.
+
+        Args:
+          record (logging.LogRecord): the record to prepare.
+
+        Returns:
+          logging.LogRecord: a prepared copy of record.
+        """
+        return prepare_record(record)
+
+    def enqueue(self, record):
+        """Queue a record, following self.overflow if the queue is full.
+
+        Args:
+          record (logging.LogRecord): the prepared record.
+        """
+        if self.overflow == 'block' or record.levelno > logging.INFO:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        if self.overflow == 'sample':
+            self.num_overflowed += 1
+            if (self.num_overflowed - 1) % self.sample_rate == 0:
+                self.queue.put(record)
+                return
+        self.num_dropped += 1
+
+    def emit(self, record):
+        """Queue the record.
+
+        Args:
+          record (logging.LogRecord): the record to log.
+        """
+        try:
+            self.enqueue(self.prepare(record))
+        except Exception:  # pylint: disable=broad-except
+            self.handleError(record)
+
+    def flush(self):
+        """Wait until every queued record has been handled.  If any records
+        were dropped, log a warning saying how many.
+        """
+        if not self.listener.is_alive():
+            return
+        if self.num_dropped:
+            record = logging.LogRecord(
+                LOGGER_NAME, logging.WARNING, __file__, 0,
+                "Dropped %d log records because the log queue was full.",
+                (self.num_dropped, ), None
+            )
+            self.num_dropped = 0
+            self.queue.put(self.prepare(record))
+        self.queue.join()
+
+    def close(self):
+        """Drain the queue, and stop the listener.
+        """
+        self.flush()
+        self.listener.stop()
+        logging.Handler.close(self)
+
+
 # LogMethod decorator {{{1
+class LogMethodCall(object):
+    """The state of a single call to a LogMethod-decorated function.
+
+    LogMethod keeps a per-thread stack of these, so recursive and threaded
+    calls don't overwrite each other's args or return values.
+
+    Attributes:
+      args (Tuple[Any, ...]): the args passed to the function.
+      kwargs (Dict[str, Any]): the kwargs passed to the function.
+      repl_dict (Dict[str, Any]): the replacement dictionary for the log
+        messages.
+      return_value (Any): the function's return value.
+      detected_errors (bool): the detect_error_cb result.
+      logger (logging.Logger): the logger for this call, if the logger name
+        depends on the call args.
+    """
+    __slots__ = ('args', 'kwargs', 'repl_dict', 'return_value',
+                 'detected_errors', 'logger')
+
+    def __init__(self, args, kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        self.repl_dict = {}
+        self.return_value = None
+        self.detected_errors = False
+        self.logger = None
+
+
+def _call_property(name, default=None):
+    """Create a LogMethod property that reads and writes the attribute of
+    the current LogMethodCall.
+
+    Args:
+      name (str): the LogMethodCall attribute.
+      default (Optional[Any]): the value to return outside of a call.
+
+    Returns:
+      property: the property.
+    """
+    def getter(self):
+        """Get the attribute from the current call."""
+        call = self.current_call
+        if call is None:
+            return default
+        return getattr(call, name)
+
+    def setter(self, value):
+        """Set the attribute on the current call."""
+        setattr(self.current_call, name, value)
+
+    return property(getter, setter, doc="The current call's %s." % name)
+
+
 class LogMethod(object):
     r"""Wrapper decorator object for logging and error detection.
     This is here as a shortcut to wrap functions with basic logging.
 
+    The per-call args, kwargs, repl_dict, return_value and detected_errors
+    live in a LogMethodCall on a per-thread stack; the attributes of the
+    same names read and write the innermost call, so pre_func(),
+    post_func() and detect_error_cb can keep using them.
+
+    The logger is looked up on the first call and cached.  If the logger
+    isn't enabled for config['level'], the pre and post messages are
+    skipped; the failure message is still logged if detect_error_cb finds
+    an error.
+
     Attributes:
 
       default_config (Dict[str, str]): contains the config defaults that can be
         overridden via __init__ kwargs.  Changing default_config directly
         may carry over to other decorated LogMethod functions!
+
+      func_name (str): the decorated function's name.
+
+      logger (logging.Logger): the cached logger, once resolved.
     """
     default_config = {
         'level': logging.INFO,
@@ -160,6 +1687,11 @@ class LogMethod(object):
         'exception': None,
         'detect_error_cb': None,
     }
+    args = _call_property('args')
+    kwargs = _call_property('kwargs')
+    repl_dict = _call_property('repl_dict', default={})
+    return_value = _call_property('return_value')
+    detected_errors = _call_property('detected_errors', default=False)
 
     def __init__(self, func=None, **kwargs):
         """Set instance attributes from the decorator.
@@ -192,11 +1724,9 @@ class LogMethod(object):
           **kwargs: Contains any config options to override default_config
         """
         self.func = func
-        self.return_value = None
-        self.args = None
-        self.kwargs = None
-        self.repl_dict = {}
-        self.detected_errors = False
+        self.func_name = None
+        self.logger = None
+        self.local = threading.local()
         self.config = deepcopy(self.default_config)
         messages = []
         for key, value in kwargs.items():
@@ -209,6 +1739,15 @@ class LogMethod(object):
         if messages:
             raise ScriptHarnessException(os.linesep.join(messages))
 
+    @property
+    def current_call(self):
+        """The innermost LogMethodCall in this thread, or None.
+        """
+        calls = getattr(self.local, 'calls', None)
+        if calls:
+            return calls[-1]
+        return None
+
     def __call__(self, func, *args, **kwargs):
         r"""Wrap the function call as a decorator.
 
@@ -222,21 +1761,62 @@ class LogMethod(object):
           **kwargs: the kwargs from the wrapped function call.
         """
         self.func = func
+        for name_var in ('__qualname__', '__name__'):
+            if hasattr(func, name_var):
+                self.func_name = getattr(func, name_var)
         def wrapped_func(*args, **kwargs):
             """This function replaces the decorated function.
             """
-            self.args = args
-            self.kwargs = kwargs
-            self.set_repl_dict()
-            self.pre_func()
-            self.return_value = self.func(*self.args, **self.kwargs)
-            self.repl_dict['return_value'] = self.return_value
-            if self.config['detect_error_cb'] is not None:
-                self.detected_errors = self.config['detect_error_cb'].__call__(self)
-            self.post_func()
-            return self.return_value
+            call = LogMethodCall(args, kwargs)
+            calls = getattr(self.local, 'calls', None)
+            if calls is None:
+                calls = self.local.calls = []
+            calls.append(call)
+            try:
+                logger = self.get_logger()
+                enabled = logger.isEnabledFor(self.config['level'])
+                if enabled:
+                    self.set_repl_dict()
+                    self.pre_func()
+                call.return_value = self.func(*args, **kwargs)
+                if self.config['detect_error_cb'] is not None:
+                    call.detected_errors = \
+                        self.config['detect_error_cb'].__call__(self)
+                if enabled or call.detected_errors:
+                    if not enabled:
+                        self.set_repl_dict()
+                    call.repl_dict['return_value'] = call.return_value
+                    self.post_func()
+                return call.return_value
+            finally:
+                calls.pop()
         return wrapped_func
 
+    def get_logger(self):
+        """Get the logger to log with, caching it after the first call.
+
+        If config['logger_name'] uses fields other than func_name, the
+        logger depends on the call, so it's looked up once per call.
+
+        Returns:
+          logging.Logger: the logger.
+        """
+        if self.logger is not None:
+            return self.logger
+        try:
+            name = self.config['logger_name'].format(func_name=self.func_name)
+        except (IndexError, KeyError):
+            call = self.current_call
+            if call.logger is None:
+                if not call.repl_dict:
+                    self.set_repl_dict()
+                call.logger = logging.getLogger(
+                    self.config['logger_name'].format(**call.repl_dict)
+                )
+            return call.logger
+        self.logger = logging.getLogger(name)
+        return self.logger
+
     def set_repl_dict(self):
         """Create a replacement dictionary to format strings.
 
@@ -255,35 +1835,29 @@ class LogMethod(object):
             'args': self.args,
             'kwargs': self.kwargs,
         }
-        for name_var in ('__qualname__', '__name__'):
-            if hasattr(self.func, name_var):
-                self.repl_dict['func_name'] = getattr(self.func, name_var)
+        if self.func_name is not None:
+            self.repl_dict['func_name'] = self.func_name
 
     def pre_func(self):
         """Log the function call before proceeding.
 
         This method is split out for easier subclassing.
         """
-        log = logging.getLogger(
-            self.config['logger_name'].format(**self.repl_dict)
-        )
-        log.log(self.config['level'], self.config['pre_msg'], self.repl_dict)
+        self.get_logger().log(self.config['level'], self.config['pre_msg'],
+                              self.repl_dict)
 
     def post_func(self):
         """Log the success message until we get an error detection callback.
 
         This method is split out for easier subclassing.
         """
-        log = logging.getLogger(
-            self.config['logger_name'].format(**self.repl_dict)
-        )
         if self.detected_errors:
             msg = self.config['post_failure_msg']
             level = self.config['error_level']
         else:
             msg = self.config['post_success_msg']
             level = self.config['level']
-        log.log(level, msg, self.repl_dict)
+        self.get_logger().log(level, msg, self.repl_dict)
         if self.detected_errors and self.config['exception']:
             raise self.config['exception'](
                 self.config['post_failure_msg'].format(**self.repl_dict)
@@ -291,6 +1865,28 @@ class LogMethod(object):
 
 
 # OutputBuffer {{{1
+class BufferedLine(object):
+    """A single buffered line of output.  This is a compact record with
+    __slots__, since OutputBuffer may hold hundreds of these at a time.
+
+    Attributes:
+      level (int): the logging level to log the line at
+      line (str): the line to log
+      args (Tuple[Any, ...]): the args to log the line with
+      time (float): the time the line was added to the buffer
+      extra (Dict[str, Any]): the extra LogRecord attributes to log the line
+        with, if any
+    """
+    __slots__ = ('level', 'line', 'args', 'time', 'extra')
+
+    def __init__(self, level, line, args, timestamp=None, extra=None):
+        self.level = level
+        self.line = line
+        self.args = args
+        self.time = timestamp or time.time()
+        self.extra = extra
+
+
 class OutputBuffer(object):
     """Buffer output for context lines: essentially, an error_check can set
     the level of X lines in the past or Y lines in the future.  If multiple
@@ -307,14 +1903,25 @@ class OutputBuffer(object):
     way up until we match some other pattern, so the buffer had to grow to an
     arbitrary size.  Those could be represented by separate classes/subclasses
     if needed.
+
+    Both the buffer and post_levels are deques, so adding and popping lines
+    is O(1), and setting the level for pre_context_lines only touches the
+    last pre_context_lines lines of the buffer.  This keeps large
+    pre_context_lines values affordable.
+
+    Attributes:
+      logger (logging.Logger): the logger to log with
+      pre_context_lines (int): the max number of lines to buffer
+      post_context_lines (int): the max number of future lines to track
+      buffer (collections.deque): the BufferedLine objects not yet logged
+      post_levels (collections.deque): the minimum levels for future lines
     """
     def __init__(self, logger, pre_context_lines, post_context_lines):
         self.logger = logger
         self.pre_context_lines = pre_context_lines
         self.post_context_lines = post_context_lines
-        # level, line, time
-        self.buffer = []
-        self.post_levels = []
+        self.buffer = deque()
+        self.post_levels = deque()
 
     def update_buffer_levels(self, level, pre_context_lines):
         """Set the level for each buffer line to level if it's higher than
@@ -327,11 +1934,9 @@ class OutputBuffer(object):
             are relative to the current line, these will be counted backwards
             from the end of the buffer.
         """
-        start = max(len(self.buffer) - pre_context_lines, 0)
-        for position, buf in enumerate(self.buffer):
-            if position < start:
-                continue
-            self.buffer[position]['level'] = max(buf['level'], level)
+        for buf in islice(reversed(self.buffer), pre_context_lines):
+            if buf.level < level:
+                buf.level = level
 
     def pop_buffer(self, num=1):
         """Pop num lines from the front of the buffer and log them at the
@@ -342,17 +1947,34 @@ class OutputBuffer(object):
             to 1.
         """
         for _ in range(0, num):
-            self.logger.log(
-                self.buffer[0]['level'], self.buffer[0]['line'],
-                *self.buffer[0]['args']
-            )
-            self.buffer.pop(0)
+            buf = self.buffer.popleft()
+            if buf.extra:
+                self.logger.log(buf.level, buf.line, *buf.args,
+                                extra=buf.extra)
+            else:
+                self.logger.log(buf.level, buf.line, *buf.args)
 
     def dump_buffer(self):
         """Write all the buffered log lines to the log.
         """
         self.pop_buffer(num=len(self.buffer))
 
+    def update_post_levels(self, level, post_context_lines):
+        """Set the level for the next post_context_lines lines to level if
+        it's higher than the existing level.
+
+        Args:
+          level (int): The logging level to set the future lines to.
+
+          post_context_lines (int): The number of future lines to affect.
+        """
+        length = len(self.post_levels)
+        for position in range(0, min(length, post_context_lines)):
+            if self.post_levels[position] < level:
+                self.post_levels[position] = level
+        for _ in range(length, post_context_lines):
+            self.post_levels.append(level)
+
     def add_line(self, level, line, *args, **kwargs):
         """Add a line to the buffer.
 
@@ -366,42 +1988,190 @@ class OutputBuffer(object):
 
           post_context_lines (Optional[int]): the number of lines after this
             one to set to log level `level`.  This defaults to 0.
+
+          extra (Optional[Dict[str, Any]]): extra LogRecord attributes to log
+            the line with.  This defaults to None.
         """
         current_level = level
         pre_context_lines = kwargs.get('pre_context_lines')
         post_context_lines = kwargs.get('post_context_lines')
+        extra = kwargs.get('extra')
         if self.post_context_lines:
             if self.post_levels:
-                current_level = max(current_level, self.post_levels.pop(0))
+                current_level = max(current_level,
+                                    self.post_levels.popleft())
             if post_context_lines:
-                for position, post_level in enumerate(self.post_levels):
-                    if position >= post_context_lines:
-                        break
-                    self.post_levels[position] = max(post_level, level)
-                length = len(self.post_levels)
-                if length < post_context_lines:
-                    for _ in range(length, post_context_lines):
-                        self.post_levels.append(level)
+                self.update_post_levels(level, post_context_lines)
         if self.pre_context_lines:
             if pre_context_lines and self.buffer:
                 self.update_buffer_levels(level, pre_context_lines)
-            self.buffer.append({
-                'level': current_level, 'line': line, 'args': args,
-                'time': time.time()
-            })
-            num_pop = max(len(self.buffer) - self.pre_context_lines, 0)
+            self.buffer.append(BufferedLine(current_level, line, args,
+                                            extra=extra))
+            num_pop = len(self.buffer) - self.pre_context_lines
             if num_pop > 0:
                 self.pop_buffer(num=num_pop)
+        elif extra:
+            self.logger.log(current_level, line, *args, extra=extra)
         else:
             self.logger.log(current_level, line, *args)
 
 
+# SpanBuffer {{{1
+class SpanBuffer(object):
+    """Buffer an arbitrary number of lines for a block error_check, i.e.
+    everything from a 'start' line through an 'end' line.
+
+    Since a block can be arbitrarily large, once the buffered lines exceed
+    max_bytes, they're spilled to a temp file on disk.  Iterating over the
+    SpanBuffer yields the spilled lines first, then the in-memory lines.
+
+    Attributes:
+      max_bytes (int): the memory budget before spilling to disk
+      lines (List[Tuple[int, str]]): the in-memory (level, line) pairs
+      num_bytes (int): the approximate size of the in-memory lines
+      num_lines (int): the total number of lines in the span
+      worst_level (int): the highest level of any line in the span
+      spill_file (file): the temp file spilled lines are written to, if any
+    """
+    def __init__(self, max_bytes=DEFAULT_SPAN_BYTES):
+        self.max_bytes = max_bytes
+        self.lines = []
+        self.num_bytes = 0
+        self.num_lines = 0
+        self.worst_level = 0
+        self.spill_file = None
+
+    def add_line(self, level, line):
+        """Add a line to the span, spilling to disk if we're over budget.
+
+        Args:
+          level (int): the logging level for the line.
+          line (str): the line to log.
+        """
+        self.lines.append((level, line))
+        self.num_bytes += len(line)
+        self.num_lines += 1
+        self.worst_level = max(self.worst_level, level)
+        if self.num_bytes > self.max_bytes:
+            self.spill()
+
+    def spill(self):
+        """Write the in-memory lines to the spill file, one json list per
+        line, and clear them from memory.
+        """
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile()
+        for level, line in self.lines:
+            self.spill_file.write(
+                json.dumps([level, line]).encode('utf-8') + b'\n'
+            )
+        self.lines = []
+        self.num_bytes = 0
+
+    def __iter__(self):
+        if self.spill_file is not None:
+            self.spill_file.flush()
+            self.spill_file.seek(0)
+            for raw in self.spill_file:
+                level, line = json.loads(raw.decode('utf-8'))
+                yield level, line
+        for level, line in self.lines:
+            yield level, line
+
+    def close(self):
+        """Clean up the spill file, if any.
+        """
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
+        self.lines = []
+
+
+# Warning aggregation helpers {{{1
+def normalize_line(line):
+    """Mask the paths and numbers in line, so repeated warnings that differ
+    only by file, line number, etc. can be counted together.
+
+    Args:
+      line (str): the line to normalize.
+
+    Returns:
+      str: the normalized line.
+    """
+    line = AGGREGATE_PATH_RE.sub('<path>', line)
+    return AGGREGATE_NUMBER_RE.sub('<n>', line)
+
+
+# Error index helpers {{{1
+def build_index_record(line_number, offset, level, error_check):
+    """Build an error index record for a matching line of output.
+
+    Args:
+      line_number (int): the 1-based line number of the line.
+      offset (int): the byte offset of the start of the line.
+      level (int): the level the line was classified at.
+      error_check (Dict[str, str or regex]): the error_check that matched.
+
+    Returns:
+      Dict[str, Any]: the error index record.
+    """
+    return {
+        'line_number': line_number,
+        'offset': offset,
+        'level': level,
+        'check': describe_error_check(error_check),
+        'explanation': error_check.get('explanation'),
+    }
+
+
+def write_error_index(error_index, path):
+    """Write error index records to path as json lines.
+
+    Args:
+      error_index (List[Dict[str, Any]]): the error index records.
+      path (str): the path to write to.
+    """
+    make_parent_dir(path, level=logging.DEBUG)
+    with codecs.open(path, 'w', encoding='utf-8') as filehandle:
+        for record in error_index:
+            filehandle.write(json.dumps(record, sort_keys=True) + '\n')
+
+
 # OutputParser {{{1
 class OutputParser(object):
     """Helper object to parse command output.
+
+    Attributes:
+      logger (logging.Logger): the logger to log with
+      error_list (ErrorList): the error_list to parse with
+      history (Dict[str, int]): num_errors, num_warnings, and worst_level
+      context_buffer (OutputBuffer): the context line buffer, if needed
+      block_checks (List[Dict[str, regex]]): the block error_checks in
+        error_list, which have 'start' and 'end' regexes
+      span_buffer (SpanBuffer): the buffer for the open block, if any
+      block_check (Dict[str, regex]): the error_check for the open block
+      multiline (Dict[str, Any]): the open multi-line event, if any: its
+        'check', its 'lines', and the 'line_number' and 'offset' of its
+        first line.  Otherwise None.
+      profile (List[Dict[str, Any]]): per-error_check evaluation counts,
+        hit counts, and cumulative evaluation time, if profiling.
+        Otherwise None.
+      error_index (List[Dict[str, Any]]): a record for every line classified
+        logging.WARNING or above, if indexing.  Otherwise None.
+      num_lines (int): the number of lines parsed so far
+      num_bytes (int): the number of bytes of raw output parsed so far
+      aggregate (int): if set, only the first of each repeated warning is
+        logged, and finish() logs the top `aggregate` repeated warnings.
+        Otherwise None.
+      aggregated (Dict[Tuple[int, str], Dict[str, Any]]): the 'count' and
+        the first 'line' of each distinct warning, keyed by the id() of the
+        error_check and the normalized line, if aggregating.
+      redactor (scriptharness.redact.Redactor): if set, each line is
+        redacted before it's parsed.  Otherwise None.
     """
 
-    def __init__(self, error_list, logger=None, **kwargs):
+    def __init__(self, error_list, logger=None, profile=False, index=False,
+                 aggregate=None, redactor=None, **kwargs):
         """Initialization method for the OutputParser class
 
         Args:
@@ -410,6 +2180,21 @@ class OutputParser(object):
 
           logger (Optional[logging.Logger]): logger to use.  Defaults to None.
 
+          profile (Optional[bool]): if True, keep track of how often and how
+            long each error_check is evaluated, and how often it matches.
+            This adds timing overhead to every line.  Defaults to False.
+
+          index (Optional[bool]): if True, build self.error_index.
+            Defaults to False.
+
+          aggregate (Optional[int]): if set, count warnings that match the
+            same error_check with the same normalized text, instead of
+            logging each one, and log the top `aggregate` in finish().
+            Defaults to None.
+
+          redactor (Optional[scriptharness.redact.Redactor]): redact secrets
+            from each line before parsing it.  Defaults to None.
+
           **kwargs: These are ignored, and are here so we can subclass
             ParsedCommand.
         """
@@ -424,12 +2209,42 @@ class OutputParser(object):
         self.context_buffer = None
         if error_list.pre_context_lines or error_list.post_context_lines:
             self.context_buffer = OutputBuffer(
-                logger, error_list.pre_context_lines,
+                self.logger, error_list.pre_context_lines,
                 error_list.post_context_lines
             )
+        self.block_checks = [x for x in error_list if 'start' in x]
+        self.span_buffer = None
+        self.block_check = None
+        self.multiline = None
+        self.profile = None
+        if profile:
+            self.profile = [{
+                'index': num, 'check': describe_error_check(error_check),
+                'evaluations': 0, 'hits': 0, 'time': 0.0,
+            } for num, error_check in enumerate(error_list)]
+        self.error_index = [] if index else None
+        self.num_lines = 0
+        self.num_bytes = 0
+        self.aggregate = aggregate
+        self.aggregated = {} if aggregate is not None else None
+        self.redactor = redactor
+
+    def update_history(self, level):
+        """Update the error and warning counts and the worst level.
 
-    def add_buffer(self, level, messages, error_check=None):
-        """Add the line to self.context_buffer if it exists, otherwise log it.
+        Args:
+          level (int): the logging level of the matched line or block.
+        """
+        if level > logging.WARNING:
+            self.history['num_errors'] += 1
+        elif level > logging.INFO:
+            self.history['num_warnings'] += 1
+        self.history['worst_level'] = max(self.history['worst_level'],
+                                          level)
+
+    def log_line(self, level, line, error_check=None):
+        """Send a single line to self.span_buffer if there's an open block,
+        otherwise self.context_buffer if it exists, otherwise log it.
 
         Args:
           level (int): logging level to log the line at
@@ -438,24 +2253,135 @@ class OutputParser(object):
 
           error_check (Optional[Dict[str, str or regex]]): the error_check in
             error_list that first matched line, if applicable.  Defaults to None.
+            Its description is logged as the record's error_check attribute,
+            for JsonLinesFormatter.
         """
-        error_check = error_check or {}
-        for line in messages.split('\n'):
+        if self.span_buffer is not None:
+            self.span_buffer.add_line(level, line)
+        elif not error_check:
+            if self.context_buffer:
+                self.context_buffer.add_line(level, line)
+            else:
+                self.logger.log(level, line)
+        else:
+            extra = {'error_check': describe_error_check(error_check)}
             if self.context_buffer:
                 self.context_buffer.add_line(
                     level, line,
                     pre_context_lines=error_check.get('pre_context_lines', 0),
                     post_context_lines=error_check.get('post_context_lines',
                                                        0),
+                    extra=extra,
                 )
             else:
-                self.logger.log(level, line)
-        if level > logging.WARNING:
-            self.history['num_errors'] += 1
-        elif level > logging.INFO:
-            self.history['num_warnings'] += 1
-        self.history['worst_level'] = max(self.history['worst_level'],
-                                          level)
+                self.logger.log(level, line, extra=extra)
+
+    def add_buffer(self, level, messages, error_check=None):
+        """Log each line in messages via self.log_line(), and update
+        self.history.
+
+        Args:
+          level (int): logging level to log the line at
+
+          messages (str): newline-delimited lines to log
+
+          error_check (Optional[Dict[str, str or regex]]): the error_check in
+            error_list that first matched line, if applicable.  Defaults to None.
+        """
+        for line in messages.split('\n'):
+            self.log_line(level, line, error_check=error_check)
+        self.update_history(level)
+
+    def open_block(self, line):
+        """If line matches the 'start' of a block error_check, start
+        buffering the block.  add_line() closes the block after parsing
+        line if it also matches the 'end'.
+
+        Args:
+          line (str): a line of output to parse.
+        """
+        for error_check in self.block_checks:
+            if error_check['start'].search(line):
+                self.block_check = error_check
+                self.span_buffer = SpanBuffer()
+                break
+
+    def continue_multiline(self, line):
+        """If there's an open multi-line event, see if line is part of it.
+        If line matches 'last', the event is complete; if line matches
+        neither 'next' nor 'last', the event ended on the previous line.
+
+        Args:
+          line (str): a line of output to parse.
+
+        Returns:
+          bool: True if line is part of the open multi-line event.
+        """
+        if self.multiline is None:
+            return False
+        error_check = self.multiline['check']
+        if 'last' in error_check and error_check['last'].search(line):
+            self.multiline['lines'].append(line)
+            self.close_multiline()
+            return True
+        if error_check['next'].search(line):
+            self.multiline['lines'].append(line)
+            return True
+        self.close_multiline()
+        return False
+
+    def close_multiline(self):
+        """Log the open multi-line event as a single event at the
+        error_check's level.
+        """
+        multiline = self.multiline
+        self.multiline = None
+        error_check = multiline['check']
+        level = error_check.get('level', logging.ERROR)
+        if level < 0:  # ignore negative levels
+            return
+        messages = [' %s' % line for line in multiline['lines']]
+        if error_check.get('explanation'):
+            messages.append(' %s' % error_check['explanation'])
+        self.add_buffer(level, '\n'.join(messages), error_check=error_check)
+        if self.error_index is not None and level >= logging.WARNING:
+            record = build_index_record(
+                multiline['line_number'], multiline['offset'], level,
+                error_check
+            )
+            record['end_line_number'] = \
+                multiline['line_number'] + len(multiline['lines']) - 1
+            self.error_index.append(record)
+
+    def close_block(self):
+        """Log every line in the open block at the worst level in the block,
+        or the block error_check's level, whichever is higher.
+        """
+        if self.multiline is not None:
+            self.close_multiline()
+        span_buffer = self.span_buffer
+        error_check = self.block_check
+        self.span_buffer = None
+        self.block_check = None
+        level = max(span_buffer.worst_level, error_check['level'])
+        for _, line in span_buffer:
+            self.log_line(level, line)
+        span_buffer.close()
+        if error_check.get('explanation'):
+            self.log_line(level, ' %s' % error_check['explanation'])
+        self.update_history(error_check['level'])
+
+    def finish(self):
+        """Log any lines that are still buffered.  Call this once the
+        command is done, otherwise the last lines of output may be lost.
+        """
+        if self.multiline is not None:
+            self.close_multiline()
+        if self.span_buffer is not None:
+            self.close_block()
+        if self.context_buffer:
+            self.context_buffer.dump_buffer()
+        self.log_aggregated()
 
     def add_line(self, line):
         """parse a line and check if it matches one in `error_list`,
@@ -464,27 +2390,207 @@ class OutputParser(object):
         Args:
           line (str): a line of output to parse.
         """
+        offset = self.num_bytes
+        if isinstance(line, six.text_type):
+            self.num_bytes += len(line.encode('utf-8'))
+        else:
+            self.num_bytes += len(line)
+        self.num_lines += 1
         line = to_unicode(line.rstrip())
-        for error_check in self.error_list:
-            match = False
-            if 'substr' in error_check:
-                if error_check['substr'] in line:
-                    match = True
-            elif error_check['regex'].search(line):
-                match = True
-            if match:
-                messages = [' %s' % line]
-                if error_check.get('explanation'):
-                    messages.append(' %s' % error_check['explanation'])
-                # exception default level is logging.ERROR
-                level = error_check.get('level', logging.ERROR)
-                if level >= 0:  # ignore negative levels
+        if self.redactor is not None:
+            line = self.redactor.redact(line)
+        if not self.continue_multiline(line):
+            self.parse_line(line, offset)
+        # This includes the line that opened the block, so a line that
+        # matches both 'start' and 'end' is a block of its own.
+        if self.span_buffer is not None and \
+                self.block_check['end'].search(line):
+            self.close_block()
+
+    def parse_line(self, line, offset):
+        """Match a line that isn't part of an open multi-line event, and log
+        it, or start a new multi-line event.
+
+        Args:
+          line (str): a line of output to parse.
+
+          offset (int): the byte offset of line in the output.
+        """
+        if self.block_checks and self.span_buffer is None:
+            self.open_block(line)
+        if self.profile is None:
+            error_check = self.match_line(line)
+        else:
+            error_check = self.profile_match_line(line)
+        if error_check is not None and 'first' in error_check:
+            self.multiline = {
+                'check': error_check, 'lines': [line],
+                'line_number': self.num_lines, 'offset': offset,
+            }
+        elif error_check is not None:
+            messages = [' %s' % line]
+            if error_check.get('explanation'):
+                messages.append(' %s' % error_check['explanation'])
+            # exception default level is logging.ERROR
+            level = error_check.get('level', logging.ERROR)
+            if level >= 0:  # ignore negative levels
+                if self.aggregate_line(level, line, error_check):
+                    self.update_history(level)
+                else:
                     self.add_buffer(level, '\n'.join(messages),
                                     error_check=error_check)
-                if error_check.get('exception'):
-                    if self.context_buffer:
-                        self.context_buffer.dump_buffer()
-                    raise error_check['exception'](messages)
-                break
+            if self.error_index is not None and level >= logging.WARNING:
+                self.error_index.append(build_index_record(
+                    self.num_lines, offset, level, error_check
+                ))
+            if error_check.get('exception'):
+                self.finish()
+                raise error_check['exception'](messages)
         else:
             self.add_buffer(logging.INFO, ' %s' % line, error_check=None)
+
+    def aggregate_line(self, level, line, error_check):
+        """If aggregating, count a warning line.
+
+        Args:
+          level (int): the logging level of the line.
+
+          line (str): the line.
+
+          error_check (Dict[str, str or regex]): the error_check that
+            matched line.
+
+        Returns:
+          bool: True if line repeats an earlier warning, and shouldn't be
+            logged.
+        """
+        if self.aggregated is None or \
+                not logging.WARNING <= level < logging.ERROR:
+            return False
+        key = (id(error_check), normalize_line(line))
+        if key in self.aggregated:
+            self.aggregated[key]['count'] += 1
+            return True
+        self.aggregated[key] = {'count': 1, 'line': line}
+        return False
+
+    def log_aggregated(self, level=logging.WARNING):
+        """Log the top self.aggregate repeated warnings, most frequent
+        first.
+
+        Args:
+          level (Optional[int]): the logging level to log at.  Defaults to
+            logging.WARNING.
+        """
+        if not self.aggregated:
+            return
+        repeated = sorted(
+            [x for x in self.aggregated.values() if x['count'] > 1],
+            key=lambda x: x['count'], reverse=True
+        )
+        if not repeated:
+            return
+        self.logger.log(
+            level, "Repeated warnings (top %d of %d):",
+            min(self.aggregate, len(repeated)), len(repeated)
+        )
+        self.logger.log(level, AGGREGATE_FMT % {'count': 'count',
+                                                'line': 'first occurrence'})
+        for stats in repeated[:self.aggregate]:
+            self.logger.log(level, AGGREGATE_FMT % stats)
+
+    @staticmethod
+    def check_line(error_check, line):
+        """Determine whether a single error_check matches line.
+
+        Args:
+          error_check (Dict[str, str or regex]): a single item of error_list.
+          line (str): a line of output.
+
+        Returns:
+          bool: True on match.  Block error_checks never match here.
+        """
+        if 'substr' in error_check:
+            return error_check['substr'] in line
+        elif 'regex' in error_check:
+            return error_check['regex'].search(line) is not None
+        elif 'first' in error_check:
+            return error_check['first'].search(line) is not None
+        return False
+
+    def match_line(self, line):
+        """Find the first error_check in error_list that matches line.
+
+        Args:
+          line (str): a line of output.
+
+        Returns:
+          Dict[str, str or regex]: the matching error_check, or None.
+        """
+        for error_check in self.error_list:
+            if self.check_line(error_check, line):
+                return error_check
+        return None
+
+    def profile_match_line(self, line):
+        """match_line(), but record evaluation counts, hit counts, and
+        evaluation time for each error_check in self.profile.
+
+        Args:
+          line (str): a line of output.
+
+        Returns:
+          Dict[str, str or regex]: the matching error_check, or None.
+        """
+        for index, error_check in enumerate(self.error_list):
+            stats = self.profile[index]
+            start = default_timer()
+            match = self.check_line(error_check, line)
+            stats['time'] += default_timer() - start
+            stats['evaluations'] += 1
+            if match:
+                stats['hits'] += 1
+                return error_check
+        return None
+
+    def log_profile(self, level=logging.INFO):
+        """Log self.profile as a table, most expensive error_check first.
+
+        Args:
+          level (Optional[int]): the logging level to log at.  Defaults to
+            logging.INFO.
+        """
+        if self.profile is None:
+            return
+        self.logger.log(level, PROFILE_FMT % {
+            'index': '#', 'evaluations': 'evaluations', 'hits': 'hits',
+            'time': 'time (ms)', 'check': 'error_check',
+        })
+        for stats in sorted(self.profile, key=lambda x: x['time'],
+                            reverse=True):
+            repl_dict = dict(stats)
+            repl_dict['time'] = "%.3f" % (stats['time'] * 1000)
+            self.logger.log(level, PROFILE_FMT % repl_dict)
+
+    def write_profile(self, path):
+        """Write self.profile to path as json.
+
+        Args:
+          path (str): the path to write to.
+        """
+        if self.profile is None:
+            return
+        make_parent_dir(path, level=logging.DEBUG)
+        with open(path, 'w') as filehandle:
+            filehandle.write(json.dumps(self.profile, sort_keys=True,
+                                        indent=4))
+
+    def write_error_index(self, path):
+        """Write self.error_index to path as json lines, one record per line.
+
+        Args:
+          path (str): the path to write to.
+        """
+        if self.error_index is None:
+            return
+        write_error_index(self.error_index, path)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Extract a single action's or command's output from a log, using the
+segment index written by scriptharness.log.IndexedFileHandler.
+
+Rather than reading the whole log, this seeks to the segment's start
+offset and reads only its bytes, so showing the "build" action of a
+multi-hundred-MB log stays cheap.
+
+Usage::
+
+  python -m scriptharness.log_index LOG --list
+  python -m scriptharness.log_index LOG --action build
+  python -m scriptharness.log_index LOG --command-id 3
+
+Attributes:
+  DEFAULT_CHUNK_SIZE (int): the default number of bytes to read at a time
+"""
+from __future__ import absolute_import, division, print_function, \
+                       unicode_literals
+import argparse
+import json
+import os
+from scriptharness.exceptions import ScriptHarnessException
+from scriptharness.log import SEGMENT_INDEX_SUFFIX
+import six
+import sys
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+# Index helpers {{{1
+def read_segment_index(path, index_path=None):
+    """Read the segment index for a log.
+
+    Args:
+      path (str): the path to the log.
+      index_path (Optional[str]): the path to the index.  Defaults to
+        path + SEGMENT_INDEX_SUFFIX.
+
+    Returns:
+      List[Dict[str, Any]]: the segments, in the order they ended.
+
+    Raises:
+      scriptharness.exceptions.ScriptHarnessException: if the index doesn't
+        exist.
+    """
+    index_path = index_path or os.path.abspath(path) + SEGMENT_INDEX_SUFFIX
+    if not os.path.exists(index_path):
+        raise ScriptHarnessException("No segment index!", index_path)
+    with open(index_path) as filehandle:
+        return [json.loads(line) for line in filehandle if line.strip()]
+
+
+def find_segments(segments, action=None, command_id=None):
+    """Find the segments for an action or a command.
+
+    Args:
+      segments (List[Dict[str, Any]]): the segment index.
+      action (Optional[str]): the action name to find.
+      command_id (Optional[int]): the command id to find.
+
+    Returns:
+      List[Dict[str, Any]]: the matching segments, in log order.
+
+    Raises:
+      scriptharness.exceptions.ScriptHarnessException: if neither or both
+        of action and command_id are set, or nothing matches.
+    """
+    if (action is None) == (command_id is None):
+        raise ScriptHarnessException(
+            "Specify exactly one of action or command_id!"
+        )
+    if action is not None:
+        found = [x for x in segments
+                 if x['type'] == 'action' and x['name'] == action]
+    else:
+        found = [x for x in segments
+                 if x['type'] == 'command' and x['name'] == command_id]
+    if not found:
+        raise ScriptHarnessException(
+            "No matching segment!", action, command_id
+        )
+    return sorted(found, key=lambda x: x['start_offset'])
+
+
+def iter_slice(path, segment, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Read a segment's bytes from the log, without reading the rest.
+
+    Args:
+      path (str): the path to the log.
+      segment (Dict[str, Any]): the segment to read.
+      chunk_size (Optional[int]): the max bytes to read at a time.
+
+    Yields:
+      bytes: the next chunk of the segment.
+    """
+    remaining = segment['end_offset'] - segment['start_offset']
+    with open(path, 'rb') as filehandle:
+        filehandle.seek(segment['start_offset'])
+        while remaining > 0:
+            chunk = filehandle.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def read_slice(path, segment):
+    """Read a segment of the log as text.
+
+    Args:
+      path (str): the path to the log.
+      segment (Dict[str, Any]): the segment to read.
+
+    Returns:
+      str: the segment's log lines.
+    """
+    return b''.join(iter_slice(path, segment)).decode('utf-8', 'replace')
+
+
+# main {{{1
+def main(cmdln_args=None):
+    """Commandline entry point.
+
+    Args:
+      cmdln_args (Optional[List[str]]): override sys.argv[1:]
+    """
+    parser = argparse.ArgumentParser(
+        description="Extract an action's or command's output from a log."
+    )
+    parser.add_argument("path", help="The log file.")
+    parser.add_argument("--index", help="The segment index, if it isn't "
+                                        "at PATH%s." % SEGMENT_INDEX_SUFFIX)
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--list", action="store_true",
+                       help="List the indexed segments as json lines.")
+    group.add_argument("--action", help="The action to extract.")
+    group.add_argument("--command-id", type=int,
+                       help="The command id to extract.")
+    args = parser.parse_args(cmdln_args)
+    segments = read_segment_index(args.path, index_path=args.index)
+    if args.list:
+        for segment in segments:
+            print(json.dumps(segment, sort_keys=True))
+        return
+    # py2 sys.stdout and py3 sys.stdout.buffer take bytes
+    out = getattr(sys.stdout, 'buffer', None)
+    if out is None and six.PY2:
+        out = sys.stdout
+    for segment in find_segments(segments, action=args.action,
+                                 command_id=args.command_id):
+        for chunk in iter_slice(args.path, segment):
+            if out is None:
+                sys.stdout.write(chunk.decode('utf-8', 'replace'))
+            else:
+                out.write(chunk)
+    (out or sys.stdout).flush()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,421 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Re-parse existing log files with an ErrorList, offline.
+
+Usage::
+
+  python -m scriptharness.parse_log --error-list MAKE_ERROR_LIST build.log
+  python -m scriptharness.parse_log --error-list my_list.json \\
+      --index build.log.errors.jsonl --jobs 8 build.log
+
+The log file is memory-mapped and split into newline-aligned chunks.  Each
+chunk is matched against the ErrorList in a process pool, and the results
+are merged in order.  Context lines, block error_checks, and multi-line
+error_checks are resolved during the merge, so they work across chunk
+boundaries.  The error index has the same records, in the same order, as
+the one OutputParser builds at runtime.
+
+Attributes:
+  DEFAULT_CHUNK_SIZE (int): the default chunk size, in bytes.
+"""
+from __future__ import absolute_import, division, print_function, \
+                       unicode_literals
+import argparse
+import json
+import logging
+import mmap
+import multiprocessing
+import os
+import scriptharness.errorlists
+from scriptharness.errorlists import ErrorList, load_error_list
+from scriptharness.exceptions import ScriptHarnessException
+from scriptharness.log import OutputParser, build_index_record, \
+    write_error_index
+import sys
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+# Helper functions {{{1
+def get_error_list(name):
+    """Find an ErrorList by name.
+
+    Args:
+      name (str): either the name of an ErrorList in scriptharness.errorlists,
+        e.g. MAKE_ERROR_LIST, or the path to a json or yaml ErrorList
+        description, as written by save_error_list().
+
+    Returns:
+      ErrorList: the error_list.
+
+    Raises:
+      scriptharness.exceptions.ScriptHarnessException: if the ErrorList
+        can't be found or loaded.
+    """
+    error_list = getattr(scriptharness.errorlists, name, None)
+    if error_list is None and os.path.isfile(name):
+        error_list = load_error_list(name)
+    if not isinstance(error_list, ErrorList):
+        raise ScriptHarnessException("%s is not an ErrorList!" % name)
+    return error_list
+
+
+def get_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Split the file at path into newline-aligned (start, end) byte ranges.
+
+    Args:
+      path (str): the path to the log file.
+      chunk_size (Optional[int]): the approximate chunk size, in bytes.
+
+    Returns:
+      List[Tuple[int, int]]: the byte ranges, in order.
+    """
+    size = os.path.getsize(path)
+    if not size:
+        return []
+    chunks = []
+    with open(path, 'rb') as filehandle:
+        contents = mmap.mmap(filehandle.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start = 0
+            while start < size:
+                end = contents.find(b'\n', min(start + chunk_size, size) - 1)
+                end = size if end < 0 else end + 1
+                chunks.append((start, end))
+                start = end
+        finally:
+            contents.close()
+    return chunks
+
+
+def split_lines(data):
+    """Split bytes into lines, keeping the line endings.
+
+    Unlike bytes.splitlines(), this only splits on b'\\n', so '\\r' progress
+    output and other line-ish control characters don't add lines.  That
+    matches how OutputParser and `wc -l` count lines.
+
+    Args:
+      data (bytes): the data to split.
+
+    Returns:
+      List[bytes]: the lines.  The last line won't end with b'\\n' if data
+        doesn't.
+    """
+    lines = [x + b'\n' for x in data.split(b'\n')]
+    last = lines.pop()[:-1]
+    if last:
+        lines.append(last)
+    return lines
+
+
+def scan_chunk(args):
+    """Match every line in a chunk of the log file against the error_list.
+
+    This runs in a process pool worker, so it takes a single tuple of args.
+
+    Args:
+      args (Tuple[str, int, int, ErrorList]): the path to the log file,
+        the start and end byte offsets of the chunk, and the error_list.
+
+    Returns:
+      Dict[str, Any]: 'num_lines', the number of lines in the chunk;
+        'matches', a list of (line, offset, error_check index) for each
+        matching line, relative to the chunk; 'blocks', a list of
+        (line, start indices, end indices) for each line that
+        matches the start or end of a block error_check; and 'multiline',
+        a list of (line, next indices, last indices) for each line that
+        matches the 'next' or 'last' of a multi-line error_check.
+    """
+    path, start, end, error_list = args
+    block_checks = [(index, error_check) for index, error_check in
+                    enumerate(error_list) if 'start' in error_check]
+    multiline_checks = [(index, error_check) for index, error_check in
+                        enumerate(error_list) if 'first' in error_check]
+    matches = []
+    blocks = []
+    multiline = []
+    num_lines = 0
+    offset = 0
+    with open(path, 'rb') as filehandle:
+        contents = mmap.mmap(filehandle.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            data = contents[start:end]
+        finally:
+            contents.close()
+    for raw in split_lines(data):
+        line = raw.rstrip().decode('utf-8', 'replace')
+        for index, error_check in enumerate(error_list):
+            if OutputParser.check_line(error_check, line):
+                matches.append((num_lines, offset, index))
+                break
+        if block_checks:
+            starts = [index for index, error_check in block_checks
+                      if error_check['start'].search(line)]
+            ends = [index for index, error_check in block_checks
+                    if error_check['end'].search(line)]
+            if starts or ends:
+                blocks.append((num_lines, starts, ends))
+        if multiline_checks:
+            nexts = [index for index, error_check in multiline_checks
+                     if error_check['next'].search(line)]
+            lasts = [index for index, error_check in multiline_checks
+                     if 'last' in error_check and
+                     error_check['last'].search(line)]
+            if nexts or lasts:
+                multiline.append((num_lines, nexts, lasts))
+        num_lines += 1
+        offset += len(raw)
+    return {'num_lines': num_lines, 'matches': matches, 'blocks': blocks,
+            'multiline': multiline}
+
+
+# LogParser {{{1
+class LogParser(object):
+    """Merge the chunk results from scan_chunk() into a history and an
+    error index, like OutputParser would have built at runtime.
+
+    Attributes:
+      error_list (ErrorList): the error_list to parse with.
+      history (Dict[str, int]): num_lines, num_errors, num_warnings, and
+        worst_level.
+      error_index (List[Dict[str, Any]]): a record for every line or
+        multi-line event classified logging.WARNING or above, like
+        OutputParser.error_index.  finish() sorts it by offset.
+    """
+    def __init__(self, error_list):
+        self.error_list = error_list
+        self.history = {
+            'num_lines': 0,
+            'num_errors': 0,
+            'num_warnings': 0,
+            'worst_level': 0,
+        }
+        self.error_index = []
+        self._block = None
+        self._multiline = None
+
+    def update_history(self, level):
+        """Update the error and warning counts and the worst level, the same
+        way OutputParser.update_history() does.
+
+        Args:
+          level (int): the level of the matched line or block.
+        """
+        if level > logging.WARNING:
+            self.history['num_errors'] += 1
+        elif level > logging.INFO:
+            self.history['num_warnings'] += 1
+        self.history['worst_level'] = max(self.history['worst_level'],
+                                          level)
+
+    def add_match(self, line_number, offset, error_check):
+        """Add a matching line.
+
+        Args:
+          line_number (int): the absolute, 1-based line number.
+          offset (int): the absolute byte offset of the line.
+          error_check (Dict[str, str or regex]): the matching error_check.
+        """
+        if 'first' in error_check:
+            self._multiline = {
+                'error_check': error_check, 'line_number': line_number,
+                'offset': offset, 'end_line_number': line_number,
+            }
+            return
+        self.add_event(line_number, offset, error_check)
+
+    def add_event(self, line_number, offset, error_check,
+                  end_line_number=None):
+        """Count and index a matching line or multi-line event.
+
+        Args:
+          line_number (int): the absolute, 1-based line number.
+          offset (int): the absolute byte offset of the line.
+          error_check (Dict[str, str or regex]): the matching error_check.
+          end_line_number (Optional[int]): the last line number of a
+            multi-line event.
+        """
+        level = error_check.get('level', logging.ERROR)
+        if level < 0:
+            return
+        self.update_history(level)
+        if level < logging.WARNING:
+            return
+        record = build_index_record(line_number, offset, level, error_check)
+        if end_line_number is not None:
+            record['end_line_number'] = end_line_number
+        self.error_index.append(record)
+
+    def continue_multiline(self, line_number, nexts, lasts):
+        """If there's an open multi-line event, see if the line is part of
+        it, like OutputParser.continue_multiline().
+
+        Args:
+          line_number (int): the absolute, 1-based line number.
+          nexts (List[int]): the error_list indices whose 'next' matched.
+          lasts (List[int]): the error_list indices whose 'last' matched.
+
+        Returns:
+          bool: True if the line is part of the open multi-line event.
+        """
+        multiline = self._multiline
+        if multiline is None:
+            return False
+        index = self.error_list.index(multiline['error_check'])
+        if line_number == multiline['end_line_number'] + 1:
+            if index in lasts:
+                multiline['end_line_number'] = line_number
+                self.close_multiline()
+                return True
+            if index in nexts:
+                multiline['end_line_number'] = line_number
+                return True
+        self.close_multiline()
+        return False
+
+    def close_multiline(self):
+        """Count and index the open multi-line event.
+        """
+        multiline = self._multiline
+        self._multiline = None
+        self.add_event(multiline['line_number'], multiline['offset'],
+                       multiline['error_check'],
+                       end_line_number=multiline['end_line_number'])
+
+    def add_block_event(self, line_number, starts, ends):
+        """Open or close a block, like OutputParser.open_block() and
+        OutputParser.close_block().
+
+        Args:
+          line_number (int): the absolute, 1-based line number.
+          starts (List[int]): the error_list indices whose 'start' matched.
+          ends (List[int]): the error_list indices whose 'end' matched.
+        """
+        if self._block is None:
+            if starts:
+                self._block = {'index': starts[0], 'line_number': line_number}
+        elif self._block['index'] in ends:
+            self.close_block()
+
+    def close_block(self):
+        """Close the open block.  Like OutputParser, the block itself isn't
+        indexed; its matching lines already are.
+        """
+        if self._multiline is not None:
+            self.close_multiline()
+        block = self._block
+        self._block = None
+        self.update_history(self.error_list[block['index']]['level'])
+
+    def add_chunk(self, offset, result):
+        """Merge the result of scan_chunk() for the next chunk.
+
+        Args:
+          offset (int): the byte offset of the start of the chunk.
+          result (Dict[str, Any]): the return value of scan_chunk().
+        """
+        base_line = self.history['num_lines'] + 1
+        lines = {}
+        for line, line_offset, index in result['matches']:
+            lines.setdefault(line, {})['match'] = (line_offset, index)
+        for line, starts, ends in result['blocks']:
+            lines.setdefault(line, {})['block'] = (starts, ends)
+        for line, nexts, lasts in result['multiline']:
+            lines.setdefault(line, {})['multiline'] = (nexts, lasts)
+        for line in sorted(lines):
+            line_number = base_line + line
+            events = lines[line]
+            nexts, lasts = events.get('multiline', ([], []))
+            starts, ends = events.get('block', ([], []))
+            # Like OutputParser, a line that continues a multi-line event
+            # isn't matched on its own.  A block is opened before parsing
+            # the line, and the 'end' of a block is checked afterwards.
+            if not self.continue_multiline(line_number, nexts, lasts):
+                if starts:
+                    self.add_block_event(line_number, starts, [])
+                if 'match' in events:
+                    self.add_match(line_number, offset + events['match'][0],
+                                   self.error_list[events['match'][1]])
+            if ends:
+                self.add_block_event(line_number, [], ends)
+        self.history['num_lines'] += result['num_lines']
+
+    def finish(self):
+        """Close any open multi-line event or block, and sort the error
+        index by offset.  Multi-line events are indexed when they close,
+        which can be after later lines were indexed.
+        """
+        if self._multiline is not None:
+            self.close_multiline()
+        if self._block is not None:
+            self.close_block()
+        self.error_index.sort(key=lambda record: record['offset'])
+
+
+# parse_log {{{1
+def parse_log(path, error_list, jobs=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Apply error_list to the log file at path.
+
+    Args:
+      path (str): the path to the log file.
+      error_list (ErrorList): the error_list to parse with.
+      jobs (Optional[int]): the number of worker processes.  If 1, don't
+        use a process pool.  Defaults to multiprocessing.cpu_count().
+      chunk_size (Optional[int]): the approximate chunk size, in bytes.
+
+    Returns:
+      LogParser: with the history and error_index.
+    """
+    chunks = get_chunks(path, chunk_size=chunk_size)
+    args = [(path, start, end, error_list) for start, end in chunks]
+    if jobs == 1 or len(chunks) < 2:
+        results = [scan_chunk(arg) for arg in args]
+    else:
+        pool = multiprocessing.Pool(jobs)  # pylint: disable=not-callable
+        try:
+            results = pool.map(scan_chunk, args)
+        finally:
+            pool.close()
+            pool.join()
+    log_parser = LogParser(error_list)
+    for (start, _), result in zip(chunks, results):
+        log_parser.add_chunk(start, result)
+    log_parser.finish()
+    return log_parser
+
+
+def main(cmdln_args=None):
+    """Commandline entry point.
+
+    Args:
+      cmdln_args (Optional[List[str]]): override sys.argv[1:]
+    """
+    parser = argparse.ArgumentParser(
+        description="Re-parse a log file with an ErrorList."
+    )
+    parser.add_argument("path", help="The log file to parse.")
+    parser.add_argument(
+        "--error-list", required=True,
+        help="An ErrorList name in scriptharness.errorlists, or the path "
+             "to a json or yaml ErrorList description."
+    )
+    parser.add_argument("--index", help="Write the error index here.")
+    parser.add_argument("--jobs", type=int, help="Number of processes.")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Approximate chunk size, in bytes.")
+    args = parser.parse_args(cmdln_args)
+    error_list = get_error_list(args.error_list)
+    log_parser = parse_log(args.path, error_list, jobs=args.jobs,
+                           chunk_size=args.chunk_size)
+    if args.index:
+        write_error_index(log_parser.error_index, args.index)
+    summary = dict(log_parser.history)
+    if not args.index:
+        summary['error_index'] = log_parser.error_index
+    print(json.dumps(summary, sort_keys=True, indent=4))
+    return log_parser
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -9,6 +9,7 @@ import psutil
 from psutil import NoSuchProcess
 from scriptharness.exceptions import ScriptHarnessError, ScriptHarnessFatal, \
     ScriptHarnessTimeout
+from scriptharness.log import dump_ring_handlers
 from six.moves.queue import Empty
 import subprocess
 import sys
@@ -144,11 +145,13 @@ def watch_command(logger, queue, runner, # pylint: disable=too-many-arguments
                 message = "%d seconds without output!" % output_timeout
                 logger.error(message + "  Killing process...")
                 kill_runner(runner)
+                dump_ring_handlers("Timeout: %s" % message)
                 raise ScriptHarnessTimeout(message)
             if max_timeout and (start_time + max_timeout < now):
                 message = "Hit max timeout of %d seconds!" % max_timeout
                 logger.error(message + "  Killing process...")
                 kill_runner(runner)
+                dump_ring_handlers("Timeout: %s" % message)
                 raise ScriptHarnessTimeout(message)
 
 
@@ -197,10 +200,12 @@ def watch_output(logger, runner, stdout, # pylint: disable=too-many-arguments
                 message = "%d seconds without output!" % output_timeout
                 logger.error(message + "  Killing process...")
                 runner.kill()
+                dump_ring_handlers("Timeout: %s" % message)
                 raise ScriptHarnessTimeout(message)
         if max_timeout and (start_time + max_timeout < now):
             message = "Hit max timeout of %d seconds!" % max_timeout
             logger.error(message + "  Killing process...")
             runner.kill()
+            dump_ring_handlers("Timeout: %s" % message)
             raise ScriptHarnessTimeout(message)
         time.sleep(.1)
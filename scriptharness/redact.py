@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Mask secrets in logged output.
+
+A Redactor masks literal secret values, like passwords from config keys
+marked 'secret' in the ConfigTemplate, and regex-defined token shapes.
+All of them are combined into a single alternation regex, so each line is
+scanned once no matter how many secrets there are.
+
+Redactors can be passed to scriptharness.commands.Command,
+scriptharness.log.OutputParser, and scriptharness.structures.LoggingDict.
+Script sets its Redactor as the default with set_default_redactor(), and
+Commands use the default unless they're passed another one.
+
+Attributes:
+  LOGGER_NAME (str): logging.getLogger name
+  DEFAULT_MASK (str): the string secrets are replaced with.
+  MIN_SECRET_LENGTH (int): shorter secret values are ignored, since masking
+    every '1' or 'no' in the log would make it unreadable.
+  TOKEN_PATTERNS (Tuple[str, ...]): regex patterns for some common token
+    shapes.  These aren't used unless passed to a Redactor; Script passes
+    them if the scriptharness_redact_tokens config variable is set.
+  DEFAULT_REDACTOR (List[Redactor]): a one-item list holding the default
+    Redactor; see set_default_redactor().
+"""
+from __future__ import absolute_import, division, print_function, \
+                       unicode_literals
+import logging
+import re
+from scriptharness.errorlists import get_regex_compiler
+from scriptharness.unicode import to_unicode
+import six
+
+LOGGER_NAME = "scriptharness.redact"
+DEFAULT_MASK = '********'
+MIN_SECRET_LENGTH = 4
+TOKEN_PATTERNS = (
+    r'\bgh[pousr]_[A-Za-z0-9]{36,}',
+    r'\bAKIA[0-9A-Z]{16}\b',
+    r'\bxox[abposr]-[A-Za-z0-9-]{10,}',
+    r'\b[Bb]earer\s+[A-Za-z0-9._~+/-]+=*',
+)
+DEFAULT_REDACTOR = [None]
+
+
+# Redactor {{{1
+class Redactor(object):
+    """Mask secret values and token patterns in text.
+
+    Attributes:
+      secrets (Set[str]): the literal secret values to mask.
+      patterns (List[str]): the regex patterns to mask.
+      mask (str): the replacement string.
+      engine (str): the regex engine; see
+        scriptharness.errorlists.REGEX_ENGINES.
+      matcher (regex): the combined regex, or None if it needs to be
+        rebuilt.
+      replacement (str): self.mask, escaped for matcher.sub().
+    """
+    def __init__(self, secrets=None, patterns=None, mask=DEFAULT_MASK,
+                 engine='re'):
+        """Initialization method for the Redactor class
+
+        Args:
+          secrets (Optional[List[str]]): literal secret values to mask.
+
+          patterns (Optional[List[str or regex]]): regex patterns to mask.
+
+          mask (Optional[str]): the replacement string.  Defaults to
+            DEFAULT_MASK.
+
+          engine (Optional[str]): the regex engine.  Defaults to 're'.
+        """
+        self.secrets = set()
+        self.patterns = []
+        self.mask = mask
+        self.engine = engine
+        self.matcher = None
+        self.replacement = None
+        for secret in secrets or []:
+            self.add_secret(secret)
+        for pattern in patterns or []:
+            self.add_pattern(pattern)
+
+    def add_secret(self, secret):
+        """Add a literal secret value to mask.
+
+        Args:
+          secret (str): the secret.  Non-strings, like int passwords, are
+            converted to strings.  Secrets shorter than MIN_SECRET_LENGTH
+            are ignored, with a warning.
+        """
+        if not isinstance(secret, six.string_types):
+            secret = six.text_type(secret)
+        secret = to_unicode(secret)
+        if len(secret) < MIN_SECRET_LENGTH:
+            logging.getLogger(LOGGER_NAME).warning(
+                "Not masking a secret shorter than %d characters!",
+                MIN_SECRET_LENGTH
+            )
+            return
+        if secret in self.secrets:
+            return
+        self.secrets.add(secret)
+        self.matcher = None
+
+    def add_pattern(self, pattern):
+        """Add a regex pattern to mask.
+
+        Patterns are combined into a single regex, so they can't use
+        global inline flags like (?i); flags on a re.compile()d pattern are
+        ignored.
+
+        Args:
+          pattern (str or regex): the pattern.
+        """
+        if hasattr(pattern, 'pattern'):
+            pattern = pattern.pattern
+        self.patterns.append(pattern)
+        self.matcher = None
+
+    def compile(self):
+        """Build self.matcher from self.secrets and self.patterns.
+
+        Longer secrets come first, so a secret that contains another secret
+        is masked entirely.
+        """
+        alternatives = [re.escape(x) for x in
+                        sorted(self.secrets, key=len, reverse=True)]
+        alternatives.extend(["(?:%s)" % x for x in self.patterns])
+        self.matcher = get_regex_compiler(self.engine)('|'.join(alternatives))
+        self.replacement = self.mask.replace('\\', '\\\\')
+
+    def redact(self, text):
+        """Mask every secret and token in text.
+
+        Args:
+          text (str): the text to redact.
+
+        Returns:
+          str: the redacted text.
+        """
+        if not self.secrets and not self.patterns:
+            return text
+        if self.matcher is None:
+            self.compile()
+        return self.matcher.sub(self.replacement, text)
+
+    def redact_data(self, data):
+        """Mask every secret and token in the strings of a data structure.
+
+        Redacting repr()ed or pprint.pformat()ed text misses secrets that
+        are escaped (e.g. ones with quotes or backslashes) or wrapped
+        across lines, so data should be redacted before it's formatted.
+
+        Args:
+          data (Any): a string, or a dict, list or tuple of them.  Dict
+            keys and values are both redacted.
+
+        Returns:
+          Any: a redacted copy of data, using plain dicts, lists and
+            tuples; other values are returned as-is.
+        """
+        if isinstance(data, six.string_types):
+            return self.redact(data)
+        if isinstance(data, dict):
+            return dict([(self.redact_data(key), self.redact_data(value))
+                         for key, value in dict.items(data)])
+        if isinstance(data, list):
+            return [self.redact_data(x) for x in data]
+        if isinstance(data, tuple):
+            return tuple([self.redact_data(x) for x in data])
+        return data
+
+
+# Default redactor {{{1
+
+def set_default_redactor(redactor):
+    """Set the Redactor that Commands use when they aren't passed one.
+
+    Args:
+      redactor (Redactor): the default redactor, or None.
+    """
+    DEFAULT_REDACTOR[0] = redactor
+
+
+def get_default_redactor():
+    """Get the Redactor set by set_default_redactor().
+
+    Returns:
+      Redactor: the default redactor, or None.
+    """
+    return DEFAULT_REDACTOR[0]
@@ -11,11 +11,14 @@ Attributes:
   PRE_ACTION (str): the pre-action phase constant
   POST_ACTION (str): the post-action phase constant
   RUN_ACTION (str): the run-action phase constant
+  CONFIG_BACKUPS (int): the number of previous localconfig.json dumps to
+    keep
 """
 from __future__ import absolute_import, division, print_function, \
                        unicode_literals
 import codecs
 import collections
+from copy import deepcopy
 import json
 import logging
 import os
@@ -24,6 +27,10 @@ from scriptharness.actions import Action
 from scriptharness.os import make_parent_dir
 import scriptharness.config as shconfig
 from scriptharness.exceptions import ScriptHarnessException, ScriptHarnessFatal
+from scriptharness.log import add_log_filters, dump_ring_handlers, \
+    flush_logger, log_context, rotate_file, summarize_rate_limits
+from scriptharness.redact import Redactor, set_default_redactor, \
+    TOKEN_PATTERNS
 from scriptharness.structures import iterate_pairs, LoggingDict, ReadOnlyDict
 import sys
 import time
@@ -38,6 +45,7 @@ RUN_ACTION = "run_action"
 POST_FATAL = "post_fatal"
 LISTENER_PHASES = (PRE_RUN, POST_RUN, PRE_ACTION, POST_ACTION, POST_FATAL)
 ALL_PHASES = tuple(list(LISTENER_PHASES) + [RUN_ACTION])
+CONFIG_BACKUPS = 5
 
 Context = collections.namedtuple(
     'Context', ['script', 'config', 'logger', 'action', 'phase']
@@ -51,15 +59,17 @@ phases, Context.action is None.
 
 
 # Helper functions {{{1
-def save_config(config, path):
+def save_config(config, path, backups=0):
     """Save the configuration file to path as json.
 
     Args:
       config (Dict[str, str]): The config to save
       path (str): The path to write the config to
+      backups (Optional[int]): if path exists, rotate it to path.1, etc.,
+        keeping this many old copies.  Defaults to 0.
     """
     make_parent_dir(path)
-    # log rotation would be nice.
+    rotate_file(path, backups)
     with codecs.open(path, 'w', encoding='utf-8') as filehandle:
         filehandle.write(json.dumps(config, sort_keys=True, indent=4))
 
@@ -134,8 +144,13 @@ class Script(object):
       listeners (Dict[str, Tuple[Callable[], List[str]]): Callbacks for run().
         Listener functions can be set for each of LISTENER_PHASES.
       logger (logging.Logger): the logger for the script
+      redactor (scriptharness.redact.Redactor): masks the values of config
+        variables marked 'secret', and TOKEN_PATTERNS if
+        scriptharness_redact_tokens is set, in the log.  It's also the
+        default redactor for Commands.  None if there's nothing to mask.
     """
     config = None
+    redactor = None
 
     def __init__(self, actions, template, name='root', **kwargs):
         """Script.__init__
@@ -168,6 +183,9 @@ class Script(object):
         If --dump-config is in the commandline arguments, the script will
         dump the config to screen and disk, and exit.
 
+        If scriptharness_log_filters is set, its RateLimitFilters are added
+        to the handlers that exist at this point.
+
         Args:
           template (ConfigTemplate): template to parse and validate
             the config.
@@ -179,7 +197,16 @@ class Script(object):
         """
         parsed_args = shconfig.parse_args(template, cmdln_args)
         config = shconfig.build_config(template, parsed_args, initial_config)
+        secrets = template.get_secrets(config)
+        patterns = None
+        if config.get('scriptharness_redact_tokens'):
+            patterns = TOKEN_PATTERNS
+        if secrets or patterns:
+            self.redactor = Redactor(secrets=secrets, patterns=patterns)
+            set_default_redactor(self.redactor)
         self.dict_to_config(config)
+        if config.get('scriptharness_log_filters'):
+            add_log_filters(config['scriptharness_log_filters'])
         enable_actions(parsed_args, self.actions)
         if parsed_args.__dict__.get("scriptharness_volatile_dump_config"):
             logger = self.get_logger()
@@ -189,15 +216,27 @@ class Script(object):
 
     def save_config(self):
         """Save config to disk.
+
+        This dumps a plain deepcopy of the config, so the LoggingDict
+        children aren't all wrapped just to be printed.  The logged copy
+        is redacted before it's formatted, since pformat() can escape or
+        wrap secrets.
         """
         logger = self.get_logger()
-        for line in pprint.pformat(self.config).splitlines():
+        config = deepcopy(self.config)
+        logged_config = config
+        if self.redactor is not None:
+            logged_config = self.redactor.redact_data(config)
+        for line in pprint.pformat(logged_config).splitlines():
+            if self.redactor is not None:
+                line = self.redactor.redact(line)
             logger.info(line)
         save_config(
-            self.config,
+            config,
             os.path.join(
                 self.config['scriptharness_artifact_dir'], "localconfig.json"
-            )
+            ),
+            backups=CONFIG_BACKUPS
         )
 
     def dict_to_config(self, config):
@@ -207,7 +246,8 @@ class Script(object):
         easily stayed part of self.build_config().
         """
         self.config = LoggingDict(
-            config, logger_name=config.get('logger_name', LOGGER_NAME)
+            config, logger_name=config.get('logger_name', LOGGER_NAME),
+            redactor=self.redactor
         )
         self.config.recursively_set_parent(name="%s.config" % self.name)
 
@@ -292,7 +332,9 @@ class Script(object):
 
         Raises:
           scriptharness.exceptions.ScriptHarnessFatal: when the Action
-          raises ScriptHarnessFatal, this method re-raises.
+          raises ScriptHarnessFatal, this method logs any rate limit
+          summaries, flushes the logger's handlers (draining any async log
+          queue), dumps any RingHandlers, and re-raises.
         """
         repl_dict = {
             'name': action.name,
@@ -307,10 +349,11 @@ class Script(object):
             if actions and action.name not in actions:
                 continue
             listener(context)
-        logger.info(action.strings['run_message'], repl_dict)
         try:
             context = build_context(self, RUN_ACTION, action=action)
-            action.run(context)
+            with log_context(action_name=action.name):
+                logger.info(action.strings['run_message'], repl_dict)
+                action.run(context)
         except ScriptHarnessFatal:
             context = build_context(self, POST_FATAL, action=action)
             for listener, actions in \
@@ -318,12 +361,17 @@ class Script(object):
                 if actions and action.name not in actions:
                     continue
                 listener(context)
+            summarize_rate_limits()
+            flush_logger(logger)
+            dump_ring_handlers("Fatal error in action %s" % action.name)
             raise
         context = build_context(self, POST_ACTION, action=action)
         for listener, actions in iterate_pairs(self.listeners['post_action']):
             if actions and action.name not in actions:
                 continue
             listener(context)
+        summarize_rate_limits()
+        flush_logger(logger)
 
     def get_logger(self):
         """Get a logger to log messages.
@@ -331,8 +379,10 @@ class Script(object):
         This is not strictly needed, as python's logging module will
         keep track of these loggers.
 
-        However, if we support structured logging as well as python logging,
-        get_logger() may return one or the other depending on config.
+        Structured logging is handled by adding a handler with a
+        scriptharness.log.JsonLinesFormatter, e.g. via
+        scriptharness.log.get_json_handler(); Script.run() and run_action()
+        set the script and action names it logs.
 
         This method may end up moving to the scriptharness module, and tracked
         in ScriptManager.
@@ -368,15 +418,16 @@ class Script(object):
     def run(self):
         """Run all enabled actions.
         """
-        context = build_context(self, PRE_RUN)
-        for listener, _ in iterate_pairs(self.listeners[PRE_RUN]):
-            listener(context)
-        for action in self.actions:
-            self.run_action(action)
-        context = build_context(self, POST_RUN)
-        for listener, _ in iterate_pairs(self.listeners[POST_RUN]):
-            listener(context)
-        self.end_message()
+        with log_context(script_name=self.name):
+            context = build_context(self, PRE_RUN)
+            for listener, _ in iterate_pairs(self.listeners[PRE_RUN]):
+                listener(context)
+            for action in self.actions:
+                self.run_action(action)
+            context = build_context(self, POST_RUN)
+            for listener, _ in iterate_pairs(self.listeners[POST_RUN]):
+                listener(context)
+            self.end_message()
 
 
 # StrictScript {{{1
@@ -20,10 +20,16 @@ Attributes:
     the values in the list/dict shouldn't be logged
   SUPPORTED_LOGGING_TYPES (Dict[TypeVar, Class]): a non-logging to logging class map, e.g.
     dict: LoggingDict.  Not currently supporting sets or collections.
+  SUPPORTED_TYPES (Tuple[TypeVar, ...]): the keys of
+    SUPPORTED_LOGGING_TYPES, for isinstance().
+  DEFAULT_SNAPSHOT_INTERVAL (int): by default, LoggingLists log a full
+    snapshot of themselves after every change.
 """
 
 from __future__ import absolute_import, division, print_function, \
                        unicode_literals
+from collections import OrderedDict
+from contextlib import contextmanager
 from copy import deepcopy
 from scriptharness.exceptions import ScriptHarnessException
 import six
@@ -34,12 +40,14 @@ import pprint
 # Constants {{{1
 DEFAULT_LEVEL = logging.INFO
 DEFAULT_LOGGER_NAME = 'scriptharness.data_structures'
+DEFAULT_SNAPSHOT_INTERVAL = 1
 QUOTES = ("'", '"', "'''", '"""')
 LOGGING_STRINGS = {
     # position, self, item
     "list": {
         "delitem": "__delitem__ %(item)s",
         "log_self": "now looks like %(self)s",
+        "log_delta": "changed at position %(position)s; now %(length)d items",
         "setitem": "__setitem__ %(position)d to %(item)s",
         "append": "appending %(item)s",
         "extend": "extending with %(item)s",
@@ -73,12 +81,20 @@ LOGGING_STRINGS = {
             "changed": "update: %(key)s now %(value)s",
             "unchanged": "update: %(key)s unchanged",
         },
+        "batch": {
+            "message": "batch %(reason)s: %(count)d keys changed",
+            "added": "batch: %(key)s added as %(value)s",
+            "changed": "batch: %(key)s now %(value)s",
+            "removed": "batch: %(key)s removed",
+            "rollback": "batch %(reason)s: rolled back %(count)d keys",
+        },
     },
 }
 MUTED_LOGGING_STRINGS = {
     # position, self, item
     "list": {
         "delitem": "__delitem__ %(item)s",
+        "log_delta": "changed at position %(position)s; now %(length)d items",
         "setitem": "__setitem__ %(position)d ...",
         "append": "appending ...",
         "extend": "extending ...",
@@ -112,6 +128,13 @@ MUTED_LOGGING_STRINGS = {
             "changed": "update: %(key)s changed",
             "unchanged": "update: %(key)s unchanged",
         },
+        "batch": {
+            "message": "batch %(reason)s: %(count)d keys changed",
+            "added": "batch: %(key)s added",
+            "changed": "batch: %(key)s changed",
+            "removed": "batch: %(key)s removed",
+            "rollback": "batch %(reason)s: rolled back %(count)d keys",
+        },
     },
 }
 
@@ -137,6 +160,38 @@ def iterate_pairs(data):
 
 
 # LoggingClasses and helpers {{{1
+def get_child_name(name):
+    """Get the subscript that full_name() appends for a child's name.
+
+    Args:
+      name (int or str): the child's index or key.
+
+    Returns:
+      str: the subscript, e.g. [2] or ['key'].  String keys are quoted with
+        the first of QUOTES that isn't in the key.
+    """
+    if isinstance(name, int):
+        return "[%d]" % name
+    quote = ""
+    for sep in QUOTES:
+        if sep not in name:
+            quote = sep
+            break
+    return "[%s%s%s]" % (quote, name, quote)
+
+
+def get_path_name(path):
+    """Get the subscripts for a path of keys and indices.
+
+    Args:
+      path (Iterable[int or str]): the keys and indices, outermost first.
+
+    Returns:
+      str: the subscripts, e.g. ['env']['PATH'].
+    """
+    return "".join([get_child_name(name) for name in path])
+
+
 # LoggingClass {{{2
 class LoggingClass(object):
     """General logging methods for the Logging* classes to subclass.
@@ -146,11 +201,28 @@ class LoggingClass(object):
       logger_name (str): the logger name to use
       name (str): the name of the class for logs
       parent (str): the name of the parent, if applicable, for logs
+      redactor (scriptharness.redact.Redactor): if set, secrets are masked
+        in log messages.  Children use their ancestors' redactor.
+      snapshot_interval (int): how often LoggingLists log a full snapshot
+        of themselves; see LoggingList.log_delta().  Children use their
+        ancestors' snapshot_interval, or DEFAULT_SNAPSHOT_INTERVAL.
+      cached_full_name (str): the cached full_name(), or None if it needs to
+        be rebuilt.
+      cached_redactor (list): the cached get_redactor(), as a one-item
+        list since the redactor may be None, or None if it needs to be
+        looked up again.
+      current_batch (LoggingBatch): set while LoggingDict.batch() is
+        coalescing the changes to self and its descendants.
     """
     name = None
     parent = None
     level = None
     logger_name = None
+    redactor = None
+    snapshot_interval = None
+    cached_full_name = None
+    cached_redactor = None
+    current_batch = None
 
     def items(self):
         """Return dict.items() for dicts, and enumerate(self) for lists+tuples.
@@ -178,6 +250,9 @@ class LoggingClass(object):
         For each child, set name automatically.  For dicts, the name is the
         key.  For everything else, the name is the index.
 
+        This also clears the cached full_name() and get_redactor() of self
+        and its descendants, since they depend on our name and ancestors.
+
         Args:
           name (Optional[str]): set self.name, for later logging purposes.
             Defaults to None.
@@ -189,6 +264,8 @@ class LoggingClass(object):
             self.name = name
         if parent is not None:
             self.parent = parent
+        self.cached_full_name = None
+        self.cached_redactor = None
         for child_name, child in self.items():
             if is_logging_class(child):
                 child.recursively_set_parent(
@@ -230,38 +307,93 @@ class LoggingClass(object):
     def full_name(self):
         """Get the full name of self.
 
-        This will call self.ancestor_child_list to get the original ancestor +
-        all the names of its descendents up to and including self, then
-        build the name from that.
-
-        Args:
-          ancestor (Optional[LoggingClass]): specify the ancestor
-          child_list (Optional[List[str]]): a list of descendents' names, in order
+        This is the original ancestor's name plus the subscripts of all of
+        its descendents up to and including self.  Since log_change() calls
+        this on every change, it's built from the parent's cached full name
+        and cached in turn, until recursively_set_parent() renames or
+        re-parents self or an ancestor.
 
         Returns:
           str: the full name of self.
         """
-        ancestor, child_list = self.ancestor_child_list()
-        name = ancestor.name or ""
-        for item in child_list:
-            if isinstance(item, int):
-                name += "[%d]" % item
+        if self.cached_full_name is None:
+            if self.parent:
+                self.cached_full_name = self.parent.full_name() + \
+                    get_child_name(self.name)
             else:
-                quote = ""
-                item = item
-                for sep in QUOTES:
-                    if sep not in item:
-                        quote = sep
-                        break
-                name += "[%s%s%s]" % (quote, item, quote)
-        return name
+                self.cached_full_name = self.name or ""
+        return self.cached_full_name
+
+    def get_redactor(self):
+        """Get the redactor for self or the nearest ancestor that has one.
+
+        Like full_name(), this is cached, since log_change() calls it on
+        every change.
+
+        Returns:
+          scriptharness.redact.Redactor: the redactor, or None.
+        """
+        if self.cached_redactor is None:
+            redactor = self.redactor
+            if redactor is None and self.parent is not None:
+                redactor = self.parent.get_redactor()
+            self.cached_redactor = [redactor]
+        return self.cached_redactor[0]
+
+    def get_snapshot_interval(self):
+        """Get the snapshot_interval for self or the nearest ancestor that has
+        one.
+
+        Returns:
+          int: the snapshot interval.
+        """
+        item = self
+        while item is not None:
+            if item.snapshot_interval is not None:
+                return item.snapshot_interval
+            item = item.parent
+        return DEFAULT_SNAPSHOT_INTERVAL
+
+    def find_batch(self):
+        """Find the batch that self or the nearest ancestor is in, if any.
+
+        This only walks up the ancestors while a batch is open somewhere,
+        so changes outside of batches don't pay for it.
+
+        Returns:
+          LoggingBatch, tuple: the batch, or None, and the path of keys and
+            indices from the batch dict down to self.  The path is None if
+            there's no batch.
+        """
+        if not LoggingBatch.open_batches:
+            return None, None
+        item = self
+        path = []
+        while item is not None:
+            if item.current_batch is not None:
+                path.reverse()
+                return item.current_batch, tuple(path)
+            path.append(item.name)
+            item = item.parent
+        return None, None
 
     def log_change(self, message, repl_dict=None):
         """Log a change to self.
 
+        If there's a redactor, the message is formatted before logging, so
+        the secrets can be masked.  repl_dict is redacted before
+        formatting, since the repr() of a nested value can escape secrets.
+
+        Inside a LoggingDict.batch(), this records what is about to change
+        instead of logging.
+
         Args:
           message (str): The message to log.
         """
+        batch, path = self.find_batch()
+        if batch is not None:
+            batch.record(self, path, repl_dict)
+            return None
         logger = logging.getLogger(self.logger_name)
         name = self.full_name()
         if name:
@@ -269,6 +401,11 @@ class LoggingClass(object):
         args = [self.level, message]
         if repl_dict:
             args.append(repl_dict)
+        redactor = self.get_redactor()
+        if redactor is not None:
+            if repl_dict:
+                message = message % redactor.redact_data(repl_dict)
+            args = [self.level, redactor.redact(message)]
         return logger.log(*args)
 
 
@@ -281,12 +418,22 @@ class LoggingList(LoggingClass, list):
       logger_name (str): the logger name to use
       muted (bool): whether our logging messages are muted
       strings (Dict[str, str]): a dict of strings to use for messages
+      redactor (scriptharness.redact.Redactor): if set, secrets are masked
+        in log messages
+      snapshot_interval (int): log a full snapshot every this many changes;
+        see log_delta()
+      changes (int): the number of changes since the last snapshot
     """
+    changes = 0
+
     def __init__(self, items, level=DEFAULT_LEVEL, muted=False,
-                 logger_name=DEFAULT_LOGGER_NAME):
+                 logger_name=DEFAULT_LOGGER_NAME, redactor=None,
+                 snapshot_interval=None):
         self.level = level
         self.logger_name = logger_name
         self.muted = muted
+        self.redactor = redactor
+        self.snapshot_interval = snapshot_interval
         self.strings = get_strings(self, muted=self.muted)
         super(LoggingList, self).__init__(
             [add_logging_to_obj(x, logger_name=self.logger_name,
@@ -305,7 +452,7 @@ class LoggingList(LoggingClass, list):
         if isinstance(item, slice):
             position = item.start
         super(LoggingList, self).__delitem__(item)
-        self.log_self()
+        self.log_delta(position)
         if position < len(self):
             self.child_set_parent(position)
 
@@ -317,7 +464,7 @@ class LoggingList(LoggingClass, list):
         item = add_logging_to_obj(item, logger_name=self.logger_name,
                                   level=self.level, muted=self.muted)
         super(LoggingList, self).__setitem__(position, item)
-        self.log_self()
+        self.log_delta(position)
         self.child_set_parent(position)
 
     def child_set_parent(self, position=0):
@@ -332,12 +479,41 @@ class LoggingList(LoggingClass, list):
         """Log the current list.
 
         Since some methods insert values or rearrange them, it'll be easier to
-        debug things if we log the list after those operations.
+        debug things if we log the list after those operations.  This can
+        also be called directly to log a snapshot on demand.
         """
+        self.changes = 0
         if self.strings.get('log_self'):
             self.log_change(self.strings['log_self'],
                             repl_dict={'self': pprint.pformat(self)})
 
+    def log_delta(self, position):
+        """Log the list after a change.
+
+        With a snapshot interval of 1, this logs the whole list via
+        log_self() after every change.  Formatting the whole list after
+        each append makes building a long list quadratic, so with a larger
+        interval this logs just the changed position and new length, and
+        a full snapshot every snapshot_interval changes.  An interval of 0
+        never logs a snapshot unless log_self() is called.  Inside a
+        LoggingDict.batch(), this logs nothing.
+
+        Args:
+          position (int): the first position that changed.
+        """
+        if self.find_batch()[0] is not None:
+            return
+        interval = self.get_snapshot_interval()
+        if interval == 1:
+            self.log_self()
+            return
+        self.log_change(self.strings['log_delta'],
+                        repl_dict={'position': position,
+                                   'length': len(self)})
+        self.changes += 1
+        if interval and self.changes >= interval:
+            self.log_self()
+
     def append(self, item):
         self.log_change(self.strings['append'],
                         repl_dict={'item': item})
@@ -345,7 +521,7 @@ class LoggingList(LoggingClass, list):
             add_logging_to_obj(item, logger_name=self.logger_name,
                                level=self.level, muted=self.muted)
         )
-        self.log_self()
+        self.log_delta(len(self) - 1)
         self.child_set_parent(len(self) - 1)
 
     def extend(self, item):
@@ -356,7 +532,7 @@ class LoggingList(LoggingClass, list):
             add_logging_to_obj(item, logger_name=self.logger_name,
                                level=self.level, muted=self.muted)
         )
-        self.log_self()
+        self.log_delta(position)
         self.child_set_parent(position)
 
     def insert(self, position, item):
@@ -371,7 +547,7 @@ class LoggingList(LoggingClass, list):
             position, add_logging_to_obj(item, logger_name=self.logger_name,
                                          level=self.level, muted=self.muted)
         )
-        self.log_self()
+        self.log_delta(position)
         self.child_set_parent(position)
 
     def remove(self, item):
@@ -379,7 +555,7 @@ class LoggingList(LoggingClass, list):
                         repl_dict={'item': item})
         position = self.index(item)
         super(LoggingList, self).remove(item)
-        self.log_self()
+        self.log_delta(position)
         if position < len(self):
             self.child_set_parent(position)
 
@@ -387,13 +563,14 @@ class LoggingList(LoggingClass, list):
         if position is None:
             self.log_change(self.strings['pop_no_args'])
             value = super(LoggingList, self).pop()
+            self.log_delta(len(self))
         else:
             self.log_change(
                 self.strings['pop_args'],
                 repl_dict={'position': position}
             )
             value = super(LoggingList, self).pop(position)
-        self.log_self()
+            self.log_delta(position)
         if position is not None:
             self.child_set_parent(position)
         return value
@@ -401,13 +578,13 @@ class LoggingList(LoggingClass, list):
     def sort(self, *args, **kwargs):
         self.log_change(self.strings['sort'])
         super(LoggingList, self).sort(*args, **kwargs)
-        self.log_self()
+        self.log_delta(0)
         self.child_set_parent()
 
     def reverse(self):
         self.log_change(self.strings['reverse'])
         super(LoggingList, self).reverse()
-        self.log_self()
+        self.log_delta(0)
         self.child_set_parent()
 
 
@@ -428,6 +605,156 @@ class LoggingTuple(LoggingClass, tuple):
         )
 
 
+# LoggingBatch {{{2
+class LoggingBatch(object):
+    """The changes to a LoggingDict during LoggingDict.batch().
+
+    Rather than logging every change, this records the path of keys and
+    indices to each value that's about to change, plus a deep copy of just
+    that value from before its first change.  For list changes and
+    dict.clear(), the path is that of the list or dict itself.  That's
+    enough to log a compact diff of the changed paths at the end of the
+    batch, or to roll them back.
+
+    Attributes:
+      open_batches (int): the number of batches open in this process.
+        While this is 0, log_change() doesn't look for a batch.
+      missing (object): the old value of a path that didn't exist before
+        the batch, or the new value of one that was removed.
+      logdict (LoggingDict): the dict being batched
+      reason (str): the reason for the batch, for logging
+      old_values (collections.OrderedDict): the paths that changed, in the
+        order of their first change, and their deep-copied old values.
+    """
+    open_batches = 0
+    missing = object()
+
+    def __init__(self, logdict, reason):
+        self.logdict = logdict
+        self.reason = reason
+        self.old_values = OrderedDict()
+
+    def record(self, container, path, repl_dict=None):
+        """Record that something in container is about to change.
+
+        Args:
+          container (LoggingClass): the dict or list that's changing.
+          path (tuple): the path from logdict down to container.
+          repl_dict (Optional[dict]): the log_change() repl_dict.  If
+            container is a dict and this has a 'key', only that key is
+            recorded; otherwise the whole container is.
+        """
+        if isinstance(container, dict) and repl_dict and 'key' in repl_dict:
+            key = repl_dict['key']
+            path = path + (key, )
+            value = dict.get(container, key, self.missing)
+        else:
+            value = container
+        if path in self.old_values:
+            return
+        for num in range(len(path)):
+            if path[:num] in self.old_values:
+                return
+        if value is not self.missing:
+            value = deepcopy(value)
+        self.old_values[path] = value
+
+    def get_value(self, path):
+        """Get the current value at path.
+
+        Args:
+          path (tuple): the path of keys and indices from logdict.
+
+        Returns:
+          Any: the value, or self.missing if it doesn't exist.
+        """
+        value = self.logdict
+        for key in path:
+            try:
+                value = value[key]
+            except (LookupError, TypeError):
+                return self.missing
+        return value
+
+    def changes(self):
+        """Compare the recorded paths against their old values.
+
+        Paths inside a path that also changed are left out, since the
+        outer path's new value includes them.
+
+        Returns:
+          List[Tuple[tuple, str, Any]]: a list of (path, change, value)
+            tuples, where change is one of 'added', 'changed', or 'removed',
+            sorted by path name.
+        """
+        changes = []
+        for path, old_value in self.old_values.items():
+            if any(path[:num] in self.old_values
+                   for num in range(len(path))):
+                continue
+            value = self.get_value(path)
+            if old_value is self.missing:
+                if value is self.missing:
+                    continue
+                change = 'added'
+            elif value is self.missing:
+                change = 'removed'
+            elif value != old_value:
+                change = 'changed'
+            else:
+                continue
+            changes.append((path, change, value))
+        return sorted(changes, key=lambda change: get_path_name(change[0]))
+
+    def log(self):
+        """Log the coalesced diff of the batch.
+        """
+        changes = self.changes()
+        strings = self.logdict.strings['batch']
+        self.logdict.log_change(
+            strings['message'],
+            repl_dict={'reason': self.reason, 'count': len(changes)}
+        )
+        for path, change, value in changes:
+            repl_dict = {'key': get_path_name(path)}
+            if change != 'removed':
+                repl_dict['value'] = value
+            self.logdict.log_change(strings[change], repl_dict=repl_dict)
+
+    def rollback(self):
+        """Restore the changed paths to their old values, and log that.
+
+        The paths are restored in the reverse order of their first change,
+        so a path that was replaced and then changed inside is restored
+        correctly.
+        """
+        changes = self.changes()
+        for path, old_value in reversed(list(self.old_values.items())):
+            if old_value is not self.missing:
+                old_value = add_logging_to_obj(
+                    old_value, logger_name=self.logdict.logger_name,
+                    level=self.logdict.level, muted=self.logdict.muted
+                )
+            if not path:
+                dict.clear(self.logdict)
+                dict.update(self.logdict, old_value)
+                continue
+            parent = self.get_value(path[:-1])
+            key = path[-1]
+            if isinstance(parent, dict):
+                if old_value is self.missing:
+                    dict.pop(parent, key, None)
+                else:
+                    dict.__setitem__(parent, key, old_value)
+            elif isinstance(parent, list) and key < len(parent):
+                list.__setitem__(parent, key, old_value)
+        self.logdict.recursively_set_parent()
+        self.logdict.log_change(
+            self.logdict.strings['batch']['rollback'],
+            repl_dict={'reason': self.reason, 'count': len(changes)}
+        )
+
+
 # LoggingDict {{{2
 class LoggingDict(LoggingClass, dict):
     """A dict that logs any changes, as do its children.
@@ -437,12 +764,19 @@ class LoggingDict(LoggingClass, dict):
       logger_name (str): the logger name to use
       muted (bool): whether our logging messages are muted
       strings (Dict[str, str]): a dict of strings to use for messages
+      redactor (scriptharness.redact.Redactor): if set, secrets are masked
+        in log messages
+      snapshot_interval (int): how often descendant LoggingLists log a full
+        snapshot of themselves; see LoggingList.log_delta()
     """
     def __init__(self, items, level=DEFAULT_LEVEL, muted=False,
-                 logger_name=DEFAULT_LOGGER_NAME):
+                 logger_name=DEFAULT_LOGGER_NAME, redactor=None,
+                 snapshot_interval=None):
         self.level = level
         self.logger_name = logger_name
         self.muted = muted
+        self.redactor = redactor
+        self.snapshot_interval = snapshot_interval
         self.strings = get_strings(self, muted=muted)
         for key, value in items.items():
             items[key] = add_logging_to_obj(
@@ -550,6 +884,19 @@ class LoggingDict(LoggingClass, dict):
         return status
 
     def update(self, args):
+        batch, path = self.find_batch()
+        if batch is not None:
+            new_args = {}
+            for key, value in iterate_pairs(args):
+                batch.record(self, path, {'key': key})
+                new_args[key] = add_logging_to_obj(
+                    value, logger_name=self.logger_name, level=self.level,
+                    muted=self.muted
+                )
+            super(LoggingDict, self).update(new_args)
+            for key in new_args:
+                self.child_set_parent(key)
+            return
         changed_keys = []
         new_args = {}
         for key, value in iterate_pairs(args):
@@ -571,6 +918,53 @@ class LoggingDict(LoggingClass, dict):
             )
             self.child_set_parent(key)
 
+    @contextmanager
+    def batch(self, reason, rollback=False):
+        """Coalesce the changes to self and its descendants into one diff.
+
+        Usage::
+
+            with config.batch("platform defaults"):
+                config.update(defaults)
+                config['env']['PATH'] = path
+
+        Changes are applied as usual, but instead of logging each one,
+        the changes are logged once when the block exits, e.g.
+        ``batch platform defaults: 2 keys changed`` followed by a line per
+        changed path, such as ``['env']['PATH']``, with its new value.  Lists in the batch don't log snapshots.  A batch inside
+        another batch on self or an ancestor is part of the outer batch.
+
+        Args:
+          reason (str): why the batch is happening, for the log.
+          rollback (Optional[bool]): if the block raises, restore the
+            changed keys to their values from the start of the batch
+            rather than logging the diff.  Defaults to False.
+
+        Yields:
+          LoggingDict: self
+        """
+        if self.find_batch()[0] is not None:
+            yield self
+            return
+        batch = LoggingBatch(self, reason)
+        self.current_batch = batch
+        LoggingBatch.open_batches += 1
+        try:
+            yield self
+        except Exception:
+            self.current_batch = None
+            LoggingBatch.open_batches -= 1
+            if rollback:
+                batch.rollback()
+            else:
+                batch.log()
+            raise
+        finally:
+            if self.current_batch is not None:
+                self.current_batch = None
+                LoggingBatch.open_batches -= 1
+        batch.log()
+
     def __deepcopy__(self, memo):
         """Return a dict on deepcopy()
         """
@@ -587,6 +981,7 @@ SUPPORTED_LOGGING_TYPES = {
     list: LoggingList,
     tuple: LoggingTuple,
 }
+SUPPORTED_TYPES = tuple(SUPPORTED_LOGGING_TYPES)
 
 def is_logging_class(item):
     """Determine if a class is one of the Logging* classes.
@@ -608,10 +1003,14 @@ def add_logging_to_obj(item, **kwargs):
     Returns:
       A logging version of item, when applicable, or item.
     """
+    logging_class = SUPPORTED_LOGGING_TYPES.get(type(item))
+    if logging_class is not None:
+        return logging_class(item, **kwargs)
     result = item
-    for key, value in SUPPORTED_LOGGING_TYPES.items():
-        if isinstance(item, key):
-            result = value(item, **kwargs)
+    if isinstance(item, SUPPORTED_TYPES):
+        for key, value in SUPPORTED_LOGGING_TYPES.items():
+            if isinstance(item, key):
+                result = value(item, **kwargs)
     return result
 
 def get_strings(instance_type, muted=False):
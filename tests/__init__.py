@@ -53,12 +53,19 @@ class LoggerReplacement(object):
         self.level_messages = {}
         self.simple = simple
 
-    def log(self, level, msg, *args):
+    @staticmethod
+    def isEnabledFor(_):  # pylint: disable=invalid-name
+        """Every level is enabled, so LogMethod always logs.
+        """
+        return True
+
+    def log(self, level, msg, *args, **kwargs):
         """Keep track of all calls to logger.log()
 
         self.all_messages gets a list of all (level, msg, *args).
         self.level_messages is a dict, with level keys; the values are lists
-        containing tuples of (msg, args) per log() call.
+        containing tuples of (msg, args) per log() call.  kwargs like extra
+        are ignored.
         """
         if self.simple:
             if args:
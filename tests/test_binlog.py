@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test scriptharness.binlog
+"""
+from __future__ import absolute_import, division, print_function, \
+                       unicode_literals
+import logging
+import mock
+import os
+from scriptharness.exceptions import ScriptHarnessException
+import scriptharness.binlog as binlog
+import shutil
+import six
+import tempfile
+import unittest
+from . import UNICODE_STRINGS
+
+
+# TestEncoding {{{1
+class TestEncoding(unittest.TestCase):
+    """Test the varint and arg encoding helpers
+    """
+    def test_values(self):
+        """test_binlog | write_value() and read_value() round trip
+        """
+        values = [None, True, False, 0, 1, -1, 127, 128, -300, 2 ** 70,
+                  1.5, -0.25, "", UNICODE_STRINGS[0]]
+        buf = bytearray()
+        for value in values:
+            binlog.write_value(buf, value)
+        pos = 0
+        for value in values:
+            decoded, pos = binlog.read_value(buf, pos)
+            self.assertEqual(decoded, value)
+            self.assertEqual(type(decoded), type(value))
+        self.assertEqual(pos, len(buf))
+
+    def test_unwritable(self):
+        """test_binlog | write_value() rejects other types
+        """
+        for value in ([1], (1, ), {'a': 1}, object()):
+            self.assertRaises(ValueError, binlog.write_value, bytearray(),
+                              value)
+
+
+# TestBinaryLog {{{1
+class TestBinaryLog(unittest.TestCase):
+    """Test BinaryLogHandler and the binary log reader
+    """
+    def setUp(self):
+        assert self  # silence pylint
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "log.bin")
+        self.logger = logging.getLogger("test_binlog")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+
+    def tearDown(self):
+        for handler in self.logger.handlers[:]:
+            self.logger.removeHandler(handler)
+            handler.close()
+        shutil.rmtree(self.tmpdir)
+
+    def write_log(self, mode='w'):
+        """Log some records through a BinaryLogHandler, one second apart.
+        """
+        handler = binlog.get_binary_handler(
+            self.path, logger=self.logger, level=logging.DEBUG, mode=mode,
+            block_records=2
+        )
+        with mock.patch('time.time') as mock_time:
+            for num in range(4):
+                mock_time.return_value = 1000.0 + num
+                self.logger.info("line %d %s %r", num, UNICODE_STRINGS[0],
+                                 num / 2)
+            mock_time.return_value = 1010.0
+            self.logger.getChild("child").warning(
+                "%(list)s %(none)s", {'list': [1, 2], 'none': None}
+            )
+            try:
+                raise ValueError("boom")
+            except ValueError:
+                self.logger.exception("failed")
+        self.logger.removeHandler(handler)
+        handler.close()
+
+    def messages(self, **kwargs):
+        """Get the rendered messages from the binary log.
+        """
+        return [x.getMessage() for x in
+                binlog.iter_records(self.path, **kwargs)]
+
+    def test_round_trip(self):
+        """test_binlog | records render as they were logged
+        """
+        self.write_log()
+        records = list(binlog.iter_records(self.path))
+        self.assertEqual(
+            [x.getMessage() for x in records[:5]],
+            ["line %d %s %r" % (x, UNICODE_STRINGS[0], x / 2)
+             for x in range(4)] + ["[1, 2] None"]
+        )
+        self.assertTrue(records[5].getMessage().startswith("failed\n"))
+        self.assertTrue("ValueError: boom" in records[5].getMessage())
+        self.assertEqual(records[0].created, 1000.0)
+        self.assertEqual(records[4].name, "test_binlog.child")
+        self.assertEqual(records[4].levelname, "WARNING")
+
+    def test_queries(self):
+        """test_binlog | time, level and logger queries
+        """
+        self.write_log()
+        self.assertEqual(len(self.messages(start=1001, end=1003)), 2)
+        self.assertEqual(len(self.messages(level=logging.WARNING)), 2)
+        self.assertEqual(self.messages(logger="test_binlog.child"),
+                         ["[1, 2] None"])
+        self.assertEqual(self.messages(logger="test_bin"), [])
+
+    def test_block_pruning(self):
+        """test_binlog | queries only read matching blocks
+        """
+        self.write_log()
+        index = binlog.read_index(self.path)
+        self.assertEqual([x['count'] for x in index['blocks']], [2, 2, 2])
+        with mock.patch('scriptharness.binlog.decode_record',
+                        wraps=binlog.decode_record) as decode:
+            self.assertEqual(len(self.messages(level=logging.ERROR)), 1)
+            self.assertEqual(decode.call_count, 1)
+        with mock.patch('scriptharness.binlog.iter_frames',
+                        wraps=binlog.iter_frames) as frames:
+            self.messages(start=1005)
+            # the index, the last block, and the unindexed tail
+            self.assertEqual(frames.call_count, 3)
+
+    def test_reindex(self):
+        """test_binlog | write_index() and a stale index
+        """
+        self.write_log()
+        os.remove(self.path + binlog.INDEX_SUFFIX)
+        self.assertRaises(ScriptHarnessException, binlog.read_index,
+                          self.path)
+        self.assertEqual(binlog.write_index(self.path, block_records=4), 6)
+        self.assertEqual(len(self.messages()), 6)
+        # a truncated frame from a crash is dropped on append
+        with open(self.path, 'ab') as filehandle:
+            filehandle.write(b'\x02\x7f')
+        self.write_log(mode='a')
+        index = binlog.read_index(self.path)
+        self.assertEqual(index['end'], os.path.getsize(self.path))
+        self.assertEqual(len(self.messages()), 12)
+
+    def test_string_table(self):
+        """test_binlog | argless messages inline, capped string table
+        """
+        handler = binlog.get_binary_handler(
+            self.path, logger=self.logger, level=logging.DEBUG,
+            max_strings=3
+        )
+        for num in range(3):
+            self.logger.info("unique output %d%%" % num)
+            self.logger.info("template %d", num)
+            self.logger.info("other %d template %s", num, "x")
+        self.logger.info("third %s template", "y")
+        handler.close()
+        self.assertEqual(
+            sorted(binlog.read_index(self.path)['strings'].values()),
+            ["other %d template %s", "template %d", "test_binlog"]
+        )
+        self.assertEqual(self.messages(), [
+            "unique output 0%", "template 0", "other 0 template x",
+            "unique output 1%", "template 1", "other 1 template x",
+            "unique output 2%", "template 2", "other 2 template x",
+            "third y template",
+        ])
+
+    def test_bad_log(self):
+        """test_binlog | not a binary log
+        """
+        with open(self.path, 'wb') as filehandle:
+            filehandle.write(b'plain text log\n')
+        self.assertRaises(ScriptHarnessException, binlog.write_index,
+                          self.path)
+
+    def test_main(self):
+        """test_binlog | main() rendering and --reindex
+        """
+        self.write_log()
+        with mock.patch('sys.stdout', new=six.StringIO()) as stdout:
+            binlog.main([self.path, '--level', 'warning', '--format',
+                         '%(levelname)s %(message)s'])
+        self.assertEqual(stdout.getvalue().splitlines()[:2],
+                         ["WARNING [1, 2] None", "ERROR failed"])
+        with mock.patch('sys.stdout', new=six.StringIO()) as stdout:
+            binlog.main([self.path, '--reindex'])
+        self.assertEqual(stdout.getvalue(), "Indexed 6 records.\n")
+        self.assertEqual(binlog.parse_time("1000.5"), 1000.5)
+        self.assertEqual(binlog.parse_level("20"), 20)
+        self.assertRaises(Exception, binlog.parse_time, "yesterday")
+        self.assertRaises(Exception, binlog.parse_level, "LOUD")
@@ -5,15 +5,18 @@
 from __future__ import absolute_import, division, print_function, \
                        unicode_literals
 from contextlib import contextmanager
+import json
 import logging
 import mock
 import os
 import pprint
+import re
 import scriptharness.commands as commands
 from scriptharness.errorlists import ErrorList
 from scriptharness.exceptions import ScriptHarnessError, \
     ScriptHarnessException, ScriptHarnessFatal, ScriptHarnessTimeout
 import scriptharness.log as log
+from scriptharness.redact import Redactor, set_default_redactor
 import scriptharness.status as status
 from scriptharness.unicode import to_unicode
 import shutil
@@ -191,6 +194,33 @@ class TestCommand(unittest.TestCase):
         pprint.pprint(command.logger.all_messages)
         self.assertEqual(command.logger.all_messages[-1][2][0], "hello")
 
+    def test_redactor(self):
+        """test_commands | Command redactor
+        """
+        command = get_command(redactor=Redactor(secrets=['hello']))
+        command.run()
+        self.assertEqual(command.logger.all_messages[-1][2][0], "********")
+
+    def test_redact_start(self):
+        """test_commands | Command redacts the logged command, cwd and env
+        """
+        os.makedirs(os.path.join(TEST_DIR, "hunter2secret"))
+        cmd = [sys.executable, "-c", "print('token=hunter2secret')"]
+        set_default_redactor(Redactor(secrets=['hunter2secret']))
+        try:
+            command = get_command(
+                command=cmd, env={'TOKEN': 'hunter2secret'},
+                cwd=os.path.join(TEST_DIR, "hunter2secret")
+            )
+        finally:
+            set_default_redactor(None)
+        command.log_start()
+        logged = pprint.pformat(command.logger.all_messages)
+        self.assertFalse("hunter2secret" in logged)
+        self.assertTrue("token=********" in logged)
+        self.assertTrue("'TOKEN': '********'" in logged)
+        self.assertTrue(get_command().redactor is None)
+
     def test_log_env(self):
         """test_commands | Command.log_env()
         """
@@ -248,6 +278,16 @@ class TestCommand(unittest.TestCase):
             self.assertRaises(ScriptHarnessTimeout, command.run)
             self.assertTrue(now + 1 > time.time())
 
+    @mock.patch('scriptharness.process.dump_ring_handlers')
+    def test_timeout_dump(self, mock_dump):
+        """test_commands | Command timeout dumps the RingHandlers
+        """
+        command = get_command(command=get_timeout_cmdlns()[0], timeout=.5)
+        self.assertRaises(ScriptHarnessTimeout, command.run)
+        mock_dump.assert_called_once_with(
+            "Timeout: Hit max timeout of 0 seconds!"
+        )
+
     def test_command_error(self):
         """test_commands | Command.run() with error
         """
@@ -368,6 +408,88 @@ class TestParsedCommand(unittest.TestCase):
             [(logging.WARNING, ' hello', ())]
         )
 
+    def test_profile(self):
+        """test_commands | ParsedCommand profile_path
+        """
+        error_list = ErrorList([
+            {'regex': re.compile('^xyz'), 'level': logging.ERROR},
+            {'substr': 'ell', 'level': logging.WARNING},
+            {'substr': 'foo', 'level': logging.WARNING},
+        ])
+        path = os.path.join(TEST_DIR, "profile.json")
+        try:
+            cmd = get_parsed_command(error_list=error_list, profile_path=path)
+            cmd.parser.logger = LoggerReplacement(simple=True)
+            cmd.run()
+            with open(path) as filehandle:
+                profile = json.load(filehandle)
+        finally:
+            cleanup()
+        self.assertEqual(
+            [(x['index'], x['evaluations'], x['hits']) for x in profile],
+            [(0, 1, 0), (1, 1, 1), (2, 0, 0)]
+        )
+        self.assertEqual(profile[0]['check'], 'regex ^xyz')
+        messages = cmd.parser.logger.all_messages
+        self.assertEqual(len(messages), 5)
+        self.assertTrue(messages[1].startswith('    #'))
+
+
+    def test_error_index(self):
+        """test_commands | ParsedCommand error_index_path
+        """
+        error_list = ErrorList([
+            {'substr': 'ell', 'level': logging.WARNING},
+        ])
+        path = os.path.join(TEST_DIR, "error_index.jsonl")
+        try:
+            cmd = get_parsed_command(error_list=error_list,
+                                     error_index_path=path)
+            cmd.parser.logger = LoggerReplacement()
+            cmd.run()
+            with open(path) as filehandle:
+                records = [json.loads(line) for line in filehandle]
+        finally:
+            cleanup()
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['line_number'], 1)
+        self.assertEqual(records[0]['offset'], 0)
+        self.assertEqual(records[0]['level'], logging.WARNING)
+
+    def test_redactor(self):
+        """test_commands | ParsedCommand redactor
+        """
+        error_list = ErrorList([
+            {'substr': 'hello', 'level': logging.ERROR},
+        ])
+        cmd = get_parsed_command(error_list=error_list,
+                                 redactor=Redactor(secrets=['ello']))
+        cmd.parser.logger = LoggerReplacement()
+        cmd.run()
+        self.assertEqual(cmd.parser.logger.all_messages,
+                         [(logging.INFO, ' h********', ())])
+        self.assertEqual(cmd.parser.history['num_errors'], 0)
+
+    def test_aggregate_warnings(self):
+        """test_commands | ParsedCommand aggregate_warnings
+        """
+        command = [
+            sys.executable, "-c",
+            'for i in range(4):\n print("line %d: deprecated" % i)',
+        ]
+        error_list = ErrorList([
+            {'substr': 'deprecated', 'level': logging.WARNING},
+        ])
+        cmd = get_parsed_command(command=command, error_list=error_list,
+                                 aggregate_warnings=5)
+        cmd.parser.logger = LoggerReplacement()
+        cmd.run()
+        messages = [x[1] for x in cmd.parser.logger.all_messages]
+        self.assertEqual(messages[0], ' line 0: deprecated')
+        self.assertEqual(messages[1], 'Repeated warnings (top %d of %d):')
+        self.assertTrue(messages[-1].strip().startswith('4 '))
+        self.assertEqual(cmd.parser.history['num_warnings'], 4)
+
 
 # Output {{{1
 class TestOutput(unittest.TestCase):
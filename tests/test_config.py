@@ -640,6 +640,21 @@ class TestConfigTemplate(unittest.TestCase):
         # this should not raise
         template.validate_config({'foo': 1})
 
+    def test_get_secrets(self):
+        """test_config | ConfigTemplate.get_secrets()
+        """
+        template = shconfig.ConfigTemplate({
+            'password': {'help': 'help', 'options': ['--password'],
+                         'secret': True},
+            'token': {'help': 'help', 'secret': True},
+            'user': {'help': 'help', 'options': ['--user']},
+        })
+        parsed_args = template.get_parser().parse_args(
+            ['--password', 'hunter22', '--user', 'me']
+        )
+        config = vars(parsed_args)
+        self.assertEqual(template.get_secrets(config), ['hunter22'])
+
     def test_bad_add_argument(self):
         """test_config | ConfigTemplate bad add_argument
         """
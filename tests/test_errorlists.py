@@ -10,11 +10,71 @@ Attributes:
 """
 from __future__ import absolute_import, division, print_function, \
                        unicode_literals
+import json
+import logging
+import mock
+import os
 import re
+import scriptharness.errorlists as errorlists
 from scriptharness.errorlists import ErrorList
-from scriptharness.exceptions import ScriptHarnessException
+from scriptharness.exceptions import ScriptHarnessException, \
+    ScriptHarnessFatal
+from scriptharness.log import OutputParser
+import shutil
+import six
 import unittest
 
+TEST_DESCRIPTION = '_test_error_list.json'
+TEST_YAML_DESCRIPTION = '_test_error_list.yaml'
+TEST_CACHE_DIR = '_test_error_list_cache'
+TEST_LINES = [
+    'abort: error: Connection refused',
+    'remote: error: /foo: No such file or directory',
+    'Warning: foo Error: bar',
+    '    raise ValueError: x',
+    '    raise FooException: x',
+    'foo.c:12: error: bad',
+    'foo.c:12: warning: less bad',
+    'Downloading foo.tar.gz (1.2 MB): 50% 600kb',
+    'Downloading foo (bar):   1.5Mb',
+    'Makefile was not found.',
+    'make: *** No rule to make target.  Stop.',
+    'make[2]: *** [all] Error 2',
+    'make: ***/',
+    'tar: Child returned status 2',
+    'jarsigner: key associated with foo not a private key',
+    'jarsigner error: java.lang.RuntimeException: keystore load: foo '
+    ':No such file or directory',
+    'Unable to open foo.zip as a zip archive',
+    'Output file foo.apk exists',
+    'ABORT: uppercase',
+    '',
+]
+
+
+def cleanup():
+    """Cleanliness"""
+    for path in (TEST_DESCRIPTION, TEST_YAML_DESCRIPTION):
+        if os.path.exists(path):
+            os.remove(path)
+    if os.path.exists(TEST_CACHE_DIR):
+        shutil.rmtree(TEST_CACHE_DIR)
+    errorlists.COMPILED_ERROR_LISTS.clear()
+
+
+def get_test_error_list():
+    """Create an ErrorList with every kind of error_check"""
+    return ErrorList([
+        {'regex': re.compile('^foo', re.I), 'level': logging.ERROR,
+         'pre_context_lines': 2},
+        {'substr': 'bar', 'exception': ScriptHarnessFatal,
+         'explanation': 'bar is fatal'},
+        {'start': re.compile('^start'), 'end': re.compile('^end'),
+         'level': logging.INFO},
+        {'first': re.compile('^Traceback'), 'next': re.compile(r'^\s'),
+         'last': re.compile(r'^\w+Error'), 'level': logging.ERROR},
+    ])
+
 
 # TestErrorList {{{1
 class TestErrorList(unittest.TestCase):
@@ -85,3 +145,296 @@ class TestErrorList(unittest.TestCase):
             )
 
 
+
+    def test_block(self):
+        """test_log | ErrorList block error_checks
+        """
+        ErrorList([{'start': re.compile('a'), 'end': re.compile('b'),
+                    'level': 0}])
+        elists = [
+            [{'start': re.compile('a'), 'level': 0}],
+            [{'start': 'a', 'end': re.compile('b'), 'level': 0}],
+            [{'start': re.compile('a'), 'end': re.compile('b')}],
+            [{'start': re.compile('a'), 'end': re.compile('b'), 'level': 0,
+              'substr': 'foo'}],
+            [{'start': re.compile('a'), 'end': re.compile('b'), 'level': 0,
+              'pre_context_lines': 5}],
+        ]
+        for error_list in elists:
+            print(error_list)
+            self.assertRaises(
+                ScriptHarnessException, ErrorList, error_list
+            )
+
+    def test_multiline(self):
+        """test_log | ErrorList multi-line error_checks
+        """
+        error_list = ErrorList([
+            {'first': re.compile('a'), 'next': re.compile('b'), 'level': 0},
+            {'first': re.compile('a'), 'next': re.compile('b'),
+             'last': re.compile('c'), 'level': 0, 'post_context_lines': 2},
+        ])
+        self.assertEqual(error_list.post_context_lines, 2)
+        elists = [
+            [{'first': re.compile('a'), 'level': 0}],
+            [{'next': re.compile('b'), 'level': 0}],
+            [{'first': 'a', 'next': re.compile('b'), 'level': 0}],
+            [{'first': re.compile('a'), 'next': re.compile('b'),
+              'last': 'c', 'level': 0}],
+            [{'first': re.compile('a'), 'next': re.compile('b'),
+              'regex': re.compile('c'), 'level': 0}],
+            [{'first': re.compile('a'), 'next': re.compile('b'),
+              'exception': ScriptHarnessException, 'level': 0}],
+        ]
+        for error_list in elists:
+            print(error_list)
+            self.assertRaises(
+                ScriptHarnessException, ErrorList, error_list
+            )
+
+    def test_modify(self):
+        """test_log | ErrorList append, extend, insert, and +
+        """
+        error_list = ErrorList([{'substr': 'foo', 'level': 0}])
+        error_list.append({'substr': 'bar', 'level': 0,
+                           'pre_context_lines': 2})
+        error_list.extend([{'substr': 'baz', 'level': 0,
+                            'post_context_lines': 3}])
+        error_list.insert(0, {'substr': 'qux', 'level': 0,
+                              'pre_context_lines': 1})
+        self.assertEqual([x['substr'] for x in error_list],
+                         ['qux', 'foo', 'bar', 'baz'])
+        self.assertEqual((error_list.pre_context_lines,
+                          error_list.post_context_lines), (2, 3))
+        new_error_list = error_list + [{'substr': 'quux', 'level': 0,
+                                        'post_context_lines': 4}]
+        self.assertTrue(isinstance(new_error_list, ErrorList))
+        self.assertEqual(len(new_error_list), 5)
+        self.assertEqual(new_error_list.post_context_lines, 4)
+        self.assertEqual(len(error_list), 4)
+        self.assertEqual(error_list.post_context_lines, 3)
+        orig_error_list = error_list
+        error_list += [{'substr': 'corge', 'level': 0}]
+        self.assertTrue(error_list is orig_error_list)
+        self.assertEqual(len(error_list), 5)
+
+    def test_modify_invalid(self):
+        """test_log | ErrorList modification validates new error_checks
+        """
+        error_list = ErrorList([{'substr': 'foo', 'level': 0}])
+        bad = {'substr': 'bar', 'pre_context_lines': 5}
+        self.assertRaises(ScriptHarnessException, error_list.append, bad)
+        self.assertRaises(ScriptHarnessException, error_list.extend, [bad])
+        self.assertRaises(ScriptHarnessException, error_list.insert, 0, bad)
+        self.assertRaises(ScriptHarnessException, error_list.__add__, [bad])
+        self.assertEqual(len(error_list), 1)
+        self.assertEqual(error_list.pre_context_lines, 0)
+
+
+# TestSerialization {{{1
+class TestSerialization(unittest.TestCase):
+    """Test ErrorList descriptions, load_error_list(), and save_error_list()
+    """
+    def setUp(self):
+        assert self  # silence pylint
+        cleanup()
+
+    def tearDown(self):
+        assert self  # silence pylint
+        cleanup()
+
+    def test_description(self):
+        """test_log | ErrorList to_description and from_description
+        """
+        error_list = get_test_error_list()
+        description = error_list.to_description()
+        self.assertEqual(description[0]['regex'],
+                         {'pattern': '^foo', 'flags': re.I})
+        self.assertEqual(description[1]['exception'],
+                         'scriptharness.exceptions.ScriptHarnessFatal')
+        self.assertEqual(description[3]['next'], r'^\s')
+        json.dumps(description)
+        new_error_list = ErrorList.from_description(description)
+        self.assertEqual(new_error_list, error_list)
+        self.assertEqual(new_error_list.pre_context_lines, 2)
+
+    def test_bad_description(self):
+        """test_log | ErrorList.from_description errors
+        """
+        for description in (
+                {'substr': 'foo', 'level': 0},
+                [{'regex': '(', 'level': 0}],
+                [{'substr': 'foo', 'exception': 'nonexistent.Exception'}],
+                [{'substr': 'foo', 'exception': 'Exception'}],
+                [{'substr': 'foo'}]):
+            self.assertRaises(ScriptHarnessException,
+                              ErrorList.from_description, description)
+
+    def test_json(self):
+        """test_log | save_error_list and load_error_list json
+        """
+        error_list = get_test_error_list()
+        errorlists.save_error_list(error_list, TEST_DESCRIPTION)
+        self.assertEqual(errorlists.load_error_list(TEST_DESCRIPTION),
+                         error_list)
+
+    @unittest.skipIf(errorlists.yaml is None, "yaml isn't installed")
+    def test_yaml(self):
+        """test_log | save_error_list and load_error_list yaml
+        """
+        error_list = get_test_error_list()
+        errorlists.save_error_list(error_list, TEST_YAML_DESCRIPTION)
+        self.assertEqual(errorlists.load_error_list(TEST_YAML_DESCRIPTION),
+                         error_list)
+        with open(TEST_YAML_DESCRIPTION, 'w') as filehandle:
+            filehandle.write("- [")
+        self.assertRaises(ScriptHarnessException,
+                          errorlists.load_error_list, TEST_YAML_DESCRIPTION)
+
+    def test_load_errors(self):
+        """test_log | load_error_list errors
+        """
+        self.assertRaises(ScriptHarnessException,
+                          errorlists.load_error_list, TEST_DESCRIPTION)
+        with open(TEST_DESCRIPTION, 'w') as filehandle:
+            filehandle.write("[")
+        self.assertRaises(ScriptHarnessException,
+                          errorlists.load_error_list, TEST_DESCRIPTION)
+
+    def test_cache(self):
+        """test_log | load_error_list cache skips validation and compiling
+        """
+        error_list = get_test_error_list()
+        errorlists.save_error_list(error_list, TEST_DESCRIPTION)
+        first = errorlists.load_error_list(TEST_DESCRIPTION,
+                                           cache_dir=TEST_CACHE_DIR)
+        self.assertEqual(len(os.listdir(TEST_CACHE_DIR)), 1)
+        errorlists.COMPILED_ERROR_LISTS.clear()
+        orig_validate = ErrorList.validate_error_list
+
+        def fail(*args):
+            """validate_error_list shouldn't be called"""
+            raise AssertionError("validated %s" % (args, ))
+        ErrorList.validate_error_list = fail
+        try:
+            second = errorlists.load_error_list(TEST_DESCRIPTION,
+                                                cache_dir=TEST_CACHE_DIR)
+            with mock.patch.object(ErrorList, 'compile_error_list') as comp:
+                third = errorlists.load_error_list(TEST_DESCRIPTION,
+                                                   cache_dir=TEST_CACHE_DIR)
+            self.assertEqual(comp.call_count, 0)
+        finally:
+            ErrorList.validate_error_list = orig_validate
+        self.assertEqual(first, second)
+        self.assertEqual(first, third)
+        self.assertTrue(isinstance(second, ErrorList))
+        self.assertEqual(second.pre_context_lines, 2)
+        self.assertTrue(second.strict)
+        # Each load is a copy of the cached ErrorList.
+        third.append({'substr': 'new', 'level': logging.ERROR})
+        self.assertEqual(
+            errorlists.load_error_list(TEST_DESCRIPTION,
+                                       cache_dir=TEST_CACHE_DIR),
+            first
+        )
+
+    def test_corrupt_cache(self):
+        """test_log | load_error_list rebuilds a corrupt cache
+        """
+        error_list = get_test_error_list()
+        errorlists.save_error_list(error_list, TEST_DESCRIPTION)
+        errorlists.load_error_list(TEST_DESCRIPTION, cache_dir=TEST_CACHE_DIR)
+        cache_path = os.path.join(TEST_CACHE_DIR,
+                                  os.listdir(TEST_CACHE_DIR)[0])
+        with open(cache_path) as filehandle:
+            cache = json.load(filehandle)
+        tampered = dict(cache, pre_context_lines=0)
+        wrong_key = dict(cache, key='0' * 64)
+        for garbage in (b'garbage', b'{"description": [1]}',
+                        json.dumps(tampered).encode('utf-8'),
+                        json.dumps(wrong_key).encode('utf-8')):
+            errorlists.COMPILED_ERROR_LISTS.clear()
+            with open(cache_path, 'wb') as filehandle:
+                filehandle.write(garbage)
+            with mock.patch('logging.getLogger') as get_logger:
+                self.assertEqual(
+                    errorlists.load_error_list(TEST_DESCRIPTION,
+                                               cache_dir=TEST_CACHE_DIR),
+                    error_list
+                )
+            get_logger.assert_called_once_with(errorlists.LOGGER_NAME)
+            self.assertEqual(get_logger.return_value.warning.call_count, 1)
+            # The rebuilt cache replaces the bad one.
+            with open(cache_path) as filehandle:
+                self.assertEqual(
+                    json.load(filehandle)['description'],
+                    error_list.to_description()
+                )
+
+
+# TestRegexEngines {{{1
+class TestRegexEngines(unittest.TestCase):
+    """Test ErrorList regex engines.
+    """
+    def test_unknown_engine(self):
+        """test_log | ErrorList unknown regex engine
+        """
+        self.assertRaises(ScriptHarnessException, ErrorList,
+                          [{'substr': 'foo', 'level': 0}], engine='unknown')
+
+    def test_re(self):
+        """test_log | ErrorList 're' engine doesn't copy error_checks
+        """
+        error_checks = [{'regex': re.compile('foo'), 'level': 0}]
+        error_list = ErrorList(error_checks)
+        self.assertTrue(error_list[0] is error_checks[0])
+
+    @unittest.skipIf(errorlists.re2 is None, "re2 isn't installed")
+    def test_re2(self):
+        """test_log | ErrorList 're2' engine
+        """
+        error_checks = [
+            {'regex': re.compile('^foo', re.I), 'level': 0},
+            {'start': re.compile('^start'), 'end': re.compile('^end'),
+             'level': 0},
+        ]
+        error_list = ErrorList(error_checks, engine='re2')
+        self.assertEqual(error_list.engine, 're2')
+        self.assertFalse(error_list[0] is error_checks[0])
+        self.assertTrue(isinstance(error_checks[0]['regex'],
+                                   type(re.compile(''))))
+        self.assertTrue(error_list[0]['regex'].search('FOO'))
+        self.assertTrue(error_list[1]['end'].search('end'))
+        error_list.append({'regex': re.compile('bar'), 'level': 0})
+        self.assertTrue(isinstance(error_list[2]['regex'],
+                                   type(error_list[0]['regex'])))
+        description = error_list.to_description()
+        self.assertEqual(description[0]['regex'], '(?i)^foo')
+        new_error_list = ErrorList.from_description(description)
+        self.assertEqual(new_error_list.engine, 're')
+        self.assertTrue(new_error_list[0]['regex'].search('FOO'))
+        # re2 doesn't support backreferences or verbose regexes.
+        for error_check in ({'regex': re.compile(r'(a)\1'), 'level': 0},
+                            {'regex': re.compile('a', re.X), 'level': 0}):
+            self.assertRaises(ScriptHarnessException, ErrorList,
+                              [error_check], engine='re2')
+
+    def test_shipped_lists(self):
+        """test_log | every shipped ErrorList matches the same lines with
+        every installed regex engine
+        """
+        engines = [x for x in errorlists.REGEX_ENGINES if x == 're' or
+                   getattr(errorlists, x) is not None]
+        for name, value in sorted(vars(errorlists).items()):
+            if not isinstance(value, ErrorList):
+                continue
+            for engine in engines:
+                error_list = ErrorList(value, engine=engine)
+                for line in TEST_LINES + [x.get('substr', '') for x in value]:
+                    for error_check, orig_error_check in zip(error_list,
+                                                             value):
+                        self.assertEqual(
+                            OutputParser.check_line(error_check, line),
+                            OutputParser.check_line(orig_error_check, line),
+                            "%s %s %s" % (name, engine, six.text_type(line))
+                        )
@@ -12,16 +12,24 @@ from __future__ import absolute_import, division, print_function, \
                        unicode_literals
 import codecs
 from contextlib import contextmanager
+import gzip
+import json
 import logging
 import mock
 import os
 import pprint
 import re
+import signal
 from scriptharness.errorlists import ErrorList
 from scriptharness.exceptions import ScriptHarnessException, \
     ScriptHarnessError
 import scriptharness.log as log
+from scriptharness.redact import Redactor
+import shutil
 import six
+import sys
+import tempfile
+import threading
 import unittest
 from . import UNICODE_STRINGS, LOGGER_NAME, LoggerReplacement, \
               stdstar_redirected
@@ -91,6 +99,274 @@ class TestPrepareSimpleLogging(unittest.TestCase):
         console_mock.assert_called_once_with(log.DEFAULT_LEVEL)
         file_mock.assert_called_once_with(log.DEFAULT_LEVEL)
 
+
+# TestRateLimitFilter {{{1
+class TestRateLimitFilter(unittest.TestCase):
+    """Test scriptharness.log.RateLimitFilter and get_rate_limit_filter()
+    """
+    def setUp(self):
+        assert self  # silence pylint
+        self.logger = logging.getLogger("test_rate_limit")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.handler = ListHandler()
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        for handler in self.logger.handlers[:]:
+            self.logger.removeHandler(handler)
+
+    def test_sample(self):
+        """test_log | RateLimitFilter deterministic sampling
+        """
+        log.get_rate_limit_filter("test_rate_limit.child", sample=3,
+                                  level='INFO')
+        child = logging.getLogger("test_rate_limit.child")
+        for num in range(7):
+            child.debug("debug %d", num)
+            self.logger.debug("parent %d", num)
+        child.info("info")
+        self.assertEqual(
+            [x for x in self.handler.messages if x.startswith("debug")],
+            ["debug 0", "debug 3", "debug 6"]
+        )
+        self.assertEqual(len([x for x in self.handler.messages
+                              if x.startswith("parent")]), 7)
+        self.assertEqual(self.handler.messages[-1], "info")
+
+    @mock.patch('scriptharness.log.default_timer')
+    def test_rate(self, mock_timer):
+        """test_log | RateLimitFilter token bucket and summaries
+        """
+        mock_timer.return_value = 100.0
+        log_filter = log.get_rate_limit_filter(
+            "test_rate_limit", rate=2, burst=3, summary_interval=10
+        )
+        for num in range(5):
+            self.logger.info("burst %d", num)
+        mock_timer.return_value = 101.0
+        for num in range(5):
+            self.logger.info("refill %d", num)
+        self.assertEqual(
+            self.handler.messages,
+            ["burst 0", "burst 1", "burst 2", "refill 0", "refill 1"]
+        )
+        self.assertEqual(log_filter.suppressed, 5)
+        mock_timer.return_value = 111.0
+        self.logger.info("later")
+        self.assertEqual(
+            self.handler.messages[-2:],
+            ["Suppressed 5 records from test_rate_limit in the last 11.0 "
+             "seconds.", "later"]
+        )
+        self.logger.error("error")
+        self.assertEqual(self.handler.messages[-1], "error")
+        self.assertEqual(log_filter.summarize(force=True), 0)
+
+    def test_handlers(self):
+        """test_log | RateLimitFilter counts each record once
+        """
+        handler2 = ListHandler()
+        self.logger.addHandler(handler2)
+        log.get_rate_limit_filter("test_rate_limit", sample=2)
+        for num in range(4):
+            self.logger.info("%d", num)
+        self.assertEqual(self.handler.messages, ["0", "2"])
+        self.assertEqual(handler2.messages, ["0", "2"])
+        log.summarize_rate_limits()
+        self.assertEqual(
+            self.handler.messages[-1][:43],
+            "Suppressed 2 records from test_rate_limit i"
+        )
+
+    def test_add_log_filters(self):
+        """test_log | add_log_filters()
+        """
+        filters = log.add_log_filters({
+            'test_rate_limit': {'rate': 5, 'level': 'ERROR'},
+            'test_rate_limit.child': {'sample': 2},
+        })
+        self.assertEqual([x.name for x in filters],
+                         ['test_rate_limit', 'test_rate_limit.child'])
+        self.assertEqual((filters[0].rate, filters[0].burst,
+                          filters[0].level), (5, 5, logging.ERROR))
+        self.assertEqual(len(self.handler.filters), 2)
+
+    def test_validate(self):
+        """test_log | validate_log_filters()
+        """
+        name = 'scriptharness_log_filters'
+        self.assertEqual(log.validate_log_filters(name, {name: {
+            'a': {'rate': 1.5, 'burst': 3, 'sample': 2, 'level': 'info',
+                  'summary_interval': 30},
+            'b': {'level': logging.DEBUG, 'rate': None},
+        }}), [])
+        self.assertEqual(len(log.validate_log_filters(name, {name: [1]})), 1)
+        self.assertEqual(len(log.validate_log_filters(name, {name: {
+            'a': 1,
+            'b': {'unknown': 1, 'level': 'LOUD', 'rate': -1,
+                  'sample': 1.5, 'burst': 'x', 'summary_interval': True},
+        }})), 7)
+
+
+# TestPrepareAsyncLogging {{{1
+class ListHandler(logging.Handler):
+    """Save handled records' messages; optionally wait on an Event first
+    """
+    def __init__(self, event=None):
+        logging.Handler.__init__(self)
+        self.messages = []
+        self.event = event
+
+    def emit(self, record):
+        if self.event is not None:
+            self.event.wait()
+        self.messages.append(record.getMessage())
+
+
+class TestPrepareAsyncLogging(unittest.TestCase):
+    """Test scriptharness.log.prepare_async_logging() and AsyncQueueHandler
+    """
+    def setUp(self):
+        assert self  # silence pylint
+        if os.path.exists(TEST_FILE):
+            os.remove(TEST_FILE)
+
+    def tearDown(self):
+        assert self  # silence pylint
+        logger = logging.getLogger("test_async")
+        for handler in logger.handlers[:]:
+            logger.removeHandler(handler)
+            handler.close()
+        if os.path.exists(TEST_FILE):
+            os.remove(TEST_FILE)
+
+    def test_file(self):
+        """test_log | prepare_async_logging writes to the file log on flush
+        """
+        with stdstar_redirected(TEST_CONSOLE):
+            logger = log.prepare_async_logging(TEST_FILE,
+                                               logger_name="test_async")
+            for num in range(100):
+                logger.info("line %d %s", num, {'a': 1})
+            log.flush_logger(logger)
+        os.remove(TEST_CONSOLE)
+        with open(TEST_FILE) as filehandle:
+            lines = filehandle.read().splitlines()
+        self.assertEqual(len(lines), 100)
+        self.assertTrue(lines[-1].endswith("line 99 {'a': 1}"))
+
+    @staticmethod
+    def _overflow(overflow, release_after=None):
+        """Fill a size-2 queue while the listener is blocked.
+        """
+        event = threading.Event()
+        handler = ListHandler(event=event)
+        queue_handler = log.AsyncQueueHandler(
+            log.AsyncListener([handler]), maxsize=2, overflow=overflow
+        )
+        if release_after is not None:
+            threading.Timer(release_after, event.set).start()
+        logger = logging.getLogger("test_async")
+        logger.setLevel(logging.INFO)
+        logger.addHandler(queue_handler)
+        logger.info("first")
+        # wait for the listener to pick up the first record
+        while queue_handler.queue.qsize():
+            event.wait(0.01)
+        for num in range(22):
+            logger.info("info %d", num)
+        event.set()
+        logger.error("error")
+        log.flush_logger(logger)
+        return handler.messages
+
+    def test_drop_info(self):
+        """test_log | AsyncQueueHandler drop-info overflow policy
+        """
+        messages = self._overflow('drop-info')
+        self.assertEqual(messages, [
+            "first", "info 0", "info 1", "error",
+            "Dropped 20 log records because the log queue was full."
+        ])
+
+    def test_sample(self):
+        """test_log | AsyncQueueHandler sample overflow policy
+        """
+        # the first sampled record blocks until the listener is released
+        messages = self._overflow('sample', release_after=0.2)
+        self.assertEqual(messages[:4], ["first", "info 0", "info 1", "info 2"])
+        self.assertEqual(messages[-2], "error")
+        dropped = re.match(r"Dropped (\d+) log records", messages[-1])
+        self.assertTrue(dropped)
+        self.assertEqual(len(messages) - 3 + int(dropped.group(1)), 22)
+
+    def test_bad_overflow(self):
+        """test_log | AsyncQueueHandler bad overflow policy
+        """
+        self.assertRaises(ScriptHarnessException, log.AsyncQueueHandler,
+                          log.AsyncListener([]), overflow='unknown')
+
+    def test_close(self):
+        """test_log | AsyncQueueHandler.close drains the queue and stops
+        the listener
+        """
+        handler = ListHandler()
+        listener = log.AsyncListener([handler])
+        queue_handler = log.AsyncQueueHandler(listener)
+        logger = logging.getLogger("test_async")
+        logger.addHandler(queue_handler)
+        logger.warning("warning")
+        logger.removeHandler(queue_handler)
+        queue_handler.close()
+        self.assertFalse(listener.is_alive())
+        self.assertEqual(handler.messages, ["warning"])
+
+
+# TestCachedFormatter {{{1
+class TestCachedFormatter(unittest.TestCase):
+    """Test scriptharness.log.CachedFormatter
+    """
+    def test_matches_unicode_formatter(self):
+        """test_log | CachedFormatter output matches UnicodeFormatter
+        """
+        try:
+            raise ScriptHarnessException("oops")
+        except ScriptHarnessException:
+            exc_info = sys.exc_info()
+        for fmt, datefmt in ((log.DEFAULT_FMT, log.DEFAULT_DATEFMT),
+                             (None, None),
+                             ('%%(x) %(levelno)03d %(name)-5s %(message)r',
+                              None)):
+            expected = log.UnicodeFormatter(fmt=fmt, datefmt=datefmt)
+            formatter = log.CachedFormatter(fmt=fmt, datefmt=datefmt)
+            for record in (
+                    logging.LogRecord("name", logging.INFO, "path", 1,
+                                      "%s %s", ("foo", UNICODE_STRINGS[0]),
+                                      None),
+                    logging.LogRecord("name", logging.ERROR, "path", 1,
+                                      "error", None, exc_info)):
+                for _ in range(2):
+                    string = expected.format(record)
+                    record.exc_text = None
+                    self.assertEqual(formatter.format(record), string)
+                    record.exc_text = None
+
+    def test_time_cache(self):
+        """test_log | CachedFormatter only calls strftime once per second
+        """
+        formatter = log.get_formatter()
+        self.assertTrue(isinstance(formatter, log.CachedFormatter))
+        record = logging.LogRecord("name", logging.INFO, "path", 1, "msg",
+                                   None, None)
+        with mock.patch('scriptharness.log.time.strftime') as strftime:
+            strftime.return_value = "12:34:56"
+            for created in (1000.0, 1000.5, 1000.9, 1001.0):
+                record.created = created
+                formatter.format(record)
+            self.assertEqual(strftime.call_count, 2)
+
+
 # TestGetFileHandler {{{1
 class TestGetFileHandler(unittest.TestCase):
     """test_log | scriptharness.log.get_file_handler() method
@@ -127,6 +403,384 @@ class TestGetFileHandler(unittest.TestCase):
             line = filehandle.readline().rstrip()
             self.assertEqual(line, TEST_STRING)
 
+# TestJsonLines {{{1
+class TestJsonLines(unittest.TestCase):
+    """Test scriptharness.log.get_json_handler() and JsonLinesFormatter
+    """
+    def setUp(self):
+        assert self  # silence pylint
+        _absent_test_file()
+
+    def tearDown(self):
+        assert self  # silence pylint
+        if os.path.exists(TEST_FILE):
+            os.remove(TEST_FILE)
+
+    def _log_records(self):
+        """Log some records through a json handler and read them back.
+        """
+        logger = logging.getLogger("test_json")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        handler = log.get_json_handler(TEST_FILE, logger=logger)
+        error_list = ErrorList([
+            {'substr': 'error:', 'level': logging.ERROR},
+        ])
+        try:
+            with log.log_context(script_name="script", action_name="build"):
+                with log.log_context(command_id=3):
+                    parser = log.OutputParser(error_list, logger=logger)
+                    parser.add_line("foo.c: error: bar")
+                    parser.add_line(UNICODE_STRINGS[0])
+                logger.info("%s \"%d\"", "done", 1)
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+        self.assertEqual(log.LOG_CONTEXT, {})
+        with codecs.open(TEST_FILE, encoding='utf-8') as filehandle:
+            return [json.loads(line) for line in filehandle]
+
+    def test_records(self):
+        """test_log | get_json_handler writes json lines with the log
+        context and error_check
+        """
+        for fast_json in (log.orjson, None):
+            with mock.patch('scriptharness.log.orjson', fast_json):
+                records = self._log_records()
+            self.assertEqual([list(x.keys()) for x in records],
+                             [[key for key, _ in log.JSON_FIELDS]] * 3)
+            for record in records:
+                self.assertTrue(isinstance(record.pop('timestamp'), float))
+            self.assertEqual(records, [{
+                'level': 'ERROR', 'logger': 'test_json', 'script': 'script',
+                'action': 'build', 'command_id': 3,
+                'message': ' foo.c: error: bar',
+                'error_check': 'substr error:', 'exception': None,
+            }, {
+                'level': 'INFO', 'logger': 'test_json', 'script': 'script',
+                'action': 'build', 'command_id': 3,
+                'message': ' ' + UNICODE_STRINGS[0], 'error_check': None,
+                'exception': None,
+            }, {
+                'level': 'INFO', 'logger': 'test_json', 'script': 'script',
+                'action': 'build', 'command_id': None,
+                'message': 'done "1"', 'error_check': None,
+                'exception': None,
+            }])
+
+    def test_encode_json_value(self):
+        """test_log | encode_json_value
+        """
+        for value in (None, True, 3, 1.5, "a\"b\n", UNICODE_STRINGS[1]):
+            self.assertEqual(json.loads(log.encode_json_value(value)), value)
+
+
+# TestBufferedFileHandler {{{1
+class TestBufferedFileHandler(unittest.TestCase):
+    """Test scriptharness.log.BufferedFileHandler
+    """
+    def setUp(self):
+        assert self  # silence pylint
+        _absent_test_file()
+        self.handler = None
+
+    def tearDown(self):
+        if self.handler is not None:
+            self.handler.close()
+        if os.path.exists(TEST_FILE):
+            os.remove(TEST_FILE)
+
+    def get_handler(self, **kwargs):
+        """Create a BufferedFileHandler with a bare formatter."""
+        self.handler = log.BufferedFileHandler(TEST_FILE, 'w', **kwargs)
+        self.handler.setFormatter(logging.Formatter('%(message)s'))
+        return self.handler
+
+    @staticmethod
+    def read():
+        """Read TEST_FILE"""
+        with open(TEST_FILE) as filehandle:
+            return filehandle.read()
+
+    @staticmethod
+    def record(msg, level=logging.INFO):
+        """Create a LogRecord"""
+        return logging.LogRecord("name", level, "path", 1, msg, None, None)
+
+    def test_get_file_handler(self):
+        """test_log | get_file_handler(buffered=True)
+        """
+        self.handler = log.get_file_handler(TEST_FILE, buffered=True)
+        self.assertTrue(isinstance(self.handler, log.BufferedFileHandler))
+        self.assertTrue(self.handler in log.BUFFERED_HANDLERS)
+
+    def test_buffer(self):
+        """test_log | BufferedFileHandler writes on size, level, and flush
+        """
+        handler = self.get_handler(buffer_size=10, flush_interval=None)
+        handler.handle(self.record("one"))
+        self.assertEqual(self.read(), "")
+        handler.handle(self.record("two"))
+        handler.handle(self.record("three"))
+        self.assertEqual(self.read(), "one\ntwo\nthree\n")
+        handler.handle(self.record("four"))
+        handler.handle(self.record("five", level=logging.WARNING))
+        self.assertEqual(self.read(), "one\ntwo\nthree\nfour\nfive\n")
+        handler.handle(self.record("six"))
+        handler.flush()
+        self.assertTrue(self.read().endswith("six\n"))
+        handler.handle(self.record("seven"))
+        handler.close()
+        self.assertTrue(self.read().endswith("seven\n"))
+        self.assertFalse(handler in log.BUFFERED_HANDLERS)
+
+    def test_interval(self):
+        """test_log | BufferedFileHandler flushes every flush_interval
+        """
+        handler = self.get_handler(flush_interval=0.01)
+        handler.handle(self.record("one"))
+        for _ in range(500):
+            if self.read():
+                break
+            handler.stop_event.wait(0.01)
+        self.assertEqual(self.read(), "one\n")
+        handler.close()
+        self.assertFalse(handler.flusher.is_alive())
+
+    def test_unbuffered(self):
+        """test_log | unbuffered handlers don't install the signal flush
+        """
+        with mock.patch('scriptharness.log.install_signal_flush') as install:
+            self.handler = log.get_file_handler(TEST_FILE, max_bytes=1000)
+            self.assertEqual(install.call_count, 0)
+            self.assertFalse(self.handler in log.BUFFERED_HANDLERS)
+            self.handler.close()
+            self.handler = log.get_file_handler(TEST_FILE, buffered=True)
+            self.assertEqual(install.call_count, 1)
+
+    @unittest.skipIf(not hasattr(signal, 'SIGHUP'), "No SIGHUP")
+    def test_signal(self):
+        """test_log | install_signal_flush flushes, then calls the previous
+        signal handler
+        """
+        signals = []
+        previous = signal.signal(signal.SIGHUP,
+                                 lambda signum, _: signals.append(signum))
+        saved = log.PREVIOUS_SIGNAL_HANDLERS.pop(signal.SIGHUP, None)
+        try:
+            handler = self.get_handler(flush_interval=None)
+            log.install_signal_flush((signal.SIGHUP, ))
+            handler.handle(self.record("one"))
+            os.kill(os.getpid(), signal.SIGHUP)
+            self.assertEqual(signals, [signal.SIGHUP])
+            self.assertEqual(self.read(), "one\n")
+        finally:
+            signal.signal(signal.SIGHUP, previous)
+            log.PREVIOUS_SIGNAL_HANDLERS.pop(signal.SIGHUP, None)
+            if saved is not None:
+                log.PREVIOUS_SIGNAL_HANDLERS[signal.SIGHUP] = saved
+
+
+# TestRotatingLogHandler {{{1
+class TestRotatingLogHandler(unittest.TestCase):
+    """Test scriptharness.log.RotatingLogHandler and rotate_file()
+    """
+    def setUp(self):
+        assert self  # silence pylint
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "log.txt")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def get_logger(self, **kwargs):
+        """Create a logger with a RotatingLogHandler"""
+        logger = logging.getLogger("test_rotate")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        handler = log.get_file_handler(
+            self.path, logger=logger, formatter=logging.Formatter(
+                '%(message)s'
+            ), **kwargs
+        )
+        return logger, handler
+
+    def read_manifest(self):
+        """Read the manifest"""
+        with open(self.path + log.MANIFEST_SUFFIX) as filehandle:
+            return json.load(filehandle)
+
+    def read_segment(self, name):
+        """Read a gzipped segment"""
+        with gzip.open(os.path.join(self.tmpdir, name), 'rb') as filehandle:
+            return filehandle.read().decode('utf-8')
+
+    def test_per_action(self):
+        """test_log | RotatingLogHandler rotates per action
+        """
+        logger, handler = self.get_logger(per_action=True)
+        try:
+            logger.info("setup")
+            for action in ("clobber", "build"):
+                with log.log_context(action_name=action):
+                    logger.info("%s 1", action)
+                    logger.info("%s 2", action)
+            logger.info("done")
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+        manifest = self.read_manifest()
+        self.assertEqual(manifest['path'], "log.txt")
+        self.assertEqual(
+            [(x['path'], x['first_line'], x['last_line'], x['action'])
+             for x in manifest['segments']],
+            [("log.txt.1.gz", 1, 1, None), ("log.txt.2.gz", 2, 3, "clobber"),
+             ("log.txt.3.gz", 4, 5, "build")]
+        )
+        self.assertEqual(self.read_segment("log.txt.2.gz"),
+                         "clobber 1\nclobber 2\n")
+        self.assertFalse(os.path.exists(self.path + ".2"))
+        with open(self.path) as filehandle:
+            self.assertEqual(filehandle.read(), "done\n")
+
+    def test_max_bytes(self):
+        """test_log | RotatingLogHandler rotates by size, and resumes in
+        append mode
+        """
+        logger, handler = self.get_logger(max_bytes=20)
+        try:
+            for num in range(10):
+                logger.info("line %d", num)
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+        segments = self.read_manifest()['segments']
+        self.assertTrue(len(segments) >= 2)
+        lines = []
+        for segment in segments:
+            lines.extend(self.read_segment(segment['path']).splitlines())
+            self.assertEqual(len(lines), segment['last_line'])
+        logger, handler = self.get_logger(max_bytes=20, mode='a')
+        try:
+            logger.info("line 10")
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+        for segment in self.read_manifest()['segments'][len(segments):]:
+            lines.extend(self.read_segment(segment['path']).splitlines())
+        with open(self.path) as filehandle:
+            lines.extend(filehandle.read().splitlines())
+        self.assertEqual(lines, ["line %d" % x for x in range(11)])
+
+    def test_max_bytes_encoded(self):
+        """test_log | RotatingLogHandler counts max_bytes in encoded bytes
+        """
+        # 3 characters, but at least 6 bytes in any encoding that has them
+        logger, handler = self.get_logger(max_bytes=15)
+        try:
+            for _ in range(3):
+                logger.info(UNICODE_STRINGS[1])
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+        segments = self.read_manifest()['segments']
+        self.assertEqual(len(segments), 1)
+        path = os.path.join(self.tmpdir, segments[0]['path'])
+        with gzip.open(path, 'rb') as filehandle:
+            self.assertEqual(segments[0]['size'], len(filehandle.read()))
+
+    def test_rotate_file(self):
+        """test_log | rotate_file keeps max_backups copies
+        """
+        for num in range(4):
+            with open(self.path, 'w') as filehandle:
+                filehandle.write(str(num))
+            log.rotate_file(self.path, 2)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(os.path.exists(self.path + ".3"))
+        for suffix, contents in ((".1", "3"), (".2", "2")):
+            with open(self.path + suffix) as filehandle:
+                self.assertEqual(filehandle.read(), contents)
+
+
+# TestRingHandler {{{1
+class TestRingHandler(unittest.TestCase):
+    """Test scriptharness.log.RingHandler
+    """
+    def setUp(self):
+        assert self  # silence pylint
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "post_mortem", "log.txt")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_ring(self):
+        """test_log | RingHandler keeps the last records per logger
+        """
+        logger = logging.getLogger("test_ring")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        child = logging.getLogger("test_ring.child")
+        handler = log.get_ring_handler(
+            self.path, logger=logger, capacity=2,
+            formatter=logging.Formatter('%(name)s %(message)s')
+        )
+        try:
+            self.assertEqual(logger.level, logging.DEBUG)
+            self.assertTrue(handler in log.RING_HANDLERS)
+            for num in range(4):
+                logger.debug("debug %d", num)
+            child.info("child")
+            self.assertFalse(os.path.exists(self.path))
+            log.dump_ring_handlers("oops")
+            self.assertEqual(handler.rings, {})
+            self.assertEqual(handler.dump(), 0)
+            logger.error("again")
+            handler.dump()
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+        self.assertFalse(handler in log.RING_HANDLERS)
+        with open(self.path) as filehandle:
+            self.assertEqual(filehandle.read().splitlines(), [
+                "==== Post-mortem: oops (last 3 records) ====",
+                "test_ring debug 2", "test_ring debug 3",
+                "test_ring.child child",
+                "==== Post-mortem: dump (last 1 records) ====",
+                "test_ring again",
+            ])
+
+    def test_ring_prepared(self):
+        """test_log | RingHandler keeps records as they were at log time
+        """
+        logger = logging.getLogger("test_ring_prepared")
+        logger.propagate = False
+        handler = log.get_ring_handler(
+            self.path, logger=logger,
+            formatter=logging.Formatter('%(message)s')
+        )
+        try:
+            args = ['before']
+            logger.info("args %s", args)
+            args[0] = 'after'
+            try:
+                raise ValueError("oops")
+            except ValueError:
+                logger.exception("failed")
+            record = handler.rings["test_ring_prepared"][-1]
+            self.assertTrue(record.exc_info is None)
+            self.assertTrue("ValueError: oops" in record.exc_text)
+            handler.dump()
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+        with open(self.path) as filehandle:
+            contents = filehandle.read()
+        self.assertTrue("args ['before']\n" in contents)
+        self.assertTrue("ValueError: oops" in contents)
+
+
 # TestGetConsoleHandler {{{1
 class TestGetConsoleHandler(unittest.TestCase):
     """test_log | scriptharness.log.get_console_handler() method
@@ -471,6 +1125,119 @@ class TestLogMethodClass(unittest.TestCase):
         )
 
 
+# TestLogMethodReentrant {{{1
+class TestLogMethodReentrant(unittest.TestCase):
+    """scriptharness.log.LogMethod per-call state and level checks
+    """
+    def setUp(self):
+        assert self  # silence pylint
+        self.logger = logging.getLogger("scriptharness.test_reentrant")
+        self.logger.propagate = False
+        self.handler = ListHandler()
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.logger.setLevel(logging.NOTSET)
+
+    def test_recursion(self):
+        """test_log | @LogMethod recursive calls keep their own state
+        """
+        log_method = log.LogMethod(
+            logger_name="scriptharness.test_reentrant",
+            pre_msg="%(args)s", post_success_msg="%(return_value)s",
+        )
+        def test_func(num):
+            """test function"""
+            if num:
+                test_func(num - 1)
+            return num
+        test_func = log_method(test_func)
+        self.logger.setLevel(logging.INFO)
+        self.assertEqual(test_func(2), 2)
+        self.assertEqual(self.handler.messages,
+                         ["(2,)", "(1,)", "(0,)", "0", "1", "2"])
+        self.assertTrue(log_method.current_call is None)
+        self.assertEqual(log_method.repl_dict, {})
+
+    def test_threads(self):
+        """test_log | @LogMethod threaded calls keep their own state
+        """
+        event = threading.Event()
+        results = {}
+        @log.LogMethod(logger_name="scriptharness.test_reentrant",
+                       detect_error_cb=lambda x: x.return_value != x.args[0])
+        def test_func(num):
+            """test function"""
+            if num == 1:
+                event.wait()
+            else:
+                event.set()
+            return num
+        self.logger.setLevel(logging.INFO)
+        def run(num):
+            """thread target"""
+            results[num] = test_func(num)
+        threads = [threading.Thread(target=run, args=(x, )) for x in (1, 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, {1: 1, 2: 2})
+        self.assertEqual(
+            sorted(self.handler.messages),
+            sorted(["test_func arguments were: (1,) {}",
+                    "test_func arguments were: (2,) {}",
+                    "test_func completed.", "test_func completed."])
+        )
+
+    def test_disabled(self):
+        """test_log | @LogMethod skips messages for disabled levels
+        """
+        @log.LogMethod(logger_name="scriptharness.test_reentrant",
+                       detect_error_cb=lambda x: x.return_value)
+        def test_func(fail):
+            """test function"""
+            return fail
+        self.logger.setLevel(logging.WARNING)
+        with mock.patch.object(log.LogMethod, 'set_repl_dict') as repl_mock:
+            test_func(False)
+            self.assertEqual(repl_mock.call_count, 0)
+        self.assertEqual(self.handler.messages, [])
+        test_func(True)
+        self.assertEqual(self.handler.messages, ["test_func failed."])
+
+    @mock.patch('scriptharness.log.logging')
+    def test_cached_logger(self, mock_logging):
+        """test_log | @LogMethod looks up its logger once
+        """
+        mock_logging.getLogger.return_value = LoggerReplacement()
+        @log.LogMethod()
+        def test_func():
+            """test function"""
+        test_func()
+        test_func()
+        mock_logging.getLogger.assert_called_once_with(
+            "scriptharness.test_func"
+        )
+
+    @mock.patch('scriptharness.log.logging')
+    def test_per_call_logger(self, mock_logging):
+        """test_log | @LogMethod logger_name using call args
+        """
+        mock_logging.getLogger.return_value = LoggerReplacement()
+        @log.LogMethod(logger_name="scriptharness.{args[0]}")
+        def test_func(name):
+            """test function"""
+            return name
+        test_func("one")
+        test_func("two")
+        self.assertEqual(
+            [x[0][0] for x in mock_logging.getLogger.call_args_list],
+            ["scriptharness.one", "scriptharness.two"]
+        )
+
+
 # TestUnicode {{{1
 class TestUnicode(unittest.TestCase):
     """Test stdout + file logging, for real, to verify unicode
@@ -602,6 +1369,29 @@ class TestOutputBuffer(unittest.TestCase):
         self.assertEqual(logger.all_messages[4], (10, "y", ()))
         self.assertEqual(logger.all_messages[5], (0, "z", ()))
 
+    def test_large_pre_context_lines(self):
+        """test_log | OutputBuffer large pre_context_lines
+        """
+        logger = LoggerReplacement()
+        buf = log.OutputBuffer(logger, 500, 0)
+        for num in range(0, 1000):
+            buf.add_line(0, "line %d" % num)
+        self.assertEqual(len(buf.buffer), 500)
+        self.assertEqual(len(logger.all_messages), 500)
+        buf.add_line(10, "error", pre_context_lines=250)
+        buf.dump_buffer()
+        levels = [message[0] for message in logger.all_messages]
+        self.assertEqual(levels, [0] * 750 + [10] * 251)
+        self.assertEqual(logger.all_messages[-1], (10, "error", ()))
+
+    def test_buffered_line(self):
+        """test_log | BufferedLine is a compact record
+        """
+        buf = log.BufferedLine(10, "foo", ("a", ), timestamp=5)
+        self.assertEqual((buf.level, buf.line, buf.args, buf.time, buf.extra),
+                         (10, "foo", ("a", ), 5, None))
+        self.assertRaises(AttributeError, setattr, buf, 'unknown', 1)
+
 
 # TestOutputParser {{{1
 class TestOutputParser(unittest.TestCase):
@@ -735,3 +1525,303 @@ class TestOutputParser(unittest.TestCase):
             (logging.WARNING, " WARNING asdf", ())
         )
         self.assertEqual(len(output_parser.logger.all_messages), 2)
+
+    def test_block(self):
+        """test_log | OutputParser block error_check
+        """
+        error_list = ErrorList([
+            {'start': re.compile('^start'), 'end': re.compile('^end'),
+             'level': logging.DEBUG, 'explanation': 'block'},
+            {'substr': 'asdf', 'level': logging.ERROR},
+        ])
+        output_parser = self.get_output_parser(error_list)
+        output_parser.add_line("foo")
+        output_parser.add_line("start")
+        output_parser.add_line("bar")
+        output_parser.add_line("asdf")
+        output_parser.add_line("baz")
+        self.assertEqual(len(output_parser.logger.all_messages), 1)
+        output_parser.add_line("end")
+        output_parser.add_line("after")
+        self.assertEqual(
+            output_parser.logger.all_messages, [
+                (logging.INFO, ' foo', ()),
+                (logging.ERROR, ' start', ()),
+                (logging.ERROR, ' bar', ()),
+                (logging.ERROR, ' asdf', ()),
+                (logging.ERROR, ' baz', ()),
+                (logging.ERROR, ' end', ()),
+                (logging.ERROR, ' block', ()),
+                (logging.INFO, ' after', ()),
+            ]
+        )
+        self.assertEqual(output_parser.history['num_errors'], 1)
+
+    def test_block_one_line(self):
+        """test_log | OutputParser block that starts and ends on one line
+        """
+        error_list = ErrorList([
+            {'start': re.compile('BEGIN'), 'end': re.compile('END'),
+             'level': logging.WARNING},
+        ])
+        output_parser = self.get_output_parser(error_list)
+        output_parser.add_line("BEGIN ... END")
+        output_parser.add_line("after")
+        self.assertEqual(
+            output_parser.logger.all_messages, [
+                (logging.WARNING, ' BEGIN ... END', ()),
+                (logging.INFO, ' after', ()),
+            ]
+        )
+        self.assertTrue(output_parser.span_buffer is None)
+
+    def test_block_finish(self):
+        """test_log | OutputParser finish() with an unclosed block
+        """
+        error_list = ErrorList([
+            {'start': re.compile('^start'), 'end': re.compile('^end'),
+             'level': logging.WARNING},
+        ])
+        output_parser = self.get_output_parser(error_list)
+        output_parser.add_line("start")
+        output_parser.add_line("foo")
+        self.assertEqual(len(output_parser.logger.all_messages), 0)
+        output_parser.finish()
+        self.assertEqual(
+            output_parser.logger.all_messages, [
+                (logging.WARNING, ' start', ()),
+                (logging.WARNING, ' foo', ()),
+            ]
+        )
+        self.assertEqual(output_parser.history['num_warnings'], 1)
+
+    def test_multiline(self):
+        """test_log | OutputParser multi-line error_check
+        """
+        error_list = ErrorList([
+            {'first': re.compile(r'^Traceback \(most recent call last\)'),
+             'next': re.compile(r'^\s'),
+             'last': re.compile(r'^\w+(Error|Exception)'),
+             'level': logging.ERROR, 'explanation': 'traceback'},
+            {'first': re.compile(r':\d+: warning:'), 'next': re.compile(r'^ '),
+             'level': logging.WARNING},
+        ])
+        output_parser = self.get_output_parser(error_list, index=True)
+        for line in ("foo", "Traceback (most recent call last):",
+                     '  File "x.py", line 1, in <module>', "ValueError: x",
+                     " indented", "foo.c:3: warning: bad", "  note: here",
+                     "  note: there", "after"):
+            output_parser.add_line(line)
+        self.assertEqual(
+            output_parser.logger.all_messages, [
+                (logging.INFO, ' foo', ()),
+                (logging.ERROR, ' Traceback (most recent call last):', ()),
+                (logging.ERROR, '   File "x.py", line 1, in <module>', ()),
+                (logging.ERROR, ' ValueError: x', ()),
+                (logging.ERROR, ' traceback', ()),
+                (logging.INFO, '  indented', ()),
+                (logging.WARNING, ' foo.c:3: warning: bad', ()),
+                (logging.WARNING, '   note: here', ()),
+                (logging.WARNING, '   note: there', ()),
+                (logging.INFO, ' after', ()),
+            ]
+        )
+        self.assertEqual(output_parser.history['num_errors'], 1)
+        self.assertEqual(output_parser.history['num_warnings'], 1)
+        self.assertEqual(
+            [(x['line_number'], x['end_line_number'])
+             for x in output_parser.error_index],
+            [(2, 4), (6, 8)]
+        )
+
+    def test_multiline_finish(self):
+        """test_log | OutputParser finish() with an open multi-line event
+        """
+        error_list = ErrorList([
+            {'first': re.compile('^error'), 'next': re.compile('^ '),
+             'level': logging.ERROR},
+        ])
+        output_parser = self.get_output_parser(error_list)
+        output_parser.add_line("error: foo")
+        output_parser.add_line(" note: bar")
+        self.assertEqual(len(output_parser.logger.all_messages), 0)
+        output_parser.finish()
+        self.assertEqual(
+            output_parser.logger.all_messages, [
+                (logging.ERROR, ' error: foo', ()),
+                (logging.ERROR, '  note: bar', ()),
+            ]
+        )
+        self.assertEqual(output_parser.history['num_errors'], 1)
+
+    def test_finish_context_buffer(self):
+        """test_log | OutputParser finish() dumps the context buffer
+        """
+        error_list = ErrorList([
+            {'substr': 'asdf', 'level': logging.ERROR,
+             'pre_context_lines': 5},
+        ])
+        output_parser = self.get_output_parser(error_list)
+        output_parser.add_line("foo")
+        self.assertEqual(len(output_parser.logger.all_messages), 0)
+        output_parser.finish()
+        self.assertEqual(
+            output_parser.logger.all_messages, [(logging.INFO, ' foo', ())]
+        )
+
+    def test_profile(self):
+        """test_log | OutputParser profile
+        """
+        error_list = ErrorList([
+            {'substr': 'asdf', 'level': logging.ERROR},
+            {'regex': re.compile('foo'), 'level': logging.WARNING},
+        ])
+        output_parser = self.get_output_parser(error_list, profile=True)
+        for line in ("asdf", "foo", "bar"):
+            output_parser.add_line(line)
+        self.assertEqual(
+            [(x['evaluations'], x['hits']) for x in output_parser.profile],
+            [(3, 1), (2, 1)]
+        )
+        self.assertEqual(output_parser.profile[1]['check'], 'regex foo')
+        output_parser.log_profile()
+        self.assertEqual(len(output_parser.logger.all_messages), 6)
+
+    def test_no_profile(self):
+        """test_log | OutputParser without profile
+        """
+        error_list = ErrorList([{'substr': 'asdf', 'level': logging.ERROR}])
+        output_parser = self.get_output_parser(error_list)
+        output_parser.add_line("asdf")
+        self.assertTrue(output_parser.profile is None)
+        output_parser.log_profile()
+        output_parser.write_profile(TEST_FILE)
+        self.assertEqual(len(output_parser.logger.all_messages), 1)
+        self.assertFalse(os.path.exists(TEST_FILE))
+
+
+    def test_error_index(self):
+        """test_log | OutputParser error index
+        """
+        error_list = ErrorList([
+            {'substr': 'asdf', 'level': logging.ERROR,
+             'explanation': 'because'},
+            {'regex': re.compile('foo'), 'level': logging.WARNING},
+            {'substr': 'debug', 'level': logging.DEBUG},
+        ])
+        output_parser = self.get_output_parser(error_list, index=True)
+        for line in (b"bar\n", UNICODE_STRINGS[1] + "\n", b"asdf\n",
+                     b"debug\n", b"foo\n"):
+            output_parser.add_line(line)
+        self.assertEqual(output_parser.error_index, [{
+            'line_number': 3, 'offset': 14, 'level': logging.ERROR,
+            'check': 'substr asdf', 'explanation': 'because',
+        }, {
+            'line_number': 5, 'offset': 25, 'level': logging.WARNING,
+            'check': 'regex foo', 'explanation': None,
+        }])
+        try:
+            output_parser.write_error_index(TEST_FILE)
+            with open(TEST_FILE) as filehandle:
+                lines = filehandle.readlines()
+        finally:
+            os.remove(TEST_FILE)
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[1])['offset'], 25)
+
+    def test_redactor(self):
+        """test_log | OutputParser redactor
+        """
+        error_list = ErrorList([
+            {'substr': 'token', 'level': logging.WARNING},
+        ])
+        output_parser = self.get_output_parser(
+            error_list, redactor=Redactor(secrets=['s3cr3t'])
+        )
+        output_parser.add_line("token s3cr3t\n")
+        self.assertEqual(output_parser.logger.all_messages,
+                         [(logging.WARNING, ' token ********', ())])
+
+    def test_aggregate(self):
+        """test_log | OutputParser warning aggregation
+        """
+        error_list = ErrorList([
+            {'substr': 'deprecated', 'level': logging.WARNING},
+            {'substr': 'error', 'level': logging.ERROR},
+        ])
+        output_parser = self.get_output_parser(error_list, aggregate=1)
+        for num in range(5):
+            output_parser.add_line("src/foo%d.c:%d: deprecated bar" %
+                                   (num, num * 10))
+        for _ in range(3):
+            output_parser.add_line("baz is deprecated")
+        output_parser.add_line("qux is deprecated")
+        output_parser.add_line("error 1")
+        output_parser.add_line("error 1")
+        self.assertEqual(output_parser.history['num_warnings'], 9)
+        self.assertEqual(output_parser.history['num_errors'], 2)
+        output_parser.finish()
+        self.assertEqual(
+            output_parser.logger.all_messages, [
+                (logging.WARNING, ' src/foo0.c:0: deprecated bar', ()),
+                (logging.WARNING, ' baz is deprecated', ()),
+                (logging.WARNING, ' qux is deprecated', ()),
+                (logging.ERROR, ' error 1', ()),
+                (logging.ERROR, ' error 1', ()),
+                (logging.WARNING, 'Repeated warnings (top %d of %d):',
+                 (1, 2)),
+                (logging.WARNING, log.AGGREGATE_FMT % {
+                    'count': 'count', 'line': 'first occurrence'}, ()),
+                (logging.WARNING, log.AGGREGATE_FMT % {
+                    'count': 5, 'line': 'src/foo0.c:0: deprecated bar'}, ()),
+            ]
+        )
+
+    def test_no_aggregate(self):
+        """test_log | OutputParser without warning aggregation
+        """
+        error_list = ErrorList([
+            {'substr': 'deprecated', 'level': logging.WARNING},
+        ])
+        output_parser = self.get_output_parser(error_list, aggregate=10)
+        output_parser.add_line("foo is deprecated")
+        output_parser.add_line("bar is deprecated")
+        output_parser.finish()
+        self.assertEqual(len(output_parser.logger.all_messages), 2)
+        output_parser = self.get_output_parser(error_list)
+        for _ in range(3):
+            output_parser.add_line("foo is deprecated")
+        output_parser.finish()
+        self.assertEqual(len(output_parser.logger.all_messages), 3)
+        self.assertEqual(
+            log.normalize_line("/usr/include/foo.h:12: warning"),
+            "<path>:<n>: warning"
+        )
+
+
+# TestSpanBuffer {{{1
+class TestSpanBuffer(unittest.TestCase):
+    """Test SpanBuffer.
+    """
+    def test_spill(self):
+        """test_log | SpanBuffer spills to disk
+        """
+        buf = log.SpanBuffer(max_bytes=10)
+        buf.add_line(logging.INFO, "12345")
+        self.assertTrue(buf.spill_file is None)
+        buf.add_line(logging.ERROR, UNICODE_STRINGS[1] * 5)
+        self.assertTrue(buf.spill_file is not None)
+        self.assertEqual(buf.lines, [])
+        buf.add_line(logging.DEBUG, "x")
+        self.assertEqual(
+            list(buf), [
+                (logging.INFO, "12345"),
+                (logging.ERROR, UNICODE_STRINGS[1] * 5),
+                (logging.DEBUG, "x"),
+            ]
+        )
+        self.assertEqual(buf.worst_level, logging.ERROR)
+        self.assertEqual(buf.num_lines, 3)
+        buf.close()
+        self.assertTrue(buf.spill_file is None)
+
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test scriptharness.log_index and scriptharness.log.IndexedFileHandler
+"""
+from __future__ import absolute_import, division, print_function, \
+                       unicode_literals
+import json
+import logging
+import mock
+import os
+from scriptharness.exceptions import ScriptHarnessException
+import scriptharness.log as log
+import scriptharness.log_index as log_index
+import shutil
+import six
+import tempfile
+import unittest
+from . import UNICODE_STRINGS
+
+
+# TestLogIndex {{{1
+class TestLogIndex(unittest.TestCase):
+    """Test IndexedFileHandler and the log_index reader
+    """
+    def setUp(self):
+        assert self  # silence pylint
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "log.txt")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_log(self, **kwargs):
+        """Log a few actions and commands through an IndexedFileHandler.
+        """
+        logger = logging.getLogger("test_log_index")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        handler = log.get_file_handler(
+            self.path, logger=logger, indexed=True,
+            formatter=logging.Formatter('%(message)s'), **kwargs
+        )
+        try:
+            logger.info("start")
+            with log.log_context(action_name="clobber"):
+                logger.info("clobbering")
+            with log.log_context(action_name="build"):
+                logger.info("building")
+                with log.log_context(command_id=1):
+                    logger.info("make 1\n%s", UNICODE_STRINGS[0])
+                logger.info("between")
+                with log.log_context(command_id=2):
+                    logger.info("make 2")
+            logger.info("done")
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+
+    def test_index(self):
+        """test_log_index | IndexedFileHandler segments
+        """
+        for buffered in (False, True):
+            self.write_log(buffered=buffered)
+            segments = log_index.read_segment_index(self.path)
+            self.assertEqual(
+                [(x['type'], x['name'], x['action'], x['start_line'],
+                  x['end_line']) for x in segments],
+                [('action', 'clobber', 'clobber', 2, 2),
+                 ('command', 1, 'build', 4, 5),
+                 ('command', 2, 'build', 7, 7),
+                 ('action', 'build', 'build', 3, 7)]
+            )
+
+    def test_slices(self):
+        """test_log_index | read_slice seeks to a single segment
+        """
+        self.write_log()
+        segments = log_index.read_segment_index(self.path)
+        self.assertEqual(
+            log_index.read_slice(
+                self.path, log_index.find_segments(segments, action="build")[0]
+            ),
+            "building\nmake 1\n%s\nbetween\nmake 2\n" % UNICODE_STRINGS[0]
+        )
+        self.assertEqual(
+            log_index.read_slice(
+                self.path, log_index.find_segments(segments, command_id=1)[0]
+            ),
+            "make 1\n%s\n" % UNICODE_STRINGS[0]
+        )
+
+    def test_find_errors(self):
+        """test_log_index | find_segments and read_segment_index errors
+        """
+        self.assertRaises(ScriptHarnessException,
+                          log_index.read_segment_index, self.path)
+        self.write_log()
+        segments = log_index.read_segment_index(self.path)
+        for kwargs in ({}, {'action': 'build', 'command_id': 1},
+                       {'action': 'upload'}, {'command_id': 3}):
+            self.assertRaises(ScriptHarnessException,
+                              log_index.find_segments, segments, **kwargs)
+
+    def test_rotating(self):
+        """test_log_index | indexed rotating logs are unsupported
+        """
+        self.assertRaises(ScriptHarnessException, log.get_file_handler,
+                          self.path, indexed=True, per_action=True)
+
+    def test_main(self):
+        """test_log_index | main() --list and --action
+        """
+        self.write_log()
+        with mock.patch('sys.stdout', new=six.StringIO()) as stdout:
+            log_index.main([self.path, '--list'])
+        self.assertEqual(len([json.loads(x) for x in
+                              stdout.getvalue().splitlines()]), 4)
+        with mock.patch('sys.stdout', new=six.StringIO()) as stdout:
+            log_index.main([self.path, '--action', 'clobber'])
+        self.assertEqual(stdout.getvalue(), "clobbering\n")
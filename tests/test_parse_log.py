@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test scriptharness.parse_log
+
+Attributes:
+  TEST_LOG (str): the filename to use for test log files
+  TEST_ERROR_LIST_FILE (str): the filename to use for test error lists
+  TEST_INDEX (str): the filename to use for test error indices
+  TEST_LINES (List[str]): the lines to write to TEST_LOG
+"""
+from __future__ import absolute_import, division, print_function, \
+                       unicode_literals
+import codecs
+import json
+import logging
+import os
+import re
+from scriptharness.errorlists import ErrorList, MAKE_ERROR_LIST, \
+    save_error_list
+from scriptharness.exceptions import ScriptHarnessException
+from scriptharness.log import OutputParser
+import scriptharness.parse_log as parse_log
+import unittest
+from . import UNICODE_STRINGS, LoggerReplacement, stdstar_redirected
+
+TEST_LOG = '_test_parse_log'
+TEST_ERROR_LIST_FILE = '_test_parse_log_error_list.json'
+TEST_INDEX = '_test_parse_log_index'
+TEST_LINES = [
+    'make -C foo',
+    UNICODE_STRINGS[2],
+    'foo.c:3: error: bad things',
+    'BEGIN block',
+    'Warning: something',
+    'END block',
+    'make[1]: *** [all] Error 2',
+    'done',
+]
+TEST_ERROR_LIST = ErrorList([
+    {'start': re.compile('^BEGIN'), 'end': re.compile('^END'),
+     'level': logging.INFO},
+    {'substr': 'make -C', 'level': logging.DEBUG},
+] + MAKE_ERROR_LIST[:3] + [
+    {'regex': re.compile(r':\d+: error:'), 'level': logging.ERROR,
+     'pre_context_lines': 2, 'post_context_lines': 1},
+] + MAKE_ERROR_LIST[4:])
+
+
+def cleanup():
+    """Cleanliness"""
+    for path in (TEST_LOG, TEST_ERROR_LIST_FILE, TEST_INDEX):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def write_log(lines=None):
+    """Write the test log"""
+    if lines is None:
+        lines = TEST_LINES
+    with codecs.open(TEST_LOG, 'w', encoding='utf-8') as filehandle:
+        for line in lines:
+            filehandle.write(line + '\n')
+
+
+# TestParseLog {{{1
+class TestParseLog(unittest.TestCase):
+    """Test parse_log()
+    """
+    def setUp(self):
+        assert self  # silence pylint
+        cleanup()
+
+    def tearDown(self):
+        assert self  # silence pylint
+        cleanup()
+
+    def test_matches_output_parser(self):
+        """test_parse_log | parse_log matches OutputParser, across chunks
+        """
+        write_log()
+        output_parser = OutputParser(TEST_ERROR_LIST,
+                                     logger=LoggerReplacement(), index=True)
+        for line in TEST_LINES:
+            output_parser.add_line(line + '\n')
+        output_parser.finish()
+        for chunk_size in (1, 10, 1024):
+            log_parser = parse_log.parse_log(TEST_LOG, TEST_ERROR_LIST,
+                                             jobs=1, chunk_size=chunk_size)
+            for key, value in output_parser.history.items():
+                self.assertEqual(log_parser.history[key], value)
+            self.assertEqual(log_parser.history['num_lines'], 8)
+            self.assertEqual(log_parser.error_index,
+                             output_parser.error_index)
+
+    def test_index_order(self):
+        """test_parse_log | parse_log error index is in line order
+        """
+        write_log()
+        log_parser = parse_log.parse_log(TEST_LOG, TEST_ERROR_LIST,
+                                         jobs=2, chunk_size=5)
+        index = log_parser.error_index
+        self.assertEqual([x['line_number'] for x in index], [3, 5, 7])
+        self.assertEqual([x['offset'] for x in index],
+                         sorted(x['offset'] for x in index))
+
+    def test_multiline(self):
+        """test_parse_log | parse_log multi-line error_checks match
+        OutputParser, across chunks
+        """
+        error_list = ErrorList([
+            {'start': re.compile('^BEGIN'), 'end': re.compile('^END'),
+             'level': logging.INFO},
+            {'first': re.compile('^Traceback'), 'next': re.compile(r'^\s'),
+             'last': re.compile(r'^\w+Error'), 'level': logging.ERROR},
+            {'first': re.compile(': warning:'), 'next': re.compile('^ '),
+             'level': logging.WARNING},
+        ])
+        lines = [
+            'Traceback (most recent call last):', '  File "x.py"',
+            'ValueError: x', ' not part of it', 'a.c:1: warning: foo',
+            ' note: bar', ' note: baz', 'BEGIN', 'b.c:2: warning: foo',
+            'END', 'after', 'c.c:3: warning: foo', ' note: at the end',
+        ]
+        write_log(lines)
+        output_parser = OutputParser(error_list, logger=LoggerReplacement(),
+                                     index=True)
+        for line in lines:
+            output_parser.add_line(line + '\n')
+        output_parser.finish()
+        for chunk_size in (1, 10, 1024):
+            log_parser = parse_log.parse_log(TEST_LOG, error_list,
+                                             jobs=1, chunk_size=chunk_size)
+            for key, value in output_parser.history.items():
+                self.assertEqual(log_parser.history[key], value)
+            records = log_parser.error_index
+            self.assertEqual(records, output_parser.error_index)
+            self.assertEqual(
+                [(x['line_number'], x['end_line_number']) for x in records],
+                [(1, 3), (5, 7), (9, 9), (12, 13)]
+            )
+
+    def test_unclosed_block(self):
+        """test_parse_log | parse_log unclosed block
+        """
+        write_log(TEST_LINES[:5])
+        output_parser = OutputParser(TEST_ERROR_LIST,
+                                     logger=LoggerReplacement(), index=True)
+        for line in TEST_LINES[:5]:
+            output_parser.add_line(line + '\n')
+        output_parser.finish()
+        log_parser = parse_log.parse_log(TEST_LOG, TEST_ERROR_LIST, jobs=1)
+        for key, value in output_parser.history.items():
+            self.assertEqual(log_parser.history[key], value)
+        self.assertEqual(log_parser.error_index, output_parser.error_index)
+
+    def test_one_line_block(self):
+        """test_parse_log | parse_log block that starts and ends on one line
+        """
+        error_list = ErrorList([
+            {'start': re.compile('BEGIN'), 'end': re.compile('END'),
+             'level': logging.WARNING},
+            {'substr': 'Warning:', 'level': logging.WARNING},
+        ])
+        lines = ['BEGIN ... END', 'Warning: after', 'END']
+        write_log(lines)
+        output_parser = OutputParser(error_list, logger=LoggerReplacement(),
+                                     index=True)
+        for line in lines:
+            output_parser.add_line(line + '\n')
+        output_parser.finish()
+        log_parser = parse_log.parse_log(TEST_LOG, error_list, jobs=1)
+        self.assertEqual(output_parser.history['num_warnings'], 2)
+        for key, value in output_parser.history.items():
+            self.assertEqual(log_parser.history[key], value)
+        self.assertEqual(log_parser.error_index, output_parser.error_index)
+
+    def test_carriage_returns(self):
+        """test_parse_log | parse_log only splits lines on newlines
+        """
+        lines = ['download 10%\r50%\r100%', 'x\x0by\x0cz\x1c\x1d\x1e',
+                 'foo.c:3: error: bad things', 'done']
+        write_log(lines)
+        output_parser = OutputParser(TEST_ERROR_LIST,
+                                     logger=LoggerReplacement(), index=True)
+        for line in lines:
+            output_parser.add_line(line + '\n')
+        output_parser.finish()
+        log_parser = parse_log.parse_log(TEST_LOG, TEST_ERROR_LIST, jobs=1)
+        self.assertEqual(log_parser.history['num_lines'], 4)
+        self.assertEqual(log_parser.error_index[0]['line_number'], 3)
+        self.assertEqual(log_parser.error_index[0]['line_number'],
+                         output_parser.error_index[0]['line_number'])
+        self.assertEqual(parse_log.split_lines(b'a\rb\nc'), [b'a\rb\n', b'c'])
+
+    def test_empty(self):
+        """test_parse_log | parse_log empty file
+        """
+        write_log([])
+        log_parser = parse_log.parse_log(TEST_LOG, TEST_ERROR_LIST)
+        self.assertEqual(log_parser.history['num_lines'], 0)
+        self.assertEqual(log_parser.error_index, [])
+
+
+# TestGetErrorList {{{1
+class TestGetErrorList(unittest.TestCase):
+    """Test get_error_list()
+    """
+    def tearDown(self):
+        assert self  # silence pylint
+        cleanup()
+
+    def test_named(self):
+        """test_parse_log | get_error_list by name
+        """
+        self.assertEqual(parse_log.get_error_list("MAKE_ERROR_LIST"),
+                         MAKE_ERROR_LIST)
+
+    def test_file(self):
+        """test_parse_log | get_error_list from a json description
+        """
+        save_error_list(ErrorList([{'substr': 'foo', 'level': 40}]),
+                        TEST_ERROR_LIST_FILE)
+        error_list = parse_log.get_error_list(TEST_ERROR_LIST_FILE)
+        self.assertEqual(error_list[0]['substr'], 'foo')
+
+    def test_bad(self):
+        """test_parse_log | get_error_list errors
+        """
+        write_log()
+        for name in ("NONEXISTENT_ERROR_LIST", "%s:FOO" % TEST_LOG,
+                     TEST_LOG, "LOGGER_NAME"):
+            self.assertRaises(ScriptHarnessException,
+                              parse_log.get_error_list, name)
+
+
+# TestMain {{{1
+class TestMain(unittest.TestCase):
+    """Test main()
+    """
+    def setUp(self):
+        assert self  # silence pylint
+        cleanup()
+
+    def tearDown(self):
+        assert self  # silence pylint
+        cleanup()
+
+    def test_index(self):
+        """test_parse_log | main() with --index
+        """
+        write_log()
+        console = '_test_parse_log_console'
+        try:
+            with stdstar_redirected(console):
+                parse_log.main([TEST_LOG, '--error-list', 'MAKE_ERROR_LIST',
+                                '--index', TEST_INDEX, '--jobs', '1'])
+        finally:
+            if os.path.exists(console):
+                os.remove(console)
+        with open(TEST_INDEX) as filehandle:
+            records = [json.loads(line) for line in filehandle]
+        self.assertEqual([x['line_number'] for x in records], [3, 5, 7])
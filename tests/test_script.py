@@ -6,15 +6,20 @@ from __future__ import absolute_import, division, print_function, \
                        unicode_literals
 import argparse
 import json
+import mock
 import os
 import scriptharness.actions as actions
 from scriptharness.config import get_config_template, update_dirs, \
     DEFAULT_CONFIG_DEFINITION
 from scriptharness.exceptions import ScriptHarnessException, ScriptHarnessFatal
+import scriptharness.log as log
+from scriptharness.redact import get_default_redactor, \
+    set_default_redactor, TOKEN_PATTERNS
 import scriptharness.script as script
 import shutil
 import six
 import unittest
+from . import LoggerReplacement
 
 if six.PY3:
     BUILTIN = 'builtins'
@@ -114,6 +119,7 @@ class TestScript(unittest.TestCase):
         """Clean up artifacts"""
         if os.path.exists("artifacts"):
             shutil.rmtree("artifacts")
+        set_default_redactor(None)
 
     def get_timing_func(self, name):
         """helper function for listeners and actions"""
@@ -166,6 +172,20 @@ class TestScript(unittest.TestCase):
         scr.run()
         self.assertEqual(self.timings, ["one", "two", "four"])
 
+    def test_log_context(self):
+        """test_script | run() sets the script and action log context
+        """
+        contexts = []
+        scr = self.get_script()
+        scr.actions = [actions.Action(
+            "one", function=lambda _: contexts.append(dict(log.LOG_CONTEXT)),
+            enabled=True
+        )]
+        scr.run()
+        self.assertEqual(contexts, [{'script_name': scr.name,
+                                     'action_name': 'one'}])
+        self.assertEqual(log.LOG_CONTEXT, {})
+
     def test_enable_actions(self):
         """test_script | Enable/disable actions from the command line
         """
@@ -269,6 +289,31 @@ class TestScript(unittest.TestCase):
         self.assertEqual(self.timings, ["one", "fatal", "post_fatal1",
                                         "post_fatal3"])
 
+    def test_post_fatal_dump(self):
+        """test_script | ScriptHarnessFatal dumps the RingHandlers
+        """
+        scr = self.get_script()
+        scr.actions = list(scr.actions)
+        scr.actions[1] = actions.Action(
+            "two", function=self.raise_fatal, enabled=True)
+        with mock.patch('scriptharness.script.dump_ring_handlers') as dump:
+            self.assertRaises(ScriptHarnessFatal, scr.run)
+        dump.assert_called_once_with("Fatal error in action two")
+
+    def test_log_filters(self):
+        """test_script | scriptharness_log_filters adds RateLimitFilters
+        """
+        filters = {'scriptharness.commands': {'sample': 10}}
+        with mock.patch('scriptharness.script.add_log_filters') as add:
+            self.get_script(
+                initial_config={'scriptharness_log_filters': filters}
+            )
+        add.assert_called_once_with(filters)
+        self.assertRaises(
+            ScriptHarnessException, self.get_script,
+            initial_config={'scriptharness_log_filters': {'x': {'rate': 0}}}
+        )
+
     def test_bad_phase_context(self):
         """test_script | bad phase build_context
         """
@@ -292,6 +337,17 @@ class TestScript(unittest.TestCase):
         self.assertRaises(ScriptHarnessException, script.Script,
                           action_list, template, cmdln_args=cmdln_args)
 
+    def test_save_config_backups(self):
+        """test_script | save_config rotates the previous config
+        """
+        path = os.path.join("artifacts", "localconfig.json")
+        for num in range(3):
+            script.save_config({'num': num}, path, backups=1)
+        for suffix, num in (("", 2), (".1", 1)):
+            with open(path + suffix) as filehandle:
+                self.assertEqual(json.load(filehandle), {'num': num})
+        self.assertFalse(os.path.exists(path + ".2"))
+
     def test_dump_config(self):
         """test_script | --dump-config
         """
@@ -310,6 +366,55 @@ class TestScript(unittest.TestCase):
             contents, json.dumps(initial_config, sort_keys=True, indent=4)
         )
 
+    def test_secret_config(self):
+        """test_script | config variables marked secret get a redactor
+        """
+        scr = self.get_script()
+        self.assertTrue(scr.redactor is None)
+        template = get_config_template(
+            all_actions=[self.get_action("one")],
+            definition=dict(DEFAULT_CONFIG_DEFINITION, password={
+                'help': 'help', 'secret': True, 'options': ['--password'],
+            }),
+        )
+        scr = self.get_script(template=template,
+                              cmdln_args=['--password', 'hunter22'])
+        self.assertEqual(scr.redactor.secrets, set(['hunter22']))
+        self.assertTrue(scr.config.redactor is scr.redactor)
+        self.assertTrue(get_default_redactor() is scr.redactor)
+
+    def test_redact_tokens(self):
+        """test_script | scriptharness_redact_tokens masks TOKEN_PATTERNS
+        """
+        scr = self.get_script(
+            initial_config={'scriptharness_redact_tokens': True}
+        )
+        self.assertEqual(scr.redactor.patterns, list(TOKEN_PATTERNS))
+        self.assertEqual(scr.redactor.redact("Bearer abc"), "********")
+
+    def test_save_config_redacted(self):
+        """test_script | save_config redacts secrets that pformat would
+        escape or wrap
+        """
+        template = get_config_template(
+            all_actions=[self.get_action("one")],
+            definition=dict(DEFAULT_CONFIG_DEFINITION, password={
+                'help': 'help', 'secret': True, 'options': ['--password'],
+            }),
+        )
+        for secret in ("hunter'22\\", " ".join(["correct horse"] * 10)):
+            scr = self.get_script(template=template,
+                                  cmdln_args=['--password', secret])
+            scr.config['nested'] = {'passwords': [secret, "x%sx" % secret]}
+            logger = LoggerReplacement(simple=True)
+            with mock.patch.object(scr, 'get_logger', return_value=logger):
+                scr.save_config()
+            contents = "\n".join(logger.all_messages)
+            self.assertTrue("'password': '********'" in contents)
+            self.assertTrue("'x********x'" in contents)
+            for word in ("hunter", "horse"):
+                self.assertFalse(word in contents)
+
 # TestStrictScript {{{1
 def change_config1(context):
     """This should raise"""
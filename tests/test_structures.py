@@ -20,6 +20,7 @@ from copy import deepcopy
 import mock
 import pprint
 from scriptharness.exceptions import ScriptHarnessException
+from scriptharness.redact import Redactor
 import scriptharness.structures as structures
 import unittest
 from . import UNICODE_STRINGS, LOGGER_NAME, LoggerReplacement
@@ -290,6 +291,26 @@ class TestFullNames(unittest.TestCase):
             self.assertEqual(logdict[name].full_name(),
                              "%s[%s]" % (NAME, expected))
 
+    @mock.patch('scriptharness.structures.logging')
+    def test_cached_names(self, mock_logging):
+        """test_structures | full_name() is cached until re-parenting
+        """
+        assert mock_logging  # silence pylint
+        logdict = get_logging_dict()
+        child = logdict['e'][2]
+        self.assertEqual(child.full_name(), "%s['e'][2]" % NAME)
+        with mock.patch.object(structures, 'get_child_name') as child_name:
+            child.full_name()
+            self.assertFalse(child_name.called)
+        logdict.recursively_set_parent(name="renamed")
+        self.assertEqual(child.full_name(), "renamed['e'][2]")
+        self.assertEqual(child['turtles'].full_name(),
+                         "renamed['e'][2]['turtles']")
+        logdict['e'].insert(0, 'new')
+        self.assertEqual(child.full_name(), "renamed['e'][3]")
+        self.assertEqual(child['turtles'].full_name(),
+                         "renamed['e'][3]['turtles']")
+
 # TestLoggingDeepcopy {{{2
 class TestLoggingDeepcopy(unittest.TestCase):
     """Test deepcopy of the various Logging* classes
@@ -478,6 +499,140 @@ class TestLoggingDict(TestLoggingClass):
             self.assertTrue(isinstance(logdict['a'], structures.LoggingClass))
             self.assertEqual(logdict.muted, logdict['a'].muted)
 
+    @mock.patch('scriptharness.structures.logging')
+    def test_redactor(self, mock_logging):
+        """test_structures | logging dict redactor
+        """
+        self.get_logger_replacement(mock_logging)
+        logdict = structures.LoggingDict(
+            deepcopy(LOGGING_CONTROL_DICT), redactor=Redactor(['hunter22'])
+        )
+        logdict.recursively_set_parent()
+        logdict['a'] = 'hunter22'
+        logdict['c']['d'] = 'xhunter22x'
+        logdict.redactor.add_secret("it's hunter22")
+        logdict['b'] = {'nested': ["it's hunter22"]}
+        self.verify_log([
+            self.strings['setitem'] % {'key': 'a', 'value': '********'},
+            "['c']: " + self.strings['setitem'] % {'key': 'd',
+                                                  'value': 'x********x'},
+            self.strings['setitem'] % {'key': 'b',
+                                       'value': {'nested': ['********']}},
+        ])
+
+
+    @mock.patch('scriptharness.structures.logging')
+    def test_children_replaced(self, mock_logging):
+        """test_structures | logging dict replaces the children of items
+        with Logging* classes, so changes through items are logged
+        """
+        self.get_logger_replacement(mock_logging)
+        raw = deepcopy(LOGGING_CONTROL_DICT)
+        logdict = structures.LoggingDict(raw)
+        logdict.recursively_set_parent()
+        self.assertTrue(raw['c'] is logdict['c'])
+        raw['c']['d'] = 1
+        dict(logdict)['c']['d'] = 2
+        self.assertEqual(logdict['c']['d'], 2)
+        self.verify_log([
+            "['c']: " + self.strings['setitem'] % {'key': 'd', 'value': 1},
+            "['c']: " + self.strings['setitem'] % {'key': 'd', 'value': 2},
+        ])
+
+    @mock.patch('scriptharness.structures.logging')
+    def test_batch(self, mock_logging):
+        """test_structures | logging dict batch logs one coalesced diff
+        """
+        self.get_logger_replacement(mock_logging)
+        logdict = get_logging_dict(name=None)
+        with logdict.batch("defaults") as config:
+            config.update({'a': 1, 'b': 'three', 'f': []})
+            config['f'].append(1)
+            config['d']['turtles'].append('turtle4')
+            with config['c'].batch("inner"):
+                config['c']['d'] = '4'
+            del config['e']
+        self.assertEqual(logdict['f'], [1])
+        self.assertEqual(logdict['d']['turtles'][-1], 'turtle4')
+        self.assertEqual(logdict['f'].full_name(), "['f']")
+        self.verify_log([
+            self.strings['batch']['message'] % {'reason': 'defaults',
+                                                'count': 4},
+            self.strings['batch']['changed'] % {'key': "['b']",
+                                                'value': 'three'},
+            self.strings['batch']['changed'] % {
+                'key': "['d']['turtles']", 'value': logdict['d']['turtles']
+            },
+            self.strings['batch']['removed'] % {'key': "['e']"},
+            self.strings['batch']['added'] % {'key': "['f']", 'value': [1]},
+        ])
+
+    @mock.patch('scriptharness.structures.logging')
+    def test_batch_exception(self, mock_logging):
+        """test_structures | logging dict batch rollback on exception
+        """
+        for rollback in (False, True):
+            self.get_logger_replacement(mock_logging)
+            logdict = get_logging_dict(name=None, muted=True)
+            turtles = logdict['d']['turtles']
+            try:
+                with logdict.batch("broken", rollback=rollback):
+                    logdict['a'] = 2
+                    turtles.pop()
+                    raise ScriptHarnessException("oops")
+            except ScriptHarnessException:
+                pass
+            if rollback:
+                self.assertEqual(logdict, LOGGING_CONTROL_DICT)
+                self.assertTrue(structures.is_logging_class(
+                    logdict['d']['turtles']
+                ))
+                self.verify_log([
+                    self.muted_strings['batch']['rollback'] % {
+                        'reason': 'broken', 'count': 2
+                    },
+                ])
+            else:
+                self.assertEqual(logdict['a'], 2)
+                self.verify_log([
+                    self.muted_strings['batch']['message'] % {
+                        'reason': 'broken', 'count': 2
+                    },
+                    self.muted_strings['batch']['changed'] % {
+                        'key': "['a']"
+                    },
+                    self.muted_strings['batch']['changed'] % {
+                        'key': "['d']['turtles']"
+                    },
+                ])
+            logdict['a'] = 3
+            self.assertEqual(self.logger.all_messages[-1],
+                             self.muted_strings['setitem'] % {'key': 'a'})
+
+    @mock.patch('scriptharness.structures.logging')
+    def test_batch_nested_rollback(self, mock_logging):
+        """test_structures | logging dict batch rolls back nested paths
+        """
+        self.get_logger_replacement(mock_logging)
+        logdict = get_logging_dict(name=None)
+        try:
+            with logdict.batch("nested", rollback=True):
+                logdict['e'][2]['turtles'].append('turtle7')
+                logdict['c']['d'] = '5'
+                logdict['c'] = {'new': 1}
+                logdict['c']['new'] = 2
+                logdict['g'] = 'added'
+                raise ScriptHarnessException("oops")
+        except ScriptHarnessException:
+            pass
+        self.assertEqual(structures.LoggingBatch.open_batches, 0)
+        self.assertEqual(logdict, LOGGING_CONTROL_DICT)
+        self.assertEqual(logdict['c'].full_name(), "['c']")
+        self.verify_log([
+            self.strings['batch']['rollback'] % {'reason': 'nested',
+                                                 'count': 3},
+        ])
+
 
 # TestLoggingList {{{2
 class TestLoggingList(TestLoggingClass):
@@ -710,6 +865,55 @@ class TestLoggingList(TestLoggingClass):
                             self.add_log_self(loglist, strings))
             self.assertEqual(loglist[0], "finally")
 
+    @mock.patch('scriptharness.structures.logging')
+    def test_incremental(self, mock_logging):
+        """test_structures | logging list incremental deltas and snapshots
+        """
+        loglist = structures.LoggingList([], snapshot_interval=3)
+        loglist.recursively_set_parent()
+        self.get_logger_replacement(mock_logging)
+        with mock.patch('pprint.pformat', wraps=pprint.pformat) as pformat:
+            for num in range(4):
+                loglist.append(num)
+            self.assertEqual(pformat.call_count, 1)
+        delta = self.strings['log_delta']
+        self.verify_log([
+            self.strings['append'] % {'item': 0},
+            delta % {'position': 0, 'length': 1},
+            self.strings['append'] % {'item': 1},
+            delta % {'position': 1, 'length': 2},
+            self.strings['append'] % {'item': 2},
+            delta % {'position': 2, 'length': 3},
+            self.strings['log_self'] % {'self': pprint.pformat([0, 1, 2])},
+            self.strings['append'] % {'item': 3},
+            delta % {'position': 3, 'length': 4},
+        ])
+        self.get_logger_replacement(mock_logging)
+        loglist.pop()
+        loglist.log_self()
+        self.verify_log([
+            self.strings['pop_no_args'],
+            delta % {'position': 3, 'length': 3},
+            self.strings['log_self'] % {'self': pprint.pformat([0, 1, 2])},
+        ])
+
+    @mock.patch('scriptharness.structures.logging')
+    def test_inherited_interval(self, mock_logging):
+        """test_structures | logging list snapshot_interval from an ancestor
+        """
+        logdict = structures.LoggingDict({'a': {'b': [1]}},
+                                         snapshot_interval=0)
+        logdict.recursively_set_parent()
+        self.get_logger_replacement(mock_logging)
+        for num in range(5):
+            logdict['a']['b'].insert(0, num)
+        self.assertEqual(len(self.logger.all_messages), 10)
+        self.assertEqual(
+            self.logger.all_messages[-1],
+            "['a']['b']: " + self.strings['log_delta'] % {'position': 0,
+                                                         'length': 6}
+        )
+
 # Test add_logging_to_obj() {{{2
 class TestAddLogging(unittest.TestCase):
     """Test the portions of add_logging_to_class() that we're not testing